@@ -10,8 +10,15 @@ import redis
 from .config import Config, TestConfig
 from flask_caching import Cache
 from .encoder import CustomJSONEncoder
+from .utils.content import ApiRequest
+from .utils.compression import Compress
+from .utils.instrumentation import Instrumentation, cache_redis_clients
+from .utils.profiling import RequestProfiler
+from .utils.slow_queries import SlowQueryLog
+from .utils.tracing import TraceRecorder
 from mongoengine import disconnect
-from .swagger_config import swagger_config, swagger_template
+from flask_mongoengine.connection import create_connections
+from .swagger_config import swagger_config, swagger_template, load_openapi_spec
 
 # Initialize extensions
 mongo = MongoEngine()
@@ -21,6 +28,11 @@ limiter = Limiter(key_func=get_remote_address, default_limits=None)
 swagger = Swagger(template=swagger_template)
 redis_client = None
 cache = Cache()
+compress = Compress()
+instrumentation = Instrumentation()
+profiler = RequestProfiler()
+slow_query_log = SlowQueryLog()
+trace_recorder = TraceRecorder()
 
 def create_app(config_class=Config):
     """
@@ -34,6 +46,9 @@ def create_app(config_class=Config):
     # The RESTFUL_JSON config should ideally handle Flask-RESTful, but this is a belt-and-suspenders approach.
     app.json_encoder = CustomJSONEncoder 
 
+    # Lets request.get_json() decode MessagePack bodies as well
+    app.request_class = ApiRequest
+
     # Ensure no previous default connection exists before initializing
     try:
         disconnect(alias='default')
@@ -41,28 +56,61 @@ def create_app(config_class=Config):
         pass # Safely ignore if no connection was present
 
     # Initialize extensions
+    # Instrumentation first: pymongo only attaches command listeners registered
+    # before the client is created, and its after_request must see the final
+    # (compressed) response
+    instrumentation.init_app(app)
+    # Early too, so traces record the final response size
+    trace_recorder.init_app(app)
     mongo.init_app(app)
     jwt.init_app(app)
+    # After instrumentation, so profiles and the slow query log see the request's Mongo commands
+    profiler.init_app(app)
+    slow_query_log.init_app(app)
     bcrypt.init_app(app)
     CORS(app, origins=app.config.get('CORS_ORIGINS', ['*']))
     limiter.init_app(app)
     app.config['SWAGGER'] = swagger_config
     swagger.init_app(app)
+    # Serve the precompiled spec instead of parsing every swag_from YAML file
+    load_openapi_spec(swagger, app.config.get('OPENAPI_SPEC_PATH'))
     cache.init_app(app)
+    compress.init_app(app)
 
     # Initialize Redis if configured
     global redis_client
+    max_connections = app.config.get('REDIS_MAX_CONNECTIONS')
     if app.config.get('REDIS_URL'):
-        redis_client = redis.from_url(app.config['REDIS_URL'])
+        redis_client = redis.from_url(app.config['REDIS_URL'], max_connections=max_connections)
     else:
-        redis_client = redis.Redis(host='localhost', port=6379, db=0)
+        redis_client = redis.Redis(host='localhost', port=6379, db=0, max_connections=max_connections)
+    instrumentation.instrument_redis(redis_client, *cache_redis_clients(app.extensions['cache'][cache]))
 
     # Register blueprints
-    from .blueprints import auth_bp, users_bp, surveys_bp, responses_bp, analytics_bp
+    from .blueprints import auth_bp, users_bp, surveys_bp, responses_bp, analytics_bp, admin_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(users_bp, url_prefix='/users')
     app.register_blueprint(surveys_bp, url_prefix='/surveys')
     app.register_blueprint(responses_bp, url_prefix='/surveys')
     app.register_blueprint(analytics_bp, url_prefix='/surveys')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+
+    from .cli import register_commands
+    register_commands(app)
 
     return app
+
+def reconnect(app):
+    """
+    Replace the MongoDB and Redis connections inherited from a forking parent.
+
+    Used by the gunicorn profile (gunicorn.conf.py) in ``post_fork`` when the
+    app is preloaded in the master: pymongo clients are not fork-safe, and
+    Redis pools must not share sockets with the master.
+    """
+    disconnect(alias='default')
+    app.extensions['mongoengine'][mongo]['conn'] = create_connections(app.config)
+
+    for client in [redis_client, *cache_redis_clients(app.extensions['cache'][cache])]:
+        if client is not None:
+            client.connection_pool.reset()
@@ -5,3 +5,4 @@ from .users import users_bp
 from .surveys import surveys_bp
 from .responses import responses_bp
 from .analytics import analytics_bp
+from .admin import admin_bp
@@ -0,0 +1,296 @@
+from flask import Blueprint, Response as FlaskResponse, request
+from flask_restful import Api, Resource
+from flask_jwt_extended import jwt_required, get_jwt
+from flasgger import swag_from
+from app.utils.content import add_msgpack_representation
+from app.utils.profiling import list_profiles, load_profile_meta, load_profile_artifact
+from app.utils.slow_queries import list_slow_queries, clear_slow_queries
+from app.models import Job
+from app.schemas import JobSchema
+
+admin_bp = Blueprint('admin', __name__)
+admin_api = add_msgpack_representation(Api(admin_bp))
+
+# Helper: Admin role required
+def admin_required(fn):
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        claims = get_jwt()
+        if claims.get('role') != 'admin':
+            return {'message': 'Admins only.'}, 403
+        return fn(*args, **kwargs)
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+def limit_arg(default=50):
+    """The ``limit`` query argument as a positive int; raises ``ValueError`` otherwise."""
+    value = request.args.get('limit', default)
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError(f"limit must be a positive integer, got {value!r}.")
+    return limit
+
+class ProfileListResource(Resource):
+    method_decorators = [admin_required]
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'List recent request profiles',
+        'description': 'Returns the metadata of stored request profiles, newest first. Profile a request by sending it as an admin with the `X-Profile` header or `_profile` query parameter set to `cprofile` or `sample`. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'parameters': [
+            {'name': 'limit', 'in': 'query', 'required': False, 'schema': {'type': 'integer', 'default': 50}}
+        ],
+        'responses': {
+            '200': {
+                'description': 'Profile metadata.',
+                'content': {
+                    'application/json': {
+                        'example': [{
+                            'id': '3f0c1b1f6d0b4d4c9d9c2f0b6e8a1c2d',
+                            'mode': 'cprofile',
+                            'method': 'GET',
+                            'path': '/surveys/64b7c2f1e4b0f2a1b2c3d4e6/analytics?_profile=cprofile',
+                            'endpoint': '/surveys/<string:survey_id>/analytics',
+                            'status': 200,
+                            'duration_ms': 812.4,
+                            'created_at': '2024-07-01T12:00:00',
+                            'filename': 'profile_3f0c1b1f6d0b4d4c9d9c2f0b6e8a1c2d.prof',
+                            'mongo': {'commands': 3, 'duration_ms': 640.2, 'details': [
+                                {'command': 'find', 'collection': 'responses', 'duration_ms': 631.9, 'outcome': 'success'}
+                            ]},
+                            'redis': {'commands': 2, 'duration_ms': 0.4}
+                        }]
+                    }
+                }
+            },
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            }
+        }
+    })
+    def get(self):
+        limit = int(request.args.get('limit', 50))
+        return list_profiles(limit), 200
+
+class ProfileResource(Resource):
+    method_decorators = [admin_required]
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Get a request profile',
+        'description': 'Returns the metadata of a stored request profile, including its MongoDB commands and timings. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'parameters': [
+            {'name': 'profile_id', 'in': 'path', 'required': True, 'schema': {'type': 'string'}, 'description': 'Profile ID'}
+        ],
+        'responses': {
+            '200': {'description': 'Profile metadata.'},
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            },
+            '404': {
+                'description': 'Profile not found or expired.',
+                'content': {'application/json': {'example': {'message': 'Profile not found.'}}}
+            }
+        }
+    })
+    def get(self, profile_id):
+        meta = load_profile_meta(profile_id)
+        if not meta:
+            return {'message': 'Profile not found.'}, 404
+        return meta, 200
+
+class ProfileDownloadResource(Resource):
+    method_decorators = [admin_required]
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Download a request profile',
+        'description': 'Downloads the profile artifact: a pstats `.prof` file for `cprofile` profiles or a speedscope JSON file for `sample` profiles. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'parameters': [
+            {'name': 'profile_id', 'in': 'path', 'required': True, 'schema': {'type': 'string'}, 'description': 'Profile ID'}
+        ],
+        'responses': {
+            '200': {
+                'description': 'Profile artifact.',
+                'content': {
+                    'application/octet-stream': {'schema': {'type': 'string', 'format': 'binary'}},
+                    'application/json': {'schema': {'type': 'object'}}
+                }
+            },
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            },
+            '404': {
+                'description': 'Profile not found or expired.',
+                'content': {'application/json': {'example': {'message': 'Profile not found.'}}}
+            }
+        }
+    })
+    def get(self, profile_id):
+        meta = load_profile_meta(profile_id)
+        artifact = load_profile_artifact(profile_id)
+        if not meta or artifact is None:
+            return {'message': 'Profile not found.'}, 404
+        mimetype = 'application/json' if meta['mode'] == 'sample' else 'application/octet-stream'
+        return FlaskResponse(
+            artifact,
+            mimetype=mimetype,
+            headers={'Content-Disposition': f"attachment;filename={meta['filename']}"}
+        )
+
+class SlowQueryListResource(Resource):
+    method_decorators = [admin_required]
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'List slow MongoDB operations',
+        'description': 'Returns the most recent MongoDB commands slower than `SLOW_QUERY_MS`, newest first, with the endpoint that issued them and a summary of their explain plan. `COLLSCAN` and `IN_MEMORY_SORT` flags mark plans missing a suitable index. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'parameters': [
+            {'name': 'limit', 'in': 'query', 'required': False, 'schema': {'type': 'integer', 'default': 50}},
+            {'name': 'flagged', 'in': 'query', 'required': False, 'schema': {'type': 'boolean', 'default': False},
+             'description': 'Only return operations with a flagged plan'}
+        ],
+        'responses': {
+            '200': {
+                'description': 'Slow operations.',
+                'content': {
+                    'application/json': {
+                        'example': [{
+                            'timestamp': '2024-07-01T12:00:00',
+                            'endpoint': '/surveys/<string:survey_id>/responses',
+                            'method': 'GET',
+                            'path': '/surveys/64b7c2f1e4b0f2a1b2c3d4e6/responses',
+                            'command': 'find',
+                            'database': 'survey_db',
+                            'collection': 'response',
+                            'duration_ms': 412.7,
+                            'shape': {'find': 'str', 'filter': {'survey': 'ObjectId'}, 'sort': {'submitted_at': 1}},
+                            'shape_hash': '5d41402abc4b2a76b9719d911017c592aa5b1f6e',
+                            'plan': {'stages': ['SORT', 'COLLSCAN'], 'indexes': [], 'flags': ['COLLSCAN', 'IN_MEMORY_SORT']}
+                        }]
+                    }
+                }
+            },
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            }
+        }
+    })
+    def get(self):
+        limit = int(request.args.get('limit', 50))
+        flagged = request.args.get('flagged', 'false').lower() in ('1', 'true', 'yes')
+        return list_slow_queries(limit, flagged_only=flagged), 200
+
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Clear the slow operation log',
+        'description': 'Deletes the recorded slow operations and cached explain plans. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'responses': {
+            '204': {'description': 'Slow operation log cleared.'},
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            }
+        }
+    })
+    def delete(self):
+        clear_slow_queries()
+        return '', 204
+
+JOB_EXAMPLE = {
+    'id': '64b7c2f1e4b0f2a1b2c3d4f0',
+    'kind': 'purge_survey',
+    'target': '64b7c2f1e4b0f2a1b2c3d4e6',
+    'status': 'running',
+    'progress': {'responses_deleted': 42000},
+    'error': None,
+    'created_by': '64b7c2f1e4b0f2a1b2c3d4e5',
+    'created_at': '2024-07-01T12:00:00',
+    'started_at': '2024-07-01T12:00:00',
+    'updated_at': '2024-07-01T12:00:41',
+    'finished_at': None
+}
+
+class JobListResource(Resource):
+    method_decorators = [admin_required]
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'List background jobs',
+        'description': 'Returns the most recent background jobs (survey and user purges), newest first. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'parameters': [
+            {'name': 'status', 'in': 'query', 'required': False,
+             'schema': {'type': 'string', 'enum': ['pending', 'running', 'done', 'failed']}},
+            {'name': 'limit', 'in': 'query', 'required': False, 'schema': {'type': 'integer', 'minimum': 1, 'default': 50}}
+        ],
+        'responses': {
+            '200': {
+                'description': 'Jobs.',
+                'content': {'application/json': {'example': [JOB_EXAMPLE]}}
+            },
+            '400': {
+                'description': 'limit is not a positive integer.',
+                'content': {'application/json': {'example': {'message': "limit must be a positive integer, got 'abc'."}}}
+            },
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            }
+        }
+    })
+    def get(self):
+        jobs = Job.objects()
+        if request.args.get('status'):
+            jobs = jobs.filter(status=request.args['status'])
+        try:
+            limit = limit_arg()
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        jobs = jobs.limit(limit)
+        return JobSchema(many=True).dump(jobs), 200
+
+class JobResource(Resource):
+    method_decorators = [admin_required]
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Get a background job',
+        'description': 'Returns the status and progress counters of a background job. Admin only.',
+        'security': [{'BearerAuth': []}],
+        'parameters': [
+            {'name': 'job_id', 'in': 'path', 'required': True, 'schema': {'type': 'string'}, 'description': 'Job ID'}
+        ],
+        'responses': {
+            '200': {
+                'description': 'Job status.',
+                'content': {'application/json': {'example': JOB_EXAMPLE}}
+            },
+            '403': {
+                'description': 'Admins only.',
+                'content': {'application/json': {'example': {'message': 'Admins only.'}}}
+            },
+            '404': {
+                'description': 'Job not found.',
+                'content': {'application/json': {'example': {'message': 'Job not found.'}}}
+            }
+        }
+    })
+    def get(self, job_id):
+        job = Job.objects(id=job_id).first()
+        if not job:
+            return {'message': 'Job not found.'}, 404
+        return JobSchema().dump(job), 200
+
+admin_api.add_resource(ProfileListResource, '/profiles')
+admin_api.add_resource(ProfileResource, '/profiles/<string:profile_id>')
+admin_api.add_resource(ProfileDownloadResource, '/profiles/<string:profile_id>/download')
+admin_api.add_resource(SlowQueryListResource, '/slow-queries')
+admin_api.add_resource(JobListResource, '/jobs')
+admin_api.add_resource(JobResource, '/jobs/<string:job_id>')
@@ -3,64 +3,78 @@ from flask_restful import Api, Resource
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from app.models import Survey, Response as SurveyResponse
 from app.schemas import ResponseSchema
-import pandas as pd
 import io
-from datetime import datetime, timedelta
-from collections import defaultdict
+from urllib.parse import urlencode
 from functools import wraps
-import openpyxl
 from app import cache
 from flasgger import swag_from
+from app.utils.content import add_msgpack_representation, preferred_mimetype, packb, MSGPACK_MIMETYPE
+from app.utils.compression import compress_for_cache, make_cached_response
+from app.utils import aggregates, timeseries
+from app.utils.archive import iter_archived, merge_archived
+from app.utils.columnar import survey_state as columnar_state
+from app.utils.cooccurrence import co_occurrence
+from app.utils.crosstab import crosstab, parse_questions
+from app.utils.filters import response_filter
+from app.utils.funnel import funnel
+from app.utils.rollups import window_state
+from app.utils.snapshots import survey_state
 import os
 
 SWAGGER_YAML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docs')
 
 analytics_bp = Blueprint('analytics', __name__)
-analytics_api = Api(analytics_bp)
+analytics_api = add_msgpack_representation(Api(analytics_bp))
 
 # Cache decorator
 def cache_response(timeout=300):  # 5 minutes default
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            cache_key = f"{request.path}:{request.args}"
+            # JSON and MessagePack clients get separately cached payloads
+            mimetype = preferred_mimetype()
+            # Sorted, so the same filters in another order share the entry
+            cache_key = f"{request.path}:{urlencode(sorted(request.args.items(multi=True)))}:{mimetype}"
             
             # Use the imported cache object
             cached_data_tuple = cache.get(cache_key)
             if cached_data_tuple:
-                # Data is stored as (data_json_string, status_code)
-                response_data_str, status_code = cached_data_tuple
-                response = FlaskResponse(response_data_str, status=status_code, mimetype='application/json')
+                # Data is stored as (payload, content_encoding, status_code), already compressed if large
+                response_data, encoding, status_code = cached_data_tuple
+                response = make_cached_response(response_data, encoding, status_code, mimetype)
                 response.headers['X-Cache'] = 'HIT'
                 return response
             
-            # Get fresh response (which should be jsonify-able dict or a FlaskResponse)
+            # Get fresh response (which should be a serializable dict or a FlaskResponse)
             func_response = f(*args, **kwargs)
 
-            # Ensure what we cache is a JSON string and status code
+            # Ensure what we cache is a serialized payload and status code
             if isinstance(func_response, FlaskResponse):
                 # If it's already a FlaskResponse, assume it's correctly formatted
-                # We need to be careful if it's not application/json
-                if func_response.mimetype == 'application/json':
-                    data_to_cache = func_response.get_data(as_text=True)
+                # We need to be careful if it's not the negotiated mimetype
+                if func_response.mimetype == mimetype:
+                    data_to_cache = func_response.get_data()
                     status_to_cache = func_response.status_code
-                    response_to_return = func_response # Return the original FlaskResponse
                 else:
-                    # Non-JSON FlaskResponse, don't cache as is, or handle differently
+                    # Other FlaskResponse, don't cache as is, or handle differently
                     # For now, just return it without caching to avoid issues.
                     return func_response 
-            elif isinstance(func_response, tuple) and len(func_response) == 2:
-                # Expected (dict_data, status_code)
-                dict_data, status_to_cache = func_response
-                data_to_cache = jsonify(dict_data).get_data(as_text=True) # Convert dict to JSON string
-                response_to_return = FlaskResponse(data_to_cache, status=status_to_cache, mimetype='application/json')
-            else: # Assuming it's a dict that needs to be jsonify-ed with status 200
-                dict_data = func_response
-                status_to_cache = 200
-                data_to_cache = jsonify(dict_data).get_data(as_text=True)
-                response_to_return = FlaskResponse(data_to_cache, status=status_to_cache, mimetype='application/json')
-
-            cache.set(cache_key, (data_to_cache, status_to_cache), timeout=timeout)
+            else:
+                if isinstance(func_response, tuple) and len(func_response) == 2:
+                    # Expected (dict_data, status_code)
+                    dict_data, status_to_cache = func_response
+                else: # Assuming it's a dict that needs to be serialized with status 200
+                    dict_data = func_response
+                    status_to_cache = 200
+                if mimetype == MSGPACK_MIMETYPE:
+                    data_to_cache = packb(dict_data)
+                else:
+                    data_to_cache = jsonify(dict_data).get_data(as_text=True) # Convert dict to JSON string
+
+            # Compress once here so neither cache hits nor the compression middleware redo it
+            payload, encoding = compress_for_cache(data_to_cache, mimetype)
+            cache.set(cache_key, (payload, encoding, status_to_cache), timeout=timeout)
+            response_to_return = make_cached_response(payload, encoding, status_to_cache, mimetype)
             response_to_return.headers['X-Cache'] = 'MISS'
             return response_to_return
         return decorated_function
@@ -82,6 +96,24 @@ def admin_or_owner_required(fn):
     wrapper.__name__ = fn.__name__
     return wrapper
 
+def include_archived():
+    return request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+def export_row(response_id, respondent, submitted_at, answers, question_ids):
+    row_dict = {
+        'response_id': str(response_id),
+        'respondent': str(respondent) if respondent else None,
+        'submitted_at': submitted_at.isoformat()
+    }
+    answers_map = dict(answers)
+    for qid in question_ids:
+        value = answers_map.get(qid)
+        if value is not None:
+            row_dict[qid] = ';'.join(map(str, value)) if isinstance(value, list) else str(value)
+        else:
+            row_dict[qid] = ''
+    return row_dict
+
 class SurveyAnalyticsResource(Resource):
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'analytics_get.yml'))
     @admin_or_owner_required
@@ -91,99 +123,99 @@ class SurveyAnalyticsResource(Resource):
         if not survey:
             return {'message': 'Survey not found.'}, 404
         
-        responses = SurveyResponse.objects(survey=survey_id)
-        analytics_data = {}
-        
-        if request.args.get('time_series'):
-            interval = request.args.get('interval', 'daily')
-            time_data = []
-            responses_by_date = defaultdict(int)
-            
-            for r_obj in responses.order_by('submitted_at'):
-                if interval == 'daily':
-                    date_key = r_obj.submitted_at.date()
-                elif interval == 'weekly':
-                    date_key = r_obj.submitted_at.date() - timedelta(days=r_obj.submitted_at.weekday())
-                else:
-                    date_key = r_obj.submitted_at.replace(day=1).date()
-                responses_by_date[date_key] += 1
-            
-            cumulative = 0
-            for date_val in sorted(responses_by_date.keys()):
-                count = responses_by_date[date_val]
-                cumulative += count
-                time_data.append({
-                    'date': date_val.isoformat(),
-                    'count': count,
-                    'cumulative': cumulative
-                })
-            analytics_data['time_series'] = time_data
-        
-        for question in survey.questions:
-            qid = question.question_id
-            qtype = question.type
-            qanswers = [a for resp_obj in responses for a in resp_obj.answers if a.question_id == qid]
-            
-            if qtype in ('multiple_choice', 'checkbox'):
-                counts = defaultdict(int)
-                for ans in qanswers:
-                    val = ans.value
-                    if isinstance(val, list):
-                        for v_item in val:
-                            counts[v_item] += 1
-                    else:
-                        counts[val] += 1
-                
-                num_responses_for_question = len(qanswers)
-
-                percentages = {k: (v / num_responses_for_question * 100) if num_responses_for_question > 0 else 0 for k, v in counts.items()}
-                if qtype == 'checkbox':
-                    percentages = {k: (v / num_responses_for_question * 100) if num_responses_for_question > 0 else 0 for k, v in counts.items()}
-                else:
-                    total_selections = sum(counts.values())
-                    percentages = {k: (v / total_selections * 100) if total_selections > 0 else 0 for k, v in counts.items()}
-
-                analytics_data[qid] = {
-                    'type': qtype,
-                    'counts': dict(counts),
-                    'percentages': percentages,
-                    'total_responses': num_responses_for_question
-                }
-                
-            elif qtype == 'rating':
-                ratings = [ans.value for ans in qanswers if isinstance(ans.value, (int, float))]
-                if ratings:
-                    avg = sum(ratings) / len(ratings)
-                    sorted_ratings = sorted(ratings)
-                    mid = len(sorted_ratings) // 2
-                    if len(sorted_ratings) % 2 == 0:
-                        median = (sorted_ratings[mid - 1] + sorted_ratings[mid]) / 2.0
-                    else:
-                        median = sorted_ratings[mid]
-                    distribution = defaultdict(int)
-                    for r_val in ratings:
-                        distribution[str(int(r_val))] += 1
-                    analytics_data[qid] = {
-                        'type': qtype,
-                        'average': avg,
-                        'median': median,
-                        'distribution': dict(distribution),
-                        'total_responses': len(ratings)
-                    }
-                else:
-                    analytics_data[qid] = {'type': qtype, 'total_responses': 0, 'average': 0, 'median': 0, 'distribution': {}}
-                    
-            elif qtype == 'text':
-                text_vals = [str(ans.value) for ans in qanswers if ans.value is not None]
-                analytics_data[qid] = {
-                    'type': qtype,
-                    'response_count': len(text_vals),
-                    'average_length': sum(len(r_text) for r_text in text_vals) / len(text_vals) if text_vals else 0,
-                    'samples': text_vals[:5]
-                }
-        
+        interval = request.args.get('interval', 'daily')
+        if interval not in timeseries.INTERVALS:
+            return {'message': f"interval must be one of: {', '.join(timeseries.INTERVALS)}."}, 400
+        try:
+            zone = timeseries.parse_timezone(request.args.get('tz', 'UTC'))
+            start, end = timeseries.parse_window(request.args, zone)
+            segment = response_filter(survey, request.args)
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        windowed = start is not None or end is not None
+        if segment and include_archived():
+            return {'message': 'Archived responses can\'t be filtered by respondent or answer.'}, 400
+        with_co_occurrence = request.args.get('co_occurrence', '').lower() in ('1', 'true', 'yes')
+        # A batch's summary spans all the days of its responses, so it can't be cut at a window's bounds
+        if windowed and include_archived():
+            return {'message': 'Archived responses can\'t be limited to a from/to window.'}, 400
+        # Archives keep daily UTC counts only, which can't be regrouped into hours or another zone's days
+        grouped_by_mongo = zone != timeseries.UTC or interval == 'hourly'
+        if request.args.get('time_series') and grouped_by_mongo and include_archived():
+            return {'message': 'Archived responses only have daily UTC time series.'}, 400
+        if with_co_occurrence and include_archived():
+            return {'message': 'Archived responses keep only choice counts, so they have no co-occurrence.'}, 400
+
+        # A segment is read through its indexed $match; a window sums the daily rollups inside
+        # it and reads raw responses for partial days
+        if segment:
+            state = columnar_state(survey, dict(segment, **timeseries.window_query(start, end)))
+        elif windowed:
+            state = window_state(survey, start, end)
+        else:
+            state = survey_state(survey)
+        if include_archived():
+            merge_archived(state, survey.id)
+
+        max_buckets = current_app.config['ANALYTICS_MAX_BUCKETS']
+        try:
+            if not request.args.get('time_series'):
+                analytics_data = aggregates.finalize(state, survey.questions)
+            # The daily counts in the state are UTC days; other buckets are grouped by Mongo
+            elif grouped_by_mongo:
+                series = timeseries.survey_series(survey.id, interval, zone, start, end, segment, max_buckets)
+                analytics_data = dict({'time_series': series}, **aggregates.finalize(state, survey.questions))
+            else:
+                analytics_data = aggregates.finalize(state, survey.questions, interval, *timeseries.span(start, end),
+                                                     max_buckets=max_buckets)
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        if with_co_occurrence:
+            checkboxes = [q for q in survey.questions if q.type == 'checkbox']
+            query = dict(segment, **timeseries.window_query(start, end))
+            for qid, summary in co_occurrence(survey, checkboxes, query).items():
+                analytics_data[qid]['co_occurrence'] = summary
         return analytics_data
 
+class SurveyCrosstabResource(Resource):
+    @swag_from(os.path.join(SWAGGER_YAML_DIR, 'analytics_crosstab.yml'))
+    @admin_or_owner_required
+    @cache_response(timeout=300)
+    def get(self, survey_id):
+        survey = Survey.objects(id=survey_id).first()
+        if not survey:
+            return {'message': 'Survey not found.'}, 404
+        if include_archived():
+            return {'message': 'Archived responses keep only summaries, so they can\'t be cross-tabulated.'}, 400
+        try:
+            rows = parse_questions(survey, request.args.get('rows'), 'rows')
+            cols = parse_questions(survey, request.args.get('cols'), 'cols')
+            zone = timeseries.parse_timezone(request.args.get('tz', 'UTC'))
+            start, end = timeseries.parse_window(request.args, zone)
+            query = dict(response_filter(survey, request.args), **timeseries.window_query(start, end))
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        with_chi_square = request.args.get('chi_square', '').lower() in ('1', 'true', 'yes')
+        return {'tables': crosstab(survey, rows, cols, query, with_chi_square)}
+
+class SurveyFunnelResource(Resource):
+    @swag_from(os.path.join(SWAGGER_YAML_DIR, 'analytics_funnel.yml'))
+    @admin_or_owner_required
+    @cache_response(timeout=300)
+    def get(self, survey_id):
+        survey = Survey.objects(id=survey_id).first()
+        if not survey:
+            return {'message': 'Survey not found.'}, 404
+        if include_archived():
+            return {'message': 'Archived responses keep only summaries, so they have no funnel.'}, 400
+        try:
+            zone = timeseries.parse_timezone(request.args.get('tz', 'UTC'))
+            start, end = timeseries.parse_window(request.args, zone)
+            query = dict(response_filter(survey, request.args), **timeseries.window_query(start, end))
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        return funnel(survey, query)
+
 class SurveyCSVExportResource(Resource):
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'analytics_export.yml'))
     @admin_or_owner_required
@@ -192,34 +224,29 @@ class SurveyCSVExportResource(Resource):
         if not survey:
             return {'message': 'Survey not found.'}, 404
 
-        responses_qs = SurveyResponse.objects(survey=survey)
-        if not responses_qs:
+        question_ids_ordered = [q.question_id for q in survey.questions]
+        rows = []
+        for r_obj in SurveyResponse.objects(survey=survey):
+            answers = [(ans.question_id, ans.value) for ans in r_obj.answers]
+            respondent = r_obj.respondent.id if r_obj.respondent else None
+            rows.append(export_row(r_obj.id, respondent, r_obj.submitted_at, answers, question_ids_ordered))
+        if include_archived():
+            for doc in iter_archived(survey.id):
+                answers = [(ans.get('question_id'), ans.get('value')) for ans in doc.get('answers') or ()]
+                rows.append(export_row(doc['_id'], doc.get('respondent'), doc['submitted_at'], answers,
+                                       question_ids_ordered))
+        if not rows:
             return {'message': 'No responses found for this survey.'}, 404
             
-        rows = []
-        question_ids_ordered = [q.question_id for q in survey.questions]
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format == 'json':
+            return rows, 200
 
-        for r_obj in responses_qs:
-            row_dict = {
-                'response_id': str(r_obj.id),
-                'respondent': str(r_obj.respondent.id) if r_obj.respondent else None,
-                'submitted_at': r_obj.submitted_at.isoformat()
-            }
-            answers_map = {ans.question_id: ans for ans in r_obj.answers}
-            for qid in question_ids_ordered:
-                answer = answers_map.get(qid)
-                if answer:
-                    row_dict[qid] = ';'.join(map(str, answer.value)) if isinstance(answer.value, list) else str(answer.value)
-                else:
-                    row_dict[qid] = ''
-            rows.append(row_dict)
-            
+        import pandas as pd  # heavy import, deferred until the first CSV/Excel export
         df = pd.DataFrame(rows)
         column_order = ['response_id', 'respondent', 'submitted_at'] + question_ids_ordered
         df = df[column_order]
         
-        export_format = request.args.get('format', 'csv').lower()
-        
         if export_format == 'excel':
             excel_buf = io.BytesIO()
             df.to_excel(excel_buf, index=False, engine='openpyxl')
@@ -229,8 +256,6 @@ class SurveyCSVExportResource(Resource):
                 mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                 headers={'Content-Disposition': f'attachment;filename=survey_{survey_id}_responses.xlsx'}
             )
-        elif export_format == 'json':
-            return rows, 200
         else:  # Default to CSV
             csv_buf = io.StringIO()
             df.to_csv(csv_buf, index=False)
@@ -242,4 +267,6 @@ class SurveyCSVExportResource(Resource):
             )
 
 analytics_api.add_resource(SurveyAnalyticsResource, '/<string:survey_id>/analytics')
+analytics_api.add_resource(SurveyCrosstabResource, '/<string:survey_id>/analytics/crosstab')
+analytics_api.add_resource(SurveyFunnelResource, '/<string:survey_id>/analytics/funnel')
 analytics_api.add_resource(SurveyCSVExportResource, '/<string:survey_id>/export') 
\ No newline at end of file
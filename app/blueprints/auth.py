@@ -12,10 +12,11 @@ from flask_jwt_extended import current_user
 from marshmallow import ValidationError
 import uuid
 from flasgger import swag_from
+from app.utils.content import add_msgpack_representation
 
 # Blueprint and API setup
 auth_bp = Blueprint('auth', __name__)
-auth_api = Api(auth_bp)
+auth_api = add_msgpack_representation(Api(auth_bp))
 
 # Redis blacklist key prefix
 JWT_REDIS_BLACKLIST_PREFIX = 'jwt_blacklist:'
@@ -103,7 +104,10 @@ class RegisterResource(Resource):
             password=hashed_pw,
             role=validated['role']
         )
-        user.save()
+        try:
+            user.save()
+        except NotUniqueError:  # e.g. a deleted user that has not been purged yet
+            return {'message': 'Username or email already exists.'}, 409
         return UserSchema().dump(user), 201
 
 # Login Resource
@@ -1,17 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 from flask_restful import Api, Resource
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from app.models import Response, Survey, User, Answer
-from app.schemas import ResponseSchema
+from app.schemas import ResponseSchema, dump_response
 from marshmallow import ValidationError
 from datetime import datetime
 from flasgger import swag_from
+from app.utils.content import add_msgpack_representation
+from app.utils.answers import normalize_value
 import os
 
 SWAGGER_YAML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docs')
 
 responses_bp = Blueprint('responses', __name__)
-responses_api = Api(responses_bp)
+responses_api = add_msgpack_representation(Api(responses_bp))
 
 # Helper: Admin or owner required for listing
 
@@ -50,7 +52,8 @@ class ResponseListResource(Resource):
             if question.required and question.question_id not in answered_questions:
                 return {'message': f"Required question not answered: {question.question_id}"}, 400
                 
-        # Validate answers
+        # Validate answers and store them as canonical types
+        normalized = []
         for ans in answers:
             qid = ans.get('question_id')
             if qid not in question_map:
@@ -58,34 +61,39 @@ class ResponseListResource(Resource):
                 
             question = question_map[qid]
             value = ans.get('value')
+            try:
+                value = normalize_value(question.type, value)
+            except (ValueError, TypeError):
+                if question.type == 'checkbox' and not isinstance(value, list):
+                    return {'message': f"Checkbox answer must be a list for question {qid}"}, 400
+                if question.type == 'rating':
+                    return {'message': f"Invalid rating value for question {qid}: {value}"}, 400
+                if question.type == 'multiple_choice':
+                    return {'message': f"Invalid choice for question {qid}: {value}"}, 400
+                return {'message': f"Invalid answer for question {qid}: {value}"}, 400
             
             # Type-specific validation
             if question.type == 'multiple_choice':
                 if value not in question.choices:
                     return {'message': f"Invalid choice for question {qid}: {value}"}, 400
             elif question.type == 'checkbox':
-                if not isinstance(value, list):
-                    return {'message': f"Checkbox answer must be a list for question {qid}"}, 400
                 if not all(choice in question.choices for choice in value):
                     return {'message': f"Invalid choices for question {qid}: {value}"}, 400
             elif question.type == 'rating':
-                try:
-                    rating = int(value)
-                    if not (question.min <= rating <= question.max):
-                        return {'message': f"Rating must be between {question.min} and {question.max} for question {qid}"}, 400
-                except (ValueError, TypeError):
-                    return {'message': f"Invalid rating value for question {qid}: {value}"}, 400
+                if not (question.min <= value <= question.max):
+                    return {'message': f"Rating must be between {question.min} and {question.max} for question {qid}"}, 400
+            normalized.append(Answer(question_id=qid, value=value))
                     
         respondent = User.objects(id=user_id).first()
         response = Response(
             survey=survey,
             respondent=respondent,
             submitted_at=datetime.utcnow(),
-            answers=[Answer(**a) for a in answers]
+            answers=normalized
         )
         response.save()
         result = {'id': str(response.id), **ResponseSchema().dump(response)}
-        return jsonify(result), 201
+        return result, 201
 
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'response_list.yml'))
     @admin_or_owner_required
@@ -94,17 +102,17 @@ class ResponseListResource(Resource):
         per_page = int(request.args.get('per_page', 10))
         offset = (page - 1) * per_page
         
-        responses = Response.objects(survey=survey_id).skip(offset).limit(per_page)
+        responses = Response.objects(survey=survey_id).skip(offset).limit(per_page).as_pymongo()
         total = Response.objects(survey=survey_id).count()
         
         result = {
-            'items': [{'id': str(r.id), **ResponseSchema().dump(r)} for r in responses],
+            'items': [dump_response(r) for r in responses],
             'total': total,
             'page': page,
             'per_page': per_page,
             'pages': (total + per_page - 1) // per_page
         }
-        return jsonify(result)
+        return result
 
 class ResponseResource(Resource):
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'response_get.yml'))
@@ -114,7 +122,7 @@ class ResponseResource(Resource):
         if not response:
             return {'message': 'Response not found.'}, 404
         result = {'id': str(response.id), **ResponseSchema().dump(response)}
-        return jsonify(result)
+        return result
 
 responses_api.add_resource(ResponseListResource, '/<string:survey_id>/responses')
 responses_api.add_resource(ResponseResource, '/<string:survey_id>/responses/<string:response_id>') 
\ No newline at end of file
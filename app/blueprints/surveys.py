@@ -1,17 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 from flask_restful import Api, Resource
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from app.models import Survey, User, Question
-from app.schemas import SurveySchema, QuestionSchema
+from app.schemas import SurveySchema, QuestionSchema, dump_survey
 from marshmallow import ValidationError
 from mongoengine.errors import ValidationError as MongoValidationError
 from flasgger import swag_from
+from app.utils.content import add_msgpack_representation
+from app.utils.purge import schedule
+from datetime import datetime
 import os
 
 SWAGGER_YAML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docs')
 
 surveys_bp = Blueprint('surveys', __name__)
-surveys_api = Api(surveys_bp)
+surveys_api = add_msgpack_representation(Api(surveys_bp))
 
 # Helper: Admin role required
 def admin_required(fn):
@@ -32,17 +35,17 @@ class SurveyListResource(Resource):
         per_page = int(request.args.get('per_page', 10))
         offset = (page - 1) * per_page
         
-        surveys = Survey.objects().skip(offset).limit(per_page)
+        surveys = Survey.objects().skip(offset).limit(per_page).as_pymongo()
         total = Survey.objects().count()
         
         result = {
-            'items': [{'id': str(s.id), **SurveySchema().dump(s)} for s in surveys],
+            'items': [dump_survey(s) for s in surveys],
             'total': total,
             'page': page,
             'per_page': per_page,
             'pages': (total + per_page - 1) // per_page
         }
-        return jsonify(result)
+        return result
 
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'survey_post.yml'))
     @admin_required
@@ -62,6 +65,7 @@ class SurveyListResource(Resource):
             owner=owner,
             title=validated['title'],
             description=validated.get('description', ''),
+            retention_days=validated.get('retention_days'),
             questions=[]
         )
         
@@ -78,7 +82,7 @@ class SurveyListResource(Resource):
                 
         survey.save()
         result = {'id': str(survey.id), **SurveySchema().dump(survey)}
-        return jsonify(result), 201
+        return result, 201
 
 class SurveyResource(Resource):
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'survey_get.yml'))
@@ -88,7 +92,7 @@ class SurveyResource(Resource):
         if not survey:
             return {'message': 'Survey not found.'}, 404
         result = {'id': str(survey.id), **SurveySchema().dump(survey)}
-        return jsonify(result)
+        return result
 
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'survey_put.yml'))
     @admin_required
@@ -107,6 +111,8 @@ class SurveyResource(Resource):
             survey.title = validated['title']
         if 'description' in validated:
             survey.description = validated.get('description', '')
+        if 'retention_days' in validated:
+            survey.retention_days = validated['retention_days']
             
         # Update questions if provided
         if 'questions' in data:
@@ -122,7 +128,7 @@ class SurveyResource(Resource):
                 
         survey.save()
         result = {'id': str(survey.id), **SurveySchema().dump(survey)}
-        return jsonify(result)
+        return result
 
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'survey_delete.yml'))
     @admin_required
@@ -130,8 +136,14 @@ class SurveyResource(Resource):
         survey = Survey.objects(id=survey_id).first()
         if not survey:
             return {'message': 'Survey not found.'}, 404
-        survey.delete()
-        return {'message': 'Survey deleted.'}, 200
+        # Hide it now, its responses are purged in the background
+        survey.update(set__deleted_at=datetime.utcnow())
+        job = schedule('purge_survey', survey.id, created_by=get_jwt_identity())
+        return {
+            'message': 'Survey deleted.',
+            'job_id': str(job.id),
+            'status_url': f'/admin/jobs/{job.id}'
+        }, 202
 
 class QuestionListResource(Resource):
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'question_list.yml'))
@@ -140,7 +152,7 @@ class QuestionListResource(Resource):
         survey = Survey.objects(id=survey_id).first()
         if not survey:
             return {'message': 'Survey not found.'}, 404
-        return jsonify(QuestionSchema(many=True).dump(survey.questions))
+        return QuestionSchema(many=True).dump(survey.questions)
 
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'question_post.yml'))
     @admin_required
@@ -179,7 +191,7 @@ class QuestionListResource(Resource):
         except MongoValidationError as err:
             return {'message': 'Invalid question data.', 'errors': str(err)}, 400
             
-        return jsonify(QuestionSchema().dump(question)), 201
+        return QuestionSchema().dump(question), 201
 
 class QuestionResource(Resource):
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'question_put.yml'))
@@ -207,7 +219,7 @@ class QuestionResource(Resource):
         except MongoValidationError as err:
             return {'message': 'Invalid question data.', 'errors': str(err)}, 400
             
-        return jsonify(QuestionSchema().dump(question))
+        return QuestionSchema().dump(question)
 
     @swag_from(os.path.join(SWAGGER_YAML_DIR, 'question_delete.yml'))
     @admin_required
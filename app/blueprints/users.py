@@ -1,14 +1,17 @@
 from flask import Blueprint, request
 from flask_restful import Api, Resource
-from flask_jwt_extended import jwt_required, get_jwt
-from app.models import User
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from app.models import User, Survey
 from app.schemas import UserSchema, UserRegistrationSchema
 from app import bcrypt
 from marshmallow import ValidationError
 from flasgger import swag_from
+from app.utils.content import add_msgpack_representation
+from app.utils.purge import schedule
+from datetime import datetime
 
 users_bp = Blueprint('users', __name__)
-users_api = Api(users_bp)
+users_api = add_msgpack_representation(Api(users_bp))
 
 # Helper: Admin role required
 def admin_required(fn):
@@ -189,15 +192,19 @@ class UserResource(Resource):
     @swag_from({
         'tags': ['Users'],
         'summary': 'Delete a user by ID',
-        'description': 'Deletes a user by their ID. Admin only.',
+        'description': 'Deletes a user by their ID. Admin only. The user and their surveys disappear immediately; the surveys\' responses are deleted and the user\'s own responses anonymised by a background job, whose progress is available at `status_url`.',
         'security': [{'BearerAuth': []}],
         'parameters': [
             {'name': 'user_id', 'in': 'path', 'required': True, 'schema': {'type': 'string'}, 'description': 'User ID'}
         ],
         'responses': {
-            '200': {
-                'description': 'User deleted.',
-                'content': {'application/json': {'example': {'message': 'User deleted.'}}}
+            '202': {
+                'description': 'User deleted, purge scheduled.',
+                'content': {'application/json': {'example': {
+                    'message': 'User deleted.',
+                    'job_id': '64b7c2f1e4b0f2a1b2c3d4f0',
+                    'status_url': '/admin/jobs/64b7c2f1e4b0f2a1b2c3d4f0'
+                }}}
             },
             '403': {
                 'description': 'Admins only.',
@@ -213,8 +220,16 @@ class UserResource(Resource):
         user = User.objects(id=user_id).first()
         if not user:
             return {'message': 'User not found.'}, 404
-        user.delete()
-        return {'message': 'User deleted.'}, 200
+        # Hide the user and their surveys now, purge them in the background
+        now = datetime.utcnow()
+        user.update(set__deleted_at=now)
+        Survey.objects(owner=user).update(set__deleted_at=now)
+        job = schedule('purge_user', user.id, created_by=get_jwt_identity())
+        return {
+            'message': 'User deleted.',
+            'job_id': str(job.id),
+            'status_url': f'/admin/jobs/{job.id}'
+        }, 202
 
 users_api.add_resource(UserListResource, '/')
 users_api.add_resource(UserResource, '/<string:user_id>') 
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""
+Flask CLI commands for the Survey API (run with `flask <command>`).
+"""
+import json
+import subprocess
+import sys
+import click
+from flask.cli import AppGroup
+
+# Imports the package and runs the factory in a fresh interpreter, printing
+# the factory time in milliseconds on stdout.
+STARTUP_PROFILE_SNIPPET = (
+    "import time; _t = time.perf_counter(); "
+    "from app import create_app; create_app(); "
+    "print((time.perf_counter() - _t) * 1000)"
+)
+
+
+def parse_importtime(stderr):
+    """
+    Parse `python -X importtime` output into a list of
+    (module, self_us, cumulative_us) tuples.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        modules.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return modules
+
+
+def register_commands(app):
+    @app.cli.command('startup-profile')
+    @click.option('--limit', default=25, show_default=True, help='Number of modules to list.')
+    @click.option('--sort', 'sort_by', type=click.Choice(['cumulative', 'self']), default='cumulative', show_default=True)
+    @click.option('--budget-ms', type=float, default=None,
+                  help='Fail if create_app() takes longer (defaults to STARTUP_BUDGET_MS).')
+    @click.option('--json', 'as_json', is_flag=True, help='Print machine-readable output.')
+    def startup_profile(limit, sort_by, budget_ms, as_json):
+        """Report import time per module for the application factory."""
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_PROFILE_SNIPPET],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise click.ClickException(f"create_app() failed:\n{proc.stderr[-2000:]}")
+        total_ms = float(proc.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(proc.stderr)
+        index = 1 if sort_by == 'self' else 2
+        modules.sort(key=lambda m: m[index], reverse=True)
+
+        if budget_ms is None:
+            budget_ms = app.config.get('STARTUP_BUDGET_MS') or None
+
+        if as_json:
+            click.echo(json.dumps({
+                'total_ms': total_ms,
+                'budget_ms': budget_ms,
+                'modules': [{'module': m, 'self_us': s, 'cumulative_us': c} for m, s, c in modules[:limit]]
+            }, indent=2))
+        else:
+            click.echo(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+            for module, self_us, cumulative_us in modules[:limit]:
+                click.echo(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {module}")
+            click.echo(f"\nImport + create_app(): {total_ms:.1f} ms ({len(modules)} modules imported)")
+
+        if budget_ms and total_ms > budget_ms:
+            raise click.ClickException(f"Startup took {total_ms:.1f} ms, over the {budget_ms:.0f} ms budget.")
+
+    @app.cli.command('openapi-build')
+    @click.option('--output', type=click.Path(dir_okay=False), default=None,
+                  help='Where to write the spec (defaults to OPENAPI_SPEC_PATH).')
+    def openapi_build(output):
+        """Precompile the OpenAPI spec from the swag_from docs into a JSON artifact."""
+        from app import swagger
+        from app.swagger_config import build_openapi_spec
+        output = output or app.config['OPENAPI_SPEC_PATH']
+        spec = build_openapi_spec(swagger)
+        with open(output, 'w') as fh:
+            json.dump(spec, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        click.echo(f"Wrote OpenAPI spec with {len(spec.get('paths', {}))} paths to {output}")
+
+    @app.cli.command('slow-queries')
+    @click.option('--limit', default=20, show_default=True, help='Number of operations to list.')
+    @click.option('--flagged', is_flag=True, help='Only list COLLSCAN / in-memory SORT plans.')
+    @click.option('--json', 'as_json', is_flag=True, help='Print machine-readable output.')
+    @click.option('--clear', is_flag=True, help='Delete the log and cached plans instead of listing.')
+    def slow_queries(limit, flagged, as_json, clear):
+        """List recent slow MongoDB operations with their plan flags."""
+        from app.utils.slow_queries import list_slow_queries, clear_slow_queries
+        if clear:
+            clear_slow_queries()
+            click.echo("Slow query log cleared.")
+            return
+        entries = list_slow_queries(limit, flagged_only=flagged)
+        if as_json:
+            click.echo(json.dumps(entries, indent=2))
+            return
+        click.echo(f"{'duration [ms]':>13}  {'command':<10} {'collection':<12} {'flags':<26} endpoint")
+        for e in entries:
+            flags = ','.join(e['plan']['flags']) or '-'
+            click.echo(f"{e['duration_ms']:>13.1f}  {e['command']:<10} {e['collection'] or '-':<12} {flags:<26} "
+                       f"{e['method']} {e['endpoint']}")
+        if not entries:
+            click.echo("No slow operations recorded.")
+
+    @app.cli.command('seed-bulk')
+    @click.option('--users', default=1000, show_default=True, help='Respondent users.')
+    @click.option('--admins', default=5, show_default=True, type=click.IntRange(min=1),
+                  help='Admin users owning the surveys.')
+    @click.option('--surveys', default=10, show_default=True)
+    @click.option('--questions', default=8, show_default=True, help='Questions per survey.')
+    @click.option('--responses', default=10_000, show_default=True, help='Responses per survey.')
+    @click.option('--days', default=90, show_default=True, help='Spread submissions over this many days before --end.')
+    @click.option('--end', default='2025-01-01', show_default=True, type=click.DateTime(['%Y-%m-%d']),
+                  help='UTC date the submissions end at.')
+    @click.option('--choices', default=4, show_default=True, help='Choices per choice/checkbox question.')
+    @click.option('--skew', default=1.5, show_default=True,
+                  help='Answer popularity skew, 1 is uniform; higher favours the first choices and top ratings.')
+    @click.option('--skip-rate', default=0.2, show_default=True, help='Probability of skipping an optional question.')
+    @click.option('--workers', default=4, show_default=True, help='Generator processes, 0 runs in-process.')
+    @click.option('--batch-size', default=5000, show_default=True, help='Documents per insert_many.')
+    @click.option('--seed', default=0, show_default=True, help='Same seed, same data.')
+    @click.option('--drop', is_flag=True, help='Drop users, surveys and responses first.')
+    def seed_bulk(users, admins, surveys, questions, responses, days, end, choices, skew, skip_rate, workers,
+                  batch_size, seed, drop):
+        """Generate a large synthetic dataset with parallel bulk inserts."""
+        import time
+        from mongoengine.connection import get_db
+        from app.utils.datagen import bulk_seed
+        db = get_db()
+        if drop:
+            for name in ('responses', 'surveys', 'users'):
+                db.drop_collection(name)
+        total = surveys * responses
+        started = time.perf_counter()
+        with click.progressbar(length=total, label=f'Seeding {total:,} responses') as bar:
+            counts = bulk_seed(
+                db, app.config['MONGODB_SETTINGS']['host'], users=users, admins=admins, surveys=surveys,
+                questions=questions, responses=responses, days=days, skip_rate=skip_rate, skew=skew,
+                choices=choices, workers=workers, batch_size=batch_size, seed=seed, end=end, progress=bar.update
+            )
+        elapsed = time.perf_counter() - started
+        documents = sum(counts.values())
+        click.echo(f"Inserted {counts['users']:,} users, {counts['surveys']:,} surveys and "
+                   f"{counts['responses']:,} responses in {elapsed:.1f} s "
+                   f"({documents / elapsed * 60:,.0f} documents/min)")
+        # After the inserts, which is faster; a database that already has its indexes is left as it is
+        from app.utils.indexes import ensure_indexes
+        created = sum(a['action'] == 'create' for result in ensure_indexes() for a in result['actions'])
+        if created:
+            click.echo(f"Built {created} missing indexes")
+
+    db_cli = AppGroup('db', help='Database maintenance commands.')
+
+    def print_index_report(report):
+        for collection in report:
+            click.echo(f"\n{collection['collection']}")
+            for index in collection['indexes']:
+                notes = []
+                if not index['declared']:
+                    notes.append('unmanaged')
+                if index['ops'] == 0 and index['name'] != '_id_':
+                    notes.append('unused')
+                if index['redundant_with']:
+                    notes.append(f"redundant with {', '.join(index['redundant_with'])}")
+                ops = '-' if index['ops'] is None else index['ops']
+                click.echo(f"  {index['name']:<32} ops={ops:<10} {', '.join(notes)}")
+            for name in collection['missing']:
+                click.echo(f"  {name:<32} MISSING")
+            if not collection['index_stats_available']:
+                click.echo("  ($indexStats unavailable, usage not reported)")
+
+    @db_cli.command('ensure-indexes')
+    @click.option('--drop-unmanaged', is_flag=True, help='Drop indexes that are not declared on the models.')
+    @click.option('--dry-run', is_flag=True, help='Only show what would be created or dropped.')
+    def ensure_indexes_command(drop_unmanaged, dry_run):
+        """Build the indexes declared on the models and report index usage."""
+        from app.utils.indexes import ensure_indexes, index_report
+        failed = False
+        for result in ensure_indexes(drop_unmanaged=drop_unmanaged, dry_run=dry_run):
+            for action in result['actions']:
+                verb = f"would {action['action']}" if dry_run else action['action']
+                click.echo(f"{result['collection']}: {verb} {action['index']}"
+                           + (f" ({action['error']})" if 'error' in action else ''))
+                failed = failed or action['action'] == 'conflict'
+        print_index_report(index_report())
+        if failed:
+            raise click.ClickException("Some indexes could not be built, see the conflicts above.")
+
+    @db_cli.command('index-report')
+    @click.option('--json', 'as_json', is_flag=True, help='Print machine-readable output.')
+    def index_report_command(as_json):
+        """Report missing, unmanaged, unused and redundant indexes."""
+        from app.utils.indexes import index_report
+        report = index_report()
+        if as_json:
+            click.echo(json.dumps(report, indent=2, default=str))
+        else:
+            print_index_report(report)
+
+    @db_cli.command('normalize-answers')
+    @click.option('--survey', 'survey_id', default=None, help='Only normalize this survey\'s responses.')
+    @click.option('--batch-size', default=1000, show_default=True, help='Updates per bulk write.')
+    @click.option('--dry-run', is_flag=True, help='Only count the responses that would change.')
+    def normalize_answers_command(survey_id, batch_size, dry_run):
+        """Rewrite stored answers to canonical types (int ratings, str choices and text, list checkboxes)."""
+        from app.utils.answers import normalize_stored_answers
+        results = normalize_stored_answers(survey_id=survey_id, batch_size=batch_size, dry_run=dry_run)
+        verb = 'would update' if dry_run else 'updated'
+        for counts in results:
+            if counts['updated'] or counts['invalid']:
+                click.echo(f"{counts['survey']}: scanned {counts['scanned']:,}, {verb} {counts['updated']:,}, "
+                           f"left {counts['invalid']:,} invalid answers unchanged")
+        click.echo(f"{verb.capitalize()} {sum(c['updated'] for c in results):,} of "
+                   f"{sum(c['scanned'] for c in results):,} responses")
+
+    app.cli.add_command(db_cli)
+
+    jobs_cli = AppGroup('jobs', help='Background job commands.')
+
+    @jobs_cli.command('resume')
+    def resume_jobs_command():
+        """Run pending, interrupted and failed purge jobs to completion."""
+        from app.utils.purge import resume_jobs
+        jobs = resume_jobs()
+        for job in jobs:
+            progress = ', '.join(f'{k}={v}' for k, v in sorted(job.progress.items())) or 'no changes'
+            click.echo(f"{job.id} {job.kind} {job.target}: {job.status} ({progress})"
+                       + (f" error: {job.error}" if job.error else ''))
+        if not jobs:
+            click.echo("No jobs to resume.")
+        if any(job.status == 'failed' for job in jobs):
+            raise click.ClickException("Some jobs failed.")
+
+    app.cli.add_command(jobs_cli)
+
+    @app.cli.command('archive')
+    @click.option('--survey', 'survey_id', default=None, help='Only archive this survey.')
+    @click.option('--dry-run', is_flag=True, help='Only count the responses past their retention horizon.')
+    def archive_command(survey_id, dry_run):
+        """Move responses older than their survey's retention horizon to cold storage."""
+        from app.utils.archive import archive_all, retention_days
+        verb = 'would archive' if dry_run else 'archived'
+        results = archive_all(survey_id=survey_id, dry_run=dry_run)
+        for survey, count in results:
+            days = retention_days(survey)
+            if days:
+                click.echo(f"{survey.id} {survey.title!r} (retention {days} days): {verb} {count:,} responses")
+        total = sum(count for _, count in results)
+        click.echo(f"Total: {verb} {total:,} responses"
+                   + ('' if dry_run else f" to {app.config.get('ARCHIVE_BACKEND', 'file')} storage"))
+
+    @app.cli.command('rollups')
+    @click.option('--survey', 'survey_id', default=None, help='Only roll up this survey.')
+    @click.option('--rebuild', is_flag=True, help='Drop the existing rollups first.')
+    def rollups_command(survey_id, rebuild):
+        """Sum up complete days of responses into response_rollups."""
+        from app.models import Survey
+        from app.utils.rollups import invalidate, rollup_all
+        if rebuild:
+            for survey in (Survey.objects(id=survey_id) if survey_id else Survey.objects):
+                invalidate(survey.id)
+        results = rollup_all(survey_id=survey_id)
+        for survey, days in results:
+            if days:
+                click.echo(f"{survey.id} {survey.title!r}: rolled up {days:,} days")
+        click.echo(f"Rolled up {sum(days for _, days in results):,} days of {len(results):,} surveys")
+
+    snapshots_cli = AppGroup('snapshots', help='Analytics snapshot commands.')
+
+    @snapshots_cli.command('list')
+    def list_snapshots_command():
+        """Show the snapshots on this host, most recently used first."""
+        from app.utils.snapshots import list_snapshots
+        snapshots = list_snapshots()
+        for snapshot in snapshots:
+            click.echo(f"{snapshot['survey']}: {snapshot['responses']:,} responses in {snapshot['segments']} "
+                       f"segments, {snapshot['bytes'] / 1024 / 1024:.1f} MB")
+        total = sum(s['bytes'] for s in snapshots) / 1024 / 1024
+        click.echo(f"{len(snapshots)} snapshots, {total:.1f} of {app.config.get('SNAPSHOT_DISK_BUDGET_MB', 1024)} MB")
+
+    @snapshots_cli.command('clear')
+    @click.option('--survey', 'survey_id', default=None, help='Only drop this survey\'s snapshot.')
+    def clear_snapshots_command(survey_id):
+        """Drop snapshots; the next analytics request rebuilds them."""
+        from app.utils.snapshots import clear, invalidate
+        if survey_id:
+            invalidate(survey_id)
+            click.echo(f"Dropped the snapshot of {survey_id}")
+        else:
+            click.echo(f"Dropped {clear()} snapshots")
+
+    app.cli.add_command(snapshots_cli)
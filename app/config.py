@@ -9,9 +9,15 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
     MONGODB_SETTINGS = {
         'host': os.getenv('MONGODB_URI', 'mongodb://localhost:27017/survey_api'),
-        'uuidRepresentation': 'standard'
+        'uuidRepresentation': 'standard',
+        # Per-process pool; with gunicorn the total is workers * threads-bound usage
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+        # Don't open sockets until the first query, so a preloading master never connects
+        'connect': False
     }
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
@@ -27,9 +33,56 @@ class Config:
     CACHE_REDIS_URL = REDIS_URL
     CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
     CACHE_KEY_PREFIX = "survey_api:"
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))  # bytes
+    COMPRESS_MIMETYPES = [
+        'application/json', 'application/msgpack', 'application/javascript',
+        'text/csv', 'text/css', 'text/html', 'text/plain'
+    ]
+    COMPRESS_LEVEL = 6  # gzip
+    COMPRESS_BR_LEVEL = 4  # brotli, used when the brotli package is installed
+    COMPRESS_CACHE_ENCODING = 'gzip'  # encoding cached analytics payloads are stored with
     TESTING = False
     DEBUG = False
     RESTFUL_JSON = {'cls': CustomJSONEncoder}
+    # Precompiled OpenAPI spec served instead of parsing the YAML docs (see `flask openapi-build`)
+    OPENAPI_SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openapi.json')
+    METRICS_ENABLED = True  # Prometheus text on /metrics
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # bearer token scrapers must send; unset, /metrics answers 403
+    SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', '0') == '1'  # per-request app/mongo/redis timings
+    PROFILING_ENABLED = True  # admins can profile a request with X-Profile / ?_profile=
+    PROFILE_TTL = 3600  # seconds a stored profile stays downloadable
+    PROFILE_SAMPLE_INTERVAL = 0.001  # seconds between stack samples in "sample" mode
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 100))  # log and explain slower Mongo commands, 0 disables
+    SLOW_QUERY_LOG_SIZE = 500  # most recent slow operations kept in Redis
+    SLOW_QUERY_EXPLAIN_TTL = 3600  # seconds before the same query shape is explained again
+    PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 1000))  # documents per delete/update batch
+    PURGE_BATCH_PAUSE = float(os.getenv('PURGE_BATCH_PAUSE', 0.05))  # seconds between batches
+    JOBS_RUN_INLINE = False  # run purge jobs inside the request instead of a background thread
+    # A running job whose progress is older than this counts as abandoned, and `flask jobs resume` takes it over
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 600))
+    # `flask archive` moves responses past a survey's retention_days to cold storage
+    ARCHIVE_BACKEND = os.getenv('ARCHIVE_BACKEND', 'file')  # 'file' (gzipped JSONL under ARCHIVE_DIR) or 'collection'
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+    ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', 0))  # for surveys without retention_days, 0 never archives
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))  # responses per archive file/batch
+    ARCHIVE_BATCH_PAUSE = float(os.getenv('ARCHIVE_BATCH_PAUSE', 0.05))  # seconds between batches
+    # Text answers returned as samples by analytics, picked at random; the same seed picks the same ones
+    ANALYTICS_TEXT_SAMPLES = int(os.getenv('ANALYTICS_TEXT_SAMPLES', 5))
+    ANALYTICS_SAMPLE_SEED = int(os.getenv('ANALYTICS_SAMPLE_SEED', 0))
+    # Longest time series analytics fills in; longer ones get a 400 (10000 hourly buckets is about 14 months)
+    ANALYTICS_MAX_BUCKETS = int(os.getenv('ANALYTICS_MAX_BUCKETS', 10000))
+    # Memory-mapped answer snapshots under SNAPSHOT_DIR for analytics of large surveys
+    SNAPSHOTS_ENABLED = os.getenv('SNAPSHOTS_ENABLED', '1') == '1'
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+    SNAPSHOT_MIN_RESPONSES = int(os.getenv('SNAPSHOT_MIN_RESPONSES', 10000))  # smaller surveys are read from Mongo
+    SNAPSHOT_MAX_SEGMENTS = int(os.getenv('SNAPSHOT_MAX_SEGMENTS', 8))  # delta segments before compaction
+    SNAPSHOT_DISK_BUDGET_MB = int(os.getenv('SNAPSHOT_DISK_BUDGET_MB', 1024))  # least recently used evicted above this
+    # Anonymized request shapes for benchmarks/replay.py, one file per process
+    TRACE_CAPTURE_ENABLED = os.getenv('TRACE_CAPTURE_ENABLED', '0') == '1'
+    TRACE_CAPTURE_PATH = os.getenv('TRACE_CAPTURE_PATH', 'traces/requests-{pid}.jsonl')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+    # Budget for `flask startup-profile` in milliseconds, 0 disables the check
+    STARTUP_BUDGET_MS = int(os.getenv('STARTUP_BUDGET_MS', 0))
 
 class TestConfig(Config):
     TESTING = True
@@ -40,4 +93,9 @@ class TestConfig(Config):
     CACHE_TYPE = "simple"
     CACHE_DEFAULT_TIMEOUT = 60  # 1 minute for testing
     CACHE_KEY_PREFIX = "test:"
+    JOBS_RUN_INLINE = True
+    PURGE_BATCH_PAUSE = 0
+    ARCHIVE_BATCH_PAUSE = 0
+    SNAPSHOTS_ENABLED = False
+    METRICS_TOKEN = 'test-metrics-token'
     RESTFUL_JSON = {'cls': CustomJSONEncoder}
@@ -3,3 +3,6 @@ from .question import Question
 from .survey import Survey
 from .answer import Answer
 from .response import Response
+from .job import Job
+from .archive import ArchiveBatch
+from .rollup import ResponseRollup
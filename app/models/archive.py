@@ -0,0 +1,28 @@
+from mongoengine import Document, StringField, ObjectIdField, IntField, DictField, DateTimeField
+from datetime import datetime
+
+class ArchiveBatch(Document):
+    """
+    One batch of responses moved to cold storage, with the pre-aggregated
+    analytics of the responses it holds.
+    """
+    # _id of the batch's last response, so re-archiving the same batch after an interruption overwrites it
+    id = ObjectIdField(primary_key=True)
+    survey = ObjectIdField(required=True)
+    first_id = ObjectIdField(required=True)
+    count = IntField(required=True)
+    oldest = DateTimeField()  # submitted_at range of the archived responses
+    newest = DateTimeField()
+    location = StringField(required=True)  # "collection" or the archive file, relative to ARCHIVE_DIR
+    summary = DictField()
+    created_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'archive_batches',
+        'indexes': [
+            ('survey', '_id')
+        ],
+        'ordering': ['_id'],
+        # Built by `flask db ensure-indexes`, not on first query
+        'auto_create_index': False
+    }
@@ -0,0 +1,27 @@
+from mongoengine import Document, StringField, ObjectIdField, DictField, DateTimeField
+from datetime import datetime
+
+class Job(Document):
+    """
+    Background maintenance job (e.g. purging a deleted survey) and its progress.
+    """
+    kind = StringField(required=True, choices=("purge_survey", "purge_user"))
+    target = ObjectIdField(required=True)  # id of the survey/user the job works on
+    status = StringField(default="pending", choices=("pending", "running", "done", "failed"))
+    progress = DictField()  # counters updated after every batch
+    error = StringField()
+    created_by = StringField()
+    created_at = DateTimeField(default=datetime.utcnow)
+    started_at = DateTimeField()
+    updated_at = DateTimeField(default=datetime.utcnow)
+    finished_at = DateTimeField()
+
+    meta = {
+        'collection': 'jobs',
+        'indexes': [
+            ('status', '-created_at')
+        ],
+        'ordering': ['-created_at'],
+        # Built by `flask db ensure-indexes`, not on first query
+        'auto_create_index': False
+    }
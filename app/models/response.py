@@ -16,8 +16,15 @@ class Response(Document):
     meta = {
         'collection': 'responses',
         'indexes': [
-            'survey',
-            'respondent'
+            # Serves survey filters sorted by submitted_at in both directions
+            ('survey', '-submitted_at'),
+            # Multikey, serves analytics filtered by an answer ($elemMatch on both fields)
+            ('survey', 'answers.question_id', 'answers.value'),
+            # Anonymous responses have no respondent and stay out of the index
+            {'fields': ['respondent'], 'name': 'respondent_1_partial',
+             'partialFilterExpression': {'respondent': {'$exists': True}}}
         ],
-        'ordering': ['-submitted_at']
+        'ordering': ['-submitted_at'],
+        # Built by `flask db ensure-indexes`, not on first query
+        'auto_create_index': False
     } 
\ No newline at end of file
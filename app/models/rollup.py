@@ -0,0 +1,22 @@
+from mongoengine import Document, ObjectIdField, DictField, DateTimeField
+from datetime import datetime
+
+class ResponseRollup(Document):
+    """
+    Pre-aggregated analytics of one survey's responses submitted on one UTC
+    day, maintained by `flask rollups`.
+    """
+    survey = ObjectIdField(required=True)
+    day = DateTimeField(required=True)  # UTC midnight
+    summary = DictField()  # app.utils.aggregates.dump() of the day's responses
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'response_rollups',
+        'indexes': [
+            {'fields': ('survey', 'day'), 'unique': True}
+        ],
+        'ordering': ['day'],
+        # Built by `flask db ensure-indexes`, not on first query
+        'auto_create_index': False
+    }
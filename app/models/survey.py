@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, ReferenceField, DateTimeField, EmbeddedDocumentListField
+from mongoengine import Document, queryset_manager, StringField, IntField, ReferenceField, DateTimeField, EmbeddedDocumentListField
 from datetime import datetime
 from .user import User
 from .question import Question
@@ -13,16 +13,32 @@ class Survey(Document):
     questions = EmbeddedDocumentListField(Question)
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
+    # Responses older than this many days move to the archive (ARCHIVE_RETENTION_DAYS when unset)
+    retention_days = IntField(min_value=1)
+    # Days before this UTC midnight are summed up in response_rollups (see app/utils/rollups.py)
+    rollups_until = DateTimeField()
+    deleted_at = DateTimeField()  # set on delete, the document is purged in the background
 
     meta = {
         'collection': 'surveys',
         'indexes': [
-            'owner',
-            'title'
+            '-created_at',
+            ('owner', '-created_at')
         ],
-        'ordering': ['-created_at']
+        'ordering': ['-created_at'],
+        # Built by `flask db ensure-indexes`, not on first query
+        'auto_create_index': False
     }
 
     def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs) 
\ No newline at end of file
+        return super().save(*args, **kwargs)
+
+    @queryset_manager
+    def objects(doc_cls, queryset):
+        # Soft-deleted documents are invisible to the API
+        return queryset.filter(deleted_at=None)
+
+    @queryset_manager
+    def all_objects(doc_cls, queryset):
+        return queryset 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, EmailField, DateTimeField
+from mongoengine import Document, queryset_manager, StringField, EmailField, DateTimeField
 from datetime import datetime
 
 class User(Document):
@@ -11,6 +11,7 @@ class User(Document):
     role = StringField(required=True, choices=("admin", "respondent"))
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
+    deleted_at = DateTimeField()  # set on delete, the document is purged in the background
 
     meta = {
         'collection': 'users',
@@ -19,9 +20,20 @@ class User(Document):
             'email',
             'role'
         ],
-        'ordering': ['-created_at']
+        'ordering': ['-created_at'],
+        # Built by `flask db ensure-indexes`, not on first query
+        'auto_create_index': False
     }
 
     def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs) 
\ No newline at end of file
+        return super().save(*args, **kwargs)
+
+    @queryset_manager
+    def objects(doc_cls, queryset):
+        # Soft-deleted documents are invisible to the API
+        return queryset.filter(deleted_at=None)
+
+    @queryset_manager
+    def all_objects(doc_cls, queryset):
+        return queryset 
\ No newline at end of file
@@ -5,3 +5,5 @@ from .question import QuestionSchema
 from .survey import SurveySchema
 from .answer import AnswerSchema
 from .response import ResponseSchema
+from .job import JobSchema
+from .compiled import compile_dumper, dump_survey, dump_response
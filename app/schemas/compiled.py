@@ -0,0 +1,114 @@
+"""
+Precompiled dump functions for the hot list endpoints.
+
+Instantiating a marshmallow schema (and dereferencing ``owner`` / ``survey``
+references) for every item dominates the cost of listing surveys and
+responses. ``compile_dumper`` reads a schema's declared fields once and
+generates a plain Python function that serializes the raw pymongo dict for
+a document (as returned by ``QuerySet.as_pymongo()``), producing exactly what
+``{'id': str(doc.id), **Schema().dump(doc)}`` produces for the loaded
+mongoengine document.
+"""
+from bson import DBRef
+from marshmallow import fields
+from mongoengine.fields import ReferenceField, ListField, EmbeddedDocumentField
+
+from app.models import Survey, Response
+from .survey import SurveySchema
+from .response import ResponseSchema
+
+
+def _ref_id(value):
+    return value.id if isinstance(value, DBRef) else value
+
+
+def _field_default(doc_field):
+    default = doc_field.default
+    return default() if callable(default) else default
+
+
+def _serializer_expr(field, value, namespace, document_cls):
+    """Return a Python expression serializing ``value`` like ``field`` would."""
+    if isinstance(field, fields.String):
+        return f"str({value})"
+    if isinstance(field, fields.Integer):
+        return f"int({value})"
+    if isinstance(field, fields.DateTime):
+        if (field.format or field.DEFAULT_FORMAT) not in ('iso', 'iso8601'):
+            raise TypeError(f"Unsupported DateTime format for compiled dump: {field.format}")
+        return f"{value}.isoformat()"
+    if type(field) in (fields.Boolean, fields.Raw):
+        # Both serialize the value unchanged
+        return value
+    if isinstance(field, fields.Nested):
+        if document_cls is None:
+            raise TypeError("Nested fields need an embedded document type to compile.")
+        nested_schema = field.nested if isinstance(field.nested, type) else type(field.nested)
+        name = f"_dump_{nested_schema.__name__}"
+        namespace[name] = compile_dumper(nested_schema, document_cls, include_id=False)
+        return f"{name}({value})"
+    if isinstance(field, fields.List):
+        item = _serializer_expr(field.inner, '_item', namespace, document_cls)
+        return f"[{item} for _item in {value}]"
+    raise TypeError(f"Unsupported field type for compiled dump: {type(field).__name__}")
+
+
+def compile_dumper(schema_cls, document_cls, include_id=True):
+    """
+    Generate a dump function for ``schema_cls`` working on raw pymongo dicts.
+
+    Missing keys fall back to the mongoengine field default, just like a
+    loaded document would. ``include_id`` prepends the stringified ``_id``
+    the same way the resources used to merge ``{'id': str(doc.id)}`` in.
+    """
+    namespace = {'_ref_id': _ref_id}
+    lines = [f"def dump_{schema_cls.__name__}(doc):", "    get = doc.get", "    out = {}"]
+    if include_id:
+        lines.append("    out['id'] = str(doc['_id'])")
+
+    for name, field in schema_cls._declared_fields.items():
+        if field.load_only:
+            continue
+        key = field.data_key or name
+        attribute = field.attribute or name
+        root, _, rest = attribute.partition('.')
+
+        if root == 'id' and not rest:
+            # Document primary key
+            pk_expr = _serializer_expr(field, "doc['_id']", namespace, None)
+            lines.append(f"    out[{key!r}] = {pk_expr}")
+            continue
+
+        doc_field = document_cls._fields.get(root)
+        if doc_field is None:
+            raise TypeError(f"{document_cls.__name__} has no field {root!r} for {schema_cls.__name__}.{name}")
+
+        if rest:
+            # Only "<reference>.id" is supported: the raw value is the referenced id
+            if not isinstance(doc_field, ReferenceField) or rest != 'id':
+                raise TypeError(f"Unsupported attribute path for compiled dump: {attribute}")
+            lines.append(f"    v = get({doc_field.db_field!r})")
+            lines.append("    if v is not None:")
+            lines.append(f"        out[{key!r}] = {_serializer_expr(field, '_ref_id(v)', namespace, None)}")
+            continue
+
+        embedded_cls = None
+        inner_field = doc_field.field if isinstance(doc_field, ListField) else doc_field
+        if isinstance(inner_field, EmbeddedDocumentField):
+            embedded_cls = inner_field.document_type
+
+        default_name = f"_default_{name}"
+        namespace[default_name] = doc_field
+        lines.append(f"    v = get({doc_field.db_field!r})")
+        lines.append("    if v is None:")
+        lines.append(f"        v = _field_default({default_name})")
+        lines.append(f"    out[{key!r}] = None if v is None else {_serializer_expr(field, 'v', namespace, embedded_cls)}")
+
+    lines.append("    return out")
+    namespace['_field_default'] = _field_default
+    exec(compile('\n'.join(lines), f"<compiled {schema_cls.__name__}>", 'exec'), namespace)
+    return namespace[f"dump_{schema_cls.__name__}"]
+
+
+dump_survey = compile_dumper(SurveySchema, Survey)
+dump_response = compile_dumper(ResponseSchema, Response)
@@ -0,0 +1,14 @@
+from marshmallow import Schema, fields
+
+class JobSchema(Schema):
+    id = fields.String(attribute="id")
+    kind = fields.String()
+    target = fields.String()
+    status = fields.String()
+    progress = fields.Dict()
+    error = fields.String(allow_none=True)
+    created_by = fields.String(allow_none=True)
+    created_at = fields.DateTime()
+    started_at = fields.DateTime(allow_none=True)
+    updated_at = fields.DateTime()
+    finished_at = fields.DateTime(allow_none=True)
@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 from .question import QuestionSchema
 
 class SurveySchema(Schema):
@@ -7,5 +7,6 @@ class SurveySchema(Schema):
     title = fields.String(required=True)
     description = fields.String()
     questions = fields.List(fields.Nested(QuestionSchema))
+    retention_days = fields.Integer(allow_none=True, validate=validate.Range(min=1))
     created_at = fields.DateTime()
     updated_at = fields.DateTime() 
\ No newline at end of file
@@ -1,6 +1,8 @@
 """
 Swagger/OpenAPI configuration for the Survey API
 """
+import json
+import os
 
 swagger_config = {
     "headers": [],
@@ -81,6 +83,7 @@ swagger_template = {
                     "title": {"type": "string", "example": "Customer Satisfaction Survey"},
                     "description": {"type": "string", "example": "A survey to measure customer satisfaction."},
                     "owner": {"$ref": "#/components/schemas/User"},
+                    "retention_days": {"type": "integer", "nullable": True, "example": 365},
                     "questions": {
                         "type": "array",
                         "items": {"$ref": "#/components/schemas/Question"}
@@ -94,6 +97,8 @@ swagger_template = {
                 "properties": {
                     "title": {"type": "string", "example": "Customer Satisfaction Survey"},
                     "description": {"type": "string", "example": "A survey to measure customer satisfaction."},
+                    "retention_days": {"type": "integer", "nullable": True, "example": 365,
+                                       "description": "Archive responses older than this many days"},
                     "questions": {
                         "type": "array",
                         "items": {"$ref": "#/components/schemas/QuestionInput"}
@@ -171,4 +176,28 @@ swagger_template = {
             }
         }
     }
-} 
\ No newline at end of file
+} 
+# Endpoint of the single spec declared in swagger_config["specs"]
+APISPEC_ENDPOINT = 'apispec'
+
+
+def build_openapi_spec(swagger):
+    """
+    Generate the OpenAPI spec from the registered routes, parsing every
+    swag_from YAML file. This is the slow path the precompiled artifact avoids.
+    """
+    swagger.apispecs.pop(APISPEC_ENDPOINT, None)
+    return swagger.get_apispecs(APISPEC_ENDPOINT)
+
+
+def load_openapi_spec(swagger, path):
+    """
+    Seed flasgger's spec cache from the precompiled artifact written by
+    `flask openapi-build`, so workers never parse the YAML docs. Returns False
+    when there is no artifact to load.
+    """
+    if not path or not os.path.exists(path):
+        return False
+    with open(path) as fh:
+        swagger.apispecs[APISPEC_ENDPOINT] = json.load(fh)
+    return True
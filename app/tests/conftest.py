@@ -14,6 +14,9 @@ def app():
     
     ctx = _app.app_context()
     ctx.push()
+    # Indexes are not auto-created on first query, build them like a deploy does
+    from app.utils.indexes import ensure_indexes
+    ensure_indexes()
     
     yield _app
     
@@ -0,0 +1,59 @@
+import json
+import marshal
+import redis
+from app.utils import profiling
+from app.tests.conftest import get_token
+
+
+def test_admin_can_profile_a_request(seeded_client):
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = seeded_client.get('/surveys/?_profile=cprofile', headers=headers)
+    assert resp.status_code == 200
+    profile_id = resp.headers['X-Profile-Id']
+    assert resp.headers['X-Profile-Url'] == f'/admin/profiles/{profile_id}'
+
+    meta = seeded_client.get(f'/admin/profiles/{profile_id}', headers=headers).get_json()
+    assert meta['mode'] == 'cprofile'
+    assert meta['endpoint'] == '/surveys/'
+    assert set(meta['mongo']) == {'commands', 'duration_ms', 'details'}
+    assert profile_id in [p['id'] for p in seeded_client.get('/admin/profiles', headers=headers).get_json()]
+
+    download = seeded_client.get(f'/admin/profiles/{profile_id}/download', headers=headers)
+    assert download.status_code == 200
+    assert download.headers['Content-Disposition'] == f'attachment;filename=profile_{profile_id}.prof'
+    stats = marshal.loads(download.data)
+    assert any(func[2] == 'get' and 'surveys.py' in func[0] for func in stats)
+
+
+def test_redis_errors_do_not_fail_a_profiled_request(seeded_client, monkeypatch):
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+
+    def unreachable(*args, **kwargs):
+        raise redis.ConnectionError('Redis is down')
+    monkeypatch.setattr(profiling, 'store_profile', unreachable)
+    resp = seeded_client.get('/surveys/?_profile=cprofile', headers={'Authorization': f'Bearer {token}'})
+    assert resp.status_code == 200
+    assert 'X-Profile-Id' not in resp.headers
+
+
+def test_sample_profile_is_speedscope_json(seeded_client):
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    headers = {'Authorization': f'Bearer {token}', 'X-Profile': 'sample'}
+    resp = seeded_client.get('/surveys/', headers=headers)
+    profile_id = resp.headers['X-Profile-Id']
+    download = seeded_client.get(f'/admin/profiles/{profile_id}/download',
+                                 headers={'Authorization': f'Bearer {token}'})
+    assert download.mimetype == 'application/json'
+    data = json.loads(download.data)
+    assert data['profiles'][0]['type'] == 'sampled'
+    assert len(data['profiles'][0]['samples']) == len(data['profiles'][0]['weights'])
+
+
+def test_non_admin_requests_are_not_profiled(seeded_client):
+    token = get_token(seeded_client, 'respondent', 'respondent@example.com', 'password123', 'respondent')
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = seeded_client.get('/surveys/?_profile=cprofile', headers=headers)
+    assert resp.status_code == 200
+    assert 'X-Profile-Id' not in resp.headers
+    assert seeded_client.get('/admin/profiles', headers=headers).status_code == 403
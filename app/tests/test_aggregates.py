@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from collections import Counter
+from random import Random
+from bson import ObjectId
+from app.models import Question
+from app.utils import aggregates
+from app.utils.columnar import SurveyColumns
+
+RATING = Question(question_id='r', type='rating', text='Rate', order=1)
+TEXT = Question(question_id='t', type='text', text='Why?', order=2)
+TYPES = {'r': 'rating', 't': 'text'}
+
+
+def _state(docs):
+    state = aggregates.empty()
+    for doc in docs:
+        aggregates.add_response(state, TYPES, doc)
+    return state
+
+
+def _merged(*parts):
+    state = aggregates.empty()
+    for part in parts:
+        aggregates.merge(state, aggregates.dump(_state(part)))
+    return state
+
+
+def test_rating_statistics_match_numpy_and_merge():
+    rng = Random(1)
+    ratings = [rng.randint(1, 10) for _ in range(501)]
+    docs = [{'answers': [{'question_id': 'r', 'value': v}]} for v in ratings]
+
+    result = aggregates.finalize(_merged(docs[:100], docs[100:350], docs[350:]), [RATING])['r']
+    assert result == aggregates.finalize(_state(docs), [RATING])['r']
+    assert result['average'] == pytest.approx(np.mean(ratings))
+    assert result['stddev'] == pytest.approx(np.std(ratings, ddof=1))
+    for p in aggregates.PERCENTILES:
+        assert result['percentiles'][f'p{p}'] == pytest.approx(np.percentile(ratings, p))
+    low, high = result['confidence_interval']
+    assert low < result['average'] < high
+    assert high - low == pytest.approx(2 * 1.959964 * np.std(ratings, ddof=1) / np.sqrt(len(ratings)))
+
+
+def test_single_and_missing_ratings():
+    one = aggregates.finalize(_state([{'answers': [{'question_id': 'r', 'value': 4}]}]), [RATING])['r']
+    assert one['stddev'] == 0 and one['confidence_interval'] == [4, 4] and one['percentiles']['p90'] == 4
+    assert aggregates.finalize(aggregates.empty(), [RATING])['r']['percentiles'] == \
+        {'p25': 0, 'p50': 0, 'p75': 0, 'p90': 0}
+
+
+def test_top_terms():
+    docs = [{'answers': [{'question_id': 't', 'value': text}]} for text in [
+        'Great service, great food', 'The food was cold', 'Service was slow', 'food!', 'ok']]
+    result = aggregates.finalize(_state(docs), [TEXT])['t']
+    assert result['top_terms'][:2] == [{'term': 'food', 'count': 3}, {'term': 'service', 'count': 2}]
+    assert {t['term'] for t in result['top_terms']} == {'food', 'service', 'great', 'cold', 'slow'}
+    assert result['top_terms_error'] == 0
+
+
+def test_trimmed_term_counts_stay_within_the_error_bound():
+    rng = Random(2)
+    words = [f'term{chr(97 + i // 26)}{chr(97 + i % 26)}' for i in range(400)]
+    weights = [1 / (i + 1) for i in range(len(words))]
+    docs = [{'answers': [{'question_id': 't', 'value': ' '.join(rng.choices(words, weights, k=3))}]}
+            for _ in range(2000)]
+    true = Counter(t for doc in docs for t in aggregates.terms(doc['answers'][0]['value']))
+
+    state = _merged(*(docs[i:i + 250] for i in range(0, len(docs), 250)))
+    q = state['questions']['t']
+    assert q['terms_error'] > 0
+    for term, count in q['terms'].items():
+        assert count <= true[term] <= count + q['terms_error']
+    top = [t['term'] for t in aggregates.finalize(state, [TEXT])['t']['top_terms']]
+    assert top[:3] == [term for term, _ in true.most_common(3)]
+
+
+def test_summaries_without_terms_still_merge():
+    summary = aggregates.dump(_state([{'answers': [{'question_id': 't', 'value': 'hello there'}]}]))
+    for question in summary['questions']:
+        del question['terms'], question['terms_error']
+    state = aggregates.merge(aggregates.empty(), summary)
+    assert aggregates.finalize(state, [TEXT])['t']['top_terms'] == []
+
+
+def _text_docs(count):
+    return [{'_id': ObjectId(), 'answers': [{'question_id': 't', 'value': f'answer {i}'}]} for i in range(count)]
+
+
+def test_samples_do_not_depend_on_order_or_partitioning():
+    docs = _text_docs(300)
+    expected = aggregates.finalize(_state(docs), [TEXT])['t']['samples']
+    assert len(expected) == aggregates.TEXT_SAMPLES
+    shuffled = list(docs)
+    Random(3).shuffle(shuffled)
+    merged = _merged(shuffled[:10], shuffled[10:200], shuffled[200:])
+    assert aggregates.finalize(merged, [TEXT])['t']['samples'] == expected
+    columns = SurveyColumns([TEXT]).add_chunk(shuffled).finish()
+    assert aggregates.finalize(columns.state(), [TEXT])['t']['samples'] == expected
+
+
+def test_samples_are_uniform_and_configurable(app):
+    docs = _text_docs(1000)
+    position = {doc['answers'][0]['value']: i for i, doc in enumerate(docs)}
+    picked = []
+    try:
+        for seed in range(200):
+            app.config['ANALYTICS_SAMPLE_SEED'] = seed
+            picked += [position[t] for t in aggregates.finalize(_state(docs), [TEXT])['t']['samples']]
+        assert len(set(picked)) > 500
+        assert abs(np.mean(picked) - 499.5) < 40  # the newest answers were always picked before
+
+        app.config['ANALYTICS_TEXT_SAMPLES'] = 8
+        assert len(aggregates.finalize(_state(docs), [TEXT])['t']['samples']) == 8
+    finally:
+        app.config.update(ANALYTICS_SAMPLE_SEED=0, ANALYTICS_TEXT_SAMPLES=aggregates.TEXT_SAMPLES)
@@ -0,0 +1,84 @@
+import pytest
+from app.models import Response, Survey
+from app.utils.answers import normalize_value
+from app.tests.conftest import get_token
+
+QUESTIONS = [
+    {'question_id': 'mc', 'type': 'multiple_choice', 'text': 'Pick', 'order': 1, 'choices': ['1', '2']},
+    {'question_id': 'cb', 'type': 'checkbox', 'text': 'Pick some', 'order': 2, 'choices': ['a', 'b']},
+    {'question_id': 'r', 'type': 'rating', 'text': 'Rate', 'order': 3},
+    {'question_id': 't', 'type': 'text', 'text': 'Why?', 'order': 4},
+]
+
+
+@pytest.mark.parametrize('qtype,value,expected', [
+    ('rating', '4', 4), ('rating', ' 3 ', 3), ('rating', 5.0, 5), ('rating', '2.0', 2), ('rating', 1, 1),
+    ('checkbox', ['a', 'b', 'a'], ['a', 'b']), ('checkbox', [1], ['1']),
+    ('multiple_choice', 2, '2'), ('text', 42, '42'), ('text', 'fine', 'fine'),
+])
+def test_normalize_value(qtype, value, expected):
+    result = normalize_value(qtype, value)
+    assert result == expected and type(result) is type(expected)
+
+
+@pytest.mark.parametrize('qtype,value', [
+    ('rating', 4.5), ('rating', 'four'), ('rating', True), ('rating', None),
+    ('checkbox', 'a'), ('checkbox', [['a']]), ('text', None), ('multiple_choice', ['1']),
+])
+def test_normalize_value_rejects(qtype, value):
+    with pytest.raises((TypeError, ValueError)):
+        normalize_value(qtype, value)
+
+
+def _survey(client, headers, title):
+    resp = client.post('/surveys/', headers=headers, json={'title': title, 'questions': QUESTIONS})
+    assert resp.status_code == 201
+    return resp.get_json()['id']
+
+
+def test_submitted_answers_are_stored_typed(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    survey_id = _survey(seeded_client, headers, 'Typed answers')
+
+    resp = seeded_client.post(f'/surveys/{survey_id}/responses', headers=headers, json={'answers': [
+        {'question_id': 'mc', 'value': 1}, {'question_id': 'cb', 'value': ['b', 'b']},
+        {'question_id': 'r', 'value': '4'}, {'question_id': 't', 'value': 7}]})
+    assert resp.status_code == 201
+    stored = Response._get_collection().find_one({'_id': Response.objects(survey=survey_id).first().id})
+    assert [a['value'] for a in stored['answers']] == ['1', ['b'], 4, '7']
+
+    analytics = seeded_client.get(f'/surveys/{survey_id}/analytics', headers=headers).get_json()
+    assert analytics['r']['total_responses'] == 1 and analytics['r']['average'] == 4
+
+    resp = seeded_client.post(f'/surveys/{survey_id}/responses', headers=headers, json={'answers': [
+        {'question_id': 'r', 'value': '4.5'}]})
+    assert resp.status_code == 400
+    assert resp.get_json()['message'] == 'Invalid rating value for question r: 4.5'
+    resp = seeded_client.post(f'/surveys/{survey_id}/responses', headers=headers, json={'answers': [
+        {'question_id': 'cb', 'value': 'a'}]})
+    assert resp.get_json()['message'] == 'Checkbox answer must be a list for question cb'
+
+
+def test_normalize_answers_command(seeded_client, app):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    survey_id = _survey(seeded_client, {'Authorization': f'Bearer {token}'}, 'Legacy answers')
+    survey = Survey.objects(id=survey_id).first()
+    collection = Response._get_collection()
+    collection.insert_many([
+        {'survey': survey.id, 'answers': [{'question_id': 'r', 'value': '4'}, {'question_id': 'mc', 'value': 2}]},
+        {'survey': survey.id, 'answers': [{'question_id': 'r', 'value': 3}, {'question_id': 't', 'value': 'ok'}]},
+        {'survey': survey.id, 'answers': [{'question_id': 'r', 'value': 'n/a'}, {'question_id': 'cb', 'value': ['a', 'a']}]},
+    ])
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['db', 'normalize-answers', '--survey', survey_id, '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert 'Would update 2 of 3 responses' in result.output
+    assert collection.count_documents({'survey': survey.id, 'answers.value': '4'}) == 1
+
+    result = runner.invoke(args=['db', 'normalize-answers', '--survey', survey_id, '--batch-size', '1'])
+    assert f'{survey_id}: scanned 3, updated 2, left 1 invalid answers unchanged' in result.output
+    values = [[a['value'] for a in d['answers']] for d in collection.find({'survey': survey.id}).sort('_id', 1)]
+    assert values == [[4, '2'], [3, 'ok'], ['n/a', ['a']]]
+    assert 'Updated 0 of 3' in runner.invoke(args=['db', 'normalize-answers', '--survey', survey_id]).output
@@ -0,0 +1,107 @@
+import pytest
+from datetime import datetime, timedelta
+from random import Random
+from app import cache
+from app.models import ArchiveBatch, Answer, Job, Question, Response, Survey, User
+from app.utils import aggregates, datagen
+from app.tests.conftest import get_token
+
+QUESTIONS = [
+    Question(question_id='q1', type='multiple_choice', text='Pick one', order=1, choices=['a', 'b.c', 'd']),
+    Question(question_id='q2', type='checkbox', text='Pick some', order=2, choices=['x', 'y', 'z']),
+    Question(question_id='q3', type='rating', text='Rate', order=3, min=1, max=5),
+    Question(question_id='q4', type='text', text='Why?', order=4),
+]
+
+
+def test_merged_states_match_a_single_pass():
+    rng = Random(7)
+    types = {q.question_id: q.type for q in QUESTIONS}
+    survey = {'questions': [q.to_mongo().to_dict() for q in QUESTIONS]}
+    docs = [{'submitted_at': datetime(2024, 1, 1) + timedelta(hours=7 * i),
+             'answers': [{'question_id': q['question_id'], 'value': datagen.make_answer(q, rng)}
+                         for q in survey['questions']]}
+            for i in range(101)]
+
+    whole = aggregates.empty()
+    for doc in docs:
+        aggregates.add_response(whole, types, doc)
+    merged = aggregates.empty()
+    for chunk in (docs[:40], docs[40:90], docs[90:]):
+        part = aggregates.empty()
+        for doc in chunk:
+            aggregates.add_response(part, types, doc)
+        aggregates.merge(merged, aggregates.dump(part))
+
+    for interval in ('daily', 'weekly', 'monthly'):
+        assert aggregates.finalize(merged, QUESTIONS, interval) == aggregates.finalize(whole, QUESTIONS, interval)
+    result = aggregates.finalize(whole, QUESTIONS)
+    ratings = sorted(d['answers'][2]['value'] for d in docs)
+    assert result['q3']['median'] == ratings[50]
+    assert result['q3']['total_responses'] == 101
+    assert sum(result['q1']['counts'].values()) == 101
+
+
+@pytest.mark.parametrize('backend', ['file', 'collection'])
+def test_archive_moves_old_responses_and_keeps_their_analytics(seeded_client, app, monkeypatch, tmp_path, backend):
+    monkeypatch.setitem(app.config, 'ARCHIVE_BACKEND', backend)
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'ARCHIVE_BATCH_SIZE', 3)
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = seeded_client.post('/surveys/', headers=headers, json={
+        'title': f'Archive {backend}', 'retention_days': 30,
+        'questions': [q.to_mongo().to_dict() for q in QUESTIONS]})
+    assert resp.status_code == 201 and resp.get_json()['retention_days'] == 30
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    respondent = User.objects(username='analyst').first()
+    rng = Random(3)
+    now = datetime.utcnow()
+    for i in range(10):
+        Response(survey=survey, respondent=respondent if i % 2 else None,
+                 submitted_at=now - timedelta(days=60 - i * 5),
+                 answers=[Answer(question_id=q.question_id, value=datagen.make_answer(q.to_mongo(), rng))
+                          for q in QUESTIONS]).save()
+
+    analytics_url = f'/surveys/{survey.id}/analytics?time_series=1&include_archived=1'
+    before = seeded_client.get(analytics_url, headers=headers).get_json()
+    export_before = seeded_client.get(f'/surveys/{survey.id}/export?format=json', headers=headers).get_json()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['archive', '--survey', str(survey.id), '--dry-run'])
+    assert 'would archive 7 responses' in result.output
+    result = runner.invoke(args=['archive', '--survey', str(survey.id)])
+    assert result.exit_code == 0, result.output
+    assert 'archived 7 responses' in result.output
+    windowed = seeded_client.get(analytics_url + f'&from={(now - timedelta(days=40)).date()}', headers=headers)
+    assert windowed.status_code == 400
+    for series in ('&interval=hourly', '&tz=Europe/Berlin'):
+        resp = seeded_client.get(analytics_url + series, headers=headers)
+        assert resp.status_code == 400 and resp.get_json()['message'] == \
+            'Archived responses only have daily UTC time series.'
+    assert seeded_client.get(analytics_url + '&interval=weekly', headers=headers).status_code == 200
+
+    assert Response.objects(survey=survey).count() == 3
+    batches = list(ArchiveBatch.objects(survey=survey.id))
+    assert [b.count for b in batches] == [3, 3, 1]
+    assert all(b.location == 'collection' for b in batches) == (backend == 'collection')
+
+    cache.clear()
+    live = seeded_client.get(f'/surveys/{survey.id}/analytics?time_series=1', headers=headers).get_json()
+    assert live['q1']['total_responses'] == 3
+    assert seeded_client.get(analytics_url, headers=headers).get_json() == before
+
+    export_url = f'/surveys/{survey.id}/export?format=json'
+    assert len(seeded_client.get(export_url, headers=headers).get_json()) == 3
+    export_after = seeded_client.get(export_url + '&include_archived=1', headers=headers).get_json()
+    assert export_after == export_before  # live newest first, then the archive newest first
+
+    # Nothing left to move, running again changes nothing
+    assert 'archived 0 responses' in runner.invoke(args=['archive', '--survey', str(survey.id)]).output
+
+    # Purging the survey takes the archive with it
+    job_id = seeded_client.delete(f'/surveys/{survey.id}', headers=headers).get_json()['job_id']
+    job = Job.objects(id=job_id).first()
+    assert job.progress['archived_responses_deleted'] == 7
+    assert ArchiveBatch.objects(survey=survey.id).count() == 0
+    assert not list(tmp_path.rglob('*.gz'))
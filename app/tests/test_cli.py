@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+from app import swagger
+from app.cli import parse_importtime
+from app.swagger_config import build_openapi_spec, load_openapi_spec
+
+
+def test_blueprints_do_not_import_export_dependencies():
+    code = "import sys, app.blueprints; print('pandas' in sys.modules or 'openpyxl' in sys.modules)"
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == 'False'
+
+
+def test_precompiled_openapi_spec_is_up_to_date(app):
+    try:
+        generated = json.loads(json.dumps(build_openapi_spec(swagger)))
+    finally:
+        load_openapi_spec(swagger, app.config['OPENAPI_SPEC_PATH'])
+    with open(app.config['OPENAPI_SPEC_PATH']) as fh:
+        precompiled = json.load(fh)
+    assert generated == precompiled, "app/openapi.json is stale, run `flask openapi-build`"
+
+
+def test_apispec_served_from_precompiled_artifact(client, app):
+    resp = client.get('/apispec.json')
+    assert resp.status_code == 200
+    with open(app.config['OPENAPI_SPEC_PATH']) as fh:
+        assert resp.get_json() == json.load(fh)
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _io\n"
+        "import time:      2000 |       5000 | flask\n"
+    )
+    assert parse_importtime(stderr) == [('_io', 120, 120), ('flask', 2000, 5000)]
+
+
+def test_startup_profile_budget(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['startup-profile', '--json', '--limit', '5'])
+    assert result.exit_code == 0, result.output
+    report = json.loads(result.output)
+    assert report['total_ms'] > 0
+    assert len(report['modules']) == 5
+    result = runner.invoke(args=['startup-profile', '--budget-ms', '0.001'])
+    assert result.exit_code != 0
+    assert 'budget' in result.output
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from datetime import datetime
+from random import Random
+from app.models import Question, Response, Survey
+from app.utils import aggregates, datagen
+from app.utils.columnar import ColumnarUnsupported, SurveyColumns, flat_pipeline, load_columns, survey_state
+from app.tests.conftest import get_token
+
+
+def _questions(raw):
+    return [Question(**q) for q in raw]
+
+
+def _per_answer_state(questions, docs):
+    types = {q.question_id: q.type for q in questions}
+    state = aggregates.empty()
+    for doc in docs:
+        aggregates.add_response(state, types, doc)
+    return state
+
+
+def test_columns_match_the_per_answer_path():
+    rng = Random(11)
+    survey = datagen.make_survey(None, rng, questions=8, choices=6)
+    questions = _questions(survey['questions'])
+    docs = list(datagen.make_responses(survey, 3000, rng, skip_rate=0.3))
+    columns = SurveyColumns(questions)
+    for start in range(0, len(docs), 1000):
+        columns.add_chunk(docs[start:start + 1000])
+    columns.finish()
+
+    assert len(columns) == 3000
+    for interval in ('daily', 'weekly', 'monthly'):
+        assert aggregates.finalize(columns.state(), questions, interval) == \
+            aggregates.finalize(_per_answer_state(questions, docs), questions, interval)
+
+
+def test_column_layout():
+    questions = _questions([
+        {'question_id': 'mc', 'type': 'multiple_choice', 'text': 'Pick', 'order': 1, 'choices': ['a', 'b']},
+        {'question_id': 'cb', 'type': 'checkbox', 'text': 'Pick some', 'order': 2, 'choices': ['x', 'y', 'z']},
+        {'question_id': 'r', 'type': 'rating', 'text': 'Rate', 'order': 3},
+        {'question_id': 't', 'type': 'text', 'text': 'Why?', 'order': 4},
+    ])
+    docs = [
+        {'submitted_at': datetime(2024, 3, 2, 23, 59), 'answers': [
+            {'question_id': 'mc', 'value': 'b'}, {'question_id': 'cb', 'value': ['z', 'x']},
+            {'question_id': 'r', 'value': 4}, {'question_id': 't', 'value': 'fine'}]},
+        {'submitted_at': datetime(2024, 3, 1), 'answers': [
+            {'question_id': 'cb', 'value': []}, {'question_id': 'r', 'value': 'n/a'}]},
+    ]
+    columns = SurveyColumns(questions).add_chunk(docs).finish().columns
+    assert columns['mc']['codes'].tolist() == [1, -1]
+    assert columns['cb']['masks'].tolist() == [0b101, 0] and columns['cb']['answered'].tolist() == [True, True]
+    assert columns['r']['values'].dtype == np.int8
+    assert columns['r']['answered'].tolist() == [True, False]
+    assert columns['t']['lengths'].tolist() == [4, -1]
+    assert [str(d) for d in columns['submitted_day']] == ['2024-03-02', '2024-03-01']
+
+
+@pytest.mark.parametrize('qtype,value', [
+    ('rating', 4.0), ('multiple_choice', 'removed choice'), ('checkbox', ['x', 'x']), ('checkbox', 'x'),
+])
+def test_unsupported_answers_fall_back(qtype, value):
+    question = Question(question_id='q', type=qtype, text='?', order=1, choices=['x', 'y'])
+    with pytest.raises(ColumnarUnsupported):
+        SurveyColumns([question]).add_chunk([{'answers': [{'question_id': 'q', 'value': value}]}])
+
+
+def test_survey_state_reads_mongo_and_falls_back(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    rng = Random(5)
+    raw = datagen.make_survey(None, rng, questions=4, choices=3)
+    resp = seeded_client.post('/surveys/', headers={'Authorization': f'Bearer {token}'},
+                              json={'title': 'Columnar', 'questions': raw['questions']})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    raw['_id'] = survey.id
+    datagen.insert_batches(Response._get_collection(), datagen.make_responses(raw, 200, rng), 50)
+    docs = list(Response.objects(survey=survey.id).only('submitted_at', 'answers').as_pymongo())
+
+    assert len(load_columns(survey, chunk_size=64)) == 200
+    assert survey_state(survey) == _per_answer_state(survey.questions, docs)
+    # Only the wanted answers are read, and _id only when text samples need it
+    wanted = [q for q in survey.questions if q.type in ('multiple_choice', 'rating')]
+    flat = list(Response._get_collection().aggregate(flat_pipeline(survey, questions=wanted, with_ids=False)))
+    assert len(flat) == 200 and all('_id' not in doc for doc in flat)
+    assert {qid for doc in flat for qid in doc['qids']} == {q.question_id for q in wanted}
+    assert load_columns(survey, questions=wanted).state()['questions'] == \
+        {q.question_id: _per_answer_state(survey.questions, docs)['questions'][q.question_id] for q in wanted}
+
+    # A legacy float rating can't be stored as int8, the per-answer path takes over
+    rating = next(q for q in survey.questions if q.type == 'rating')
+    Response._get_collection().insert_one({'survey': survey.id, 'submitted_at': datetime(2024, 1, 1),
+                                           'answers': [{'question_id': rating.question_id, 'value': 2.5}]})
+    with pytest.raises(ColumnarUnsupported):
+        load_columns(survey)
+    state = survey_state(survey)
+    assert state['responses'] == 201 and state['questions'][rating.question_id]['counts'][2.5] == 1
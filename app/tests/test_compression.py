@@ -0,0 +1,63 @@
+import gzip
+import pytest
+from app import compress
+from app.models import Survey
+from app.tests.conftest import get_token
+
+
+def test_large_json_is_gzipped(seeded_client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 100)
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    plain = seeded_client.get('/surveys/?per_page=50', headers=headers)
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    resp = seeded_client.get('/surveys/?per_page=50', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert gzip.decompress(resp.data) == plain.data
+
+
+def test_small_responses_are_not_compressed(seeded_client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 10 ** 9)
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    resp = seeded_client.get('/surveys/', headers={'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert 'Content-Encoding' not in resp.headers
+
+
+def test_streamed_response_is_compressed(app):
+    def rows():
+        yield 'id,value\n'
+        for i in range(1000):
+            yield f'{i},{i * i}\n'
+    with app.test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+        response = app.response_class(rows(), mimetype='text/csv')
+        response = compress.after_request(response)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        body = b''.join(response.response)
+    assert gzip.decompress(body).decode() == ''.join(rows())
+
+
+@pytest.mark.usefixtures('clean_and_seed')
+def test_cached_analytics_are_stored_compressed(seeded_client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 100)
+    survey = Survey.objects(title='Test Survey 1').first()
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    url = f'/surveys/{survey.id}/analytics?compressed=1'
+    miss = seeded_client.get(url, headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert miss.headers['X-Cache'] == 'MISS'
+    assert miss.headers['Content-Encoding'] == 'gzip'
+    hit = seeded_client.get(url, headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert hit.headers['Content-Encoding'] == 'gzip'
+    assert hit.data == miss.data
+    # Clients that do not accept gzip get the decompressed payload
+    plain = seeded_client.get(url, headers=headers)
+    assert plain.headers['X-Cache'] == 'HIT'
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == gzip.decompress(hit.data)
+    assert str(survey.questions[0].question_id) in plain.get_json()
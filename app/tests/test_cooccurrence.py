@@ -0,0 +1,73 @@
+from collections import Counter
+from itertools import combinations
+from random import Random
+import numpy as np
+from app.models import Response, Survey
+from app.utils import cooccurrence
+from app.tests.conftest import get_token
+
+CHOICES = [f'tool{i}' for i in range(40)]
+
+
+def _selections(count, seed=7):
+    rng = Random(seed)
+    weights = [1 / (i + 1) for i in range(len(CHOICES))]
+    return [sorted(set(rng.choices(CHOICES, weights, k=rng.randint(0, 4))), key=CHOICES.index) for _ in range(count)]
+
+
+def _expected(selections):
+    matrix = np.zeros((len(CHOICES), len(CHOICES)), dtype=np.int64)
+    for selected in selections:
+        for a in selected:
+            matrix[CHOICES.index(a), CHOICES.index(a)] += 1
+        for a, b in combinations(selected, 2):
+            matrix[CHOICES.index(a), CHOICES.index(b)] += 1
+            matrix[CHOICES.index(b), CHOICES.index(a)] += 1
+    return matrix.tolist(), Counter(map(tuple, selections))
+
+
+def test_co_occurrence(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    questions = [{'question_id': 'tools', 'type': 'checkbox', 'text': 'Tools?', 'order': 1, 'choices': CHOICES},
+                 {'question_id': 'plan', 'type': 'multiple_choice', 'text': 'Plan', 'order': 2,
+                  'choices': ['Free', 'Pro']}]
+    resp = seeded_client.post('/surveys/', headers=headers, json={'title': 'Tools', 'questions': questions})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    selections = _selections(500)
+    Response._get_collection().insert_many([
+        {'survey': survey.id, 'answers': [{'question_id': 'tools', 'value': selected},
+                                          {'question_id': 'plan', 'value': 'Pro' if i % 2 else 'Free'}]}
+        for i, selected in enumerate(selections)])
+    url = f'/surveys/{survey.id}/analytics?co_occurrence=1'
+
+    result = seeded_client.get(url, headers=headers).get_json()
+    assert 'co_occurrence' not in result['plan']
+    summary = result['tools']['co_occurrence']
+    matrix, combos = _expected(selections)
+    assert summary['choices'] == CHOICES and summary['matrix'] == matrix
+    top = summary['top_combinations']
+    assert len(top) == cooccurrence.TOP_COMBINATIONS
+    assert [c['count'] for c in top] == [n for _, n in combos.most_common(cooccurrence.TOP_COMBINATIONS)]
+    assert all(combos[tuple(c['choices'])] == c['count'] for c in top)
+
+    # Segments and answers the columnar layout rejects give the same matrix
+    pro = seeded_client.get(url + '&answer=plan:Pro', headers=headers).get_json()['tools']['co_occurrence']
+    assert pro['matrix'] == _expected(selections[1::2])[0]
+    Response._get_collection().insert_one({'survey': survey.id, 'answers': [
+        {'question_id': 'tools', 'value': 'tool0'}]})
+    legacy = cooccurrence.co_occurrence(survey, survey.questions[:1])['tools']
+    matrix[0][0] += 1
+    assert legacy['matrix'] == matrix
+    assert seeded_client.get(url + '&include_archived=1', headers=headers).status_code == 400
+
+
+def test_matrix_is_chunked():
+    bits = np.random.default_rng(1).random((1000, 12)) < 0.3
+    counts = np.arange(1, 1001)
+    expected = (bits.astype(np.int64) * counts[:, None]).T @ bits.astype(np.int64)
+    saved, cooccurrence.CHUNK_SIZE = cooccurrence.CHUNK_SIZE, 64
+    try:
+        assert (cooccurrence.matrix(bits, counts) == expected).all()
+    finally:
+        cooccurrence.CHUNK_SIZE = saved
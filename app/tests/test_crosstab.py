@@ -0,0 +1,94 @@
+import math
+import pandas as pd
+import pytest
+from random import Random
+from app.models import Answer, Response, Survey
+from app.utils.crosstab import chi_square, crosstab
+from app.tests.conftest import get_token
+
+QUESTIONS = [
+    {'question_id': 'plan', 'type': 'multiple_choice', 'text': 'Plan', 'order': 1, 'choices': ['Free', 'Pro', 'Team']},
+    {'question_id': 'tools', 'type': 'checkbox', 'text': 'Tools', 'order': 2, 'choices': ['a', 'b', 'c']},
+    {'question_id': 'nps', 'type': 'rating', 'text': 'Recommend?', 'order': 3},
+    {'question_id': 'why', 'type': 'text', 'text': 'Why?', 'order': 4},
+]
+
+
+def _survey(client, headers, count, seed=5):
+    resp = client.post('/surveys/', headers=headers, json={'title': 'Crosstab', 'questions': QUESTIONS})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    rng = Random(seed)
+    rows = []
+    for _ in range(count):
+        plan = rng.choice(['Free', 'Pro', None])
+        tools = rng.sample(['a', 'b', 'c'], rng.randint(0, 3))
+        nps = rng.randint(0, 3) + (plan == 'Pro') * 2
+        answers = [Answer(question_id='tools', value=tools), Answer(question_id='nps', value=nps)]
+        if plan:
+            answers.append(Answer(question_id='plan', value=plan))
+        Response(survey=survey, answers=answers).save()
+        rows.append({'plan': plan, 'tools': tools, 'nps': nps})
+    return survey, pd.DataFrame(rows)
+
+
+@pytest.fixture
+def headers(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_crosstab_matches_pandas(seeded_client, headers):
+    survey, frame = _survey(seeded_client, headers, 200)
+    resp = seeded_client.get(f'/surveys/{survey.id}/analytics/crosstab?rows=plan&cols=nps,tools&chi_square=1',
+                             headers=headers)
+    assert resp.status_code == 200
+    by_rating, by_tools = resp.get_json()['tables']
+
+    expected = pd.crosstab(frame['plan'], frame['nps'])
+    assert by_rating['row_labels'] == ['Free', 'Pro', 'Team'] and by_rating['col_labels'] == list(expected.columns)
+    assert by_rating['counts'][:2] == expected.values.tolist() and by_rating['counts'][2] == [0] * 6
+    assert by_rating['total_responses'] == int(frame['plan'].notna().sum())
+    statistic = by_rating['chi_square']
+    assert statistic['statistic'] == pytest.approx(chi_square(expected.values)['statistic'])
+    assert statistic['dof'] == 5 and statistic['p_value'] < 0.001
+
+    # Checkbox questions count a response under every selected choice, and get no test
+    exploded = frame.explode('tools').dropna()
+    expected = pd.crosstab(exploded['plan'], exploded['tools'])
+    assert by_tools['counts'][:2] == expected.values.tolist()
+    assert by_tools['chi_square'] is None
+
+    # The same table with answers the columnar layout can't read
+    Response._get_collection().insert_one({'survey': survey.id, 'answers': [
+        {'question_id': 'plan', 'value': 'Legacy'}, {'question_id': 'nps', 'value': 2.0}]})
+    legacy = crosstab(survey, survey.questions[:1], survey.questions[2:3])[0]
+    assert legacy['row_labels'] == ['Free', 'Pro', 'Team', 'Legacy']
+    assert legacy['counts'][3][legacy['col_labels'].index(2)] == 1
+    assert legacy['total_responses'] == by_rating['total_responses'] + 1
+
+
+def test_chi_square():
+    # Expected counts 8.5 and 6.5; with one degree of freedom the p-value is erfc(sqrt(statistic / 2))
+    result = chi_square([[12, 5], [3, 10]])
+    statistic = 2 * 3.5 ** 2 * (1 / 8.5 + 1 / 6.5)
+    assert result['statistic'] == pytest.approx(statistic)
+    assert result['p_value'] == pytest.approx(math.erfc(math.sqrt(statistic / 2)))
+    assert result['dof'] == 1 and result['cramers_v'] == pytest.approx(math.sqrt(statistic / 30))
+    two = chi_square([[30, 1], [2, 40], [10, 10]])
+    assert two['dof'] == 2 and two['p_value'] == pytest.approx(math.exp(-two['statistic'] / 2))
+    assert chi_square([[4, 0], [0, 0]]) is None
+
+
+def test_crosstab_filters_and_errors(seeded_client, headers):
+    survey, frame = _survey(seeded_client, headers, 40, seed=6)
+    url = f'/surveys/{survey.id}/analytics/crosstab'
+    pro = seeded_client.get(url + '?rows=tools&cols=nps&answer=plan:Pro', headers=headers).get_json()['tables'][0]
+    assert pro['total_responses'] == int((frame['plan'] == 'Pro').sum())
+    assert seeded_client.get(url + '?rows=tools&cols=nps&answer=plan:Pro', headers=headers).headers['X-Cache'] == 'HIT'
+
+    for query, message in [('?rows=plan', 'cols must list at least one question id.'),
+                           ('?rows=plan&cols=missing', 'Unknown question: missing'),
+                           ('?rows=plan&cols=why', 'Question why is a text question'),
+                           ('?rows=plan&cols=nps&include_archived=1', 'Archived responses')]:
+        resp = seeded_client.get(url + query, headers=headers)
+        assert resp.status_code == 400 and resp.get_json()['message'].startswith(message)
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from random import Random
+from app.models import Response, Survey, User
+from app.utils import datagen
+
+
+def test_generated_documents_load_as_models():
+    rng = Random(1)
+    [owner] = datagen.make_users(1, rng, prefix='owner', role='admin')
+    survey = datagen.make_survey(owner['_id'], rng, questions=8)
+    responses = list(datagen.make_responses(survey, 200, rng, respondent_ids=[owner['_id']]))
+
+    User._from_son(owner).validate()
+    survey_doc = Survey._from_son(survey)
+    survey_doc.validate()
+    questions = {q.question_id: q for q in survey_doc.questions}
+    for raw in responses:
+        response = Response._from_son(raw)
+        answered = {a.question_id for a in response.answers}
+        assert {qid for qid, q in questions.items() if q.required} <= answered
+        for answer in response.answers:
+            question = questions[answer.question_id]
+            if question.type == 'multiple_choice':
+                assert answer.value in question.choices
+            elif question.type == 'checkbox':
+                assert set(answer.value) <= set(question.choices)
+            elif question.type == 'rating':
+                assert question.min <= answer.value <= question.max
+        # ObjectIds carry the submission time, so _id order follows submitted_at
+        assert raw['_id'].generation_time.replace(tzinfo=None) <= raw['submitted_at']
+
+
+def test_generation_is_deterministic():
+    def generate(seed):
+        rng = Random(seed)
+        survey = datagen.make_survey(None, rng, questions=5)
+        return survey, list(datagen.make_responses(survey, 50, rng, start=survey['created_at'], end=survey['created_at']))
+    first, second = generate(7), generate(7)
+    assert first[0]['questions'] == second[0]['questions']
+    assert [r['answers'] for r in first[1]] == [r['answers'] for r in second[1]]
+    assert [r['_id'] for r in first[1]] == [r['_id'] for r in second[1]]
+    assert generate(8)[1] != first[1]
+
+
+def test_response_chunks_do_not_depend_on_worker_assignment():
+    survey = datagen.make_survey(None, Random(3), questions=4)
+    first = list(datagen.make_responses(survey, 20, datagen.chunk_rng(5, survey['_id'], 1)))
+    list(datagen.make_responses(survey, 20, datagen.chunk_rng(5, survey['_id'], 0)))  # another chunk in between
+    again = list(datagen.make_responses(survey, 20, datagen.chunk_rng(5, survey['_id'], 1)))
+    assert [r['_id'] for r in first] == [r['_id'] for r in again]
+
+
+def test_bulk_seed_is_deterministic(app):
+    from mongoengine.connection import get_db
+    client = get_db().client
+    runs = []
+    for name in ('survey_api_test_seed_a', 'survey_api_test_seed_b'):
+        client.drop_database(name)
+        db = client[name]
+        try:
+            datagen.bulk_seed(db, None, users=5, admins=2, surveys=2, questions=4, responses=30, workers=0,
+                              chunk_size=16, seed=4)
+            runs.append({collection: list(db[collection].find().sort('_id'))
+                         for collection in ('users', 'surveys', 'responses')})
+        finally:
+            client.drop_database(name)
+    assert len(runs[0]['responses']) == 60
+    assert runs[0] == runs[1]
+    # Anchored to SEED_END rather than the clock, so a run tomorrow gives the same documents too
+    start = datagen.SEED_END - timedelta(days=90)
+    assert all(u['created_at'] == start for u in runs[0]['users'])
+    assert all(start <= r['submitted_at'] < datagen.SEED_END for r in runs[0]['responses'])
+
+
+def test_seed_bulk_needs_an_admin(app):
+    result = app.test_cli_runner().invoke(args=['seed-bulk', '--admins', '0', '--workers', '0'])
+    assert result.exit_code == 2 and '--admins' in result.output
+
+
+def test_seed_bulk_command(app):
+    result = app.test_cli_runner().invoke(args=[
+        'seed-bulk', '--users', '20', '--admins', '2', '--surveys', '3', '--questions', '5',
+        '--responses', '40', '--workers', '0', '--batch-size', '16', '--seed', '991'
+    ])
+    try:
+        assert result.exit_code == 0, result.output
+        assert 'Inserted 22 users, 3 surveys and 120 responses' in result.output
+        admins = User.objects(username__startswith='seed991admin')
+        surveys = Survey.objects(owner__in=admins)
+        assert len(surveys) == 3 and all(len(s.questions) == 5 for s in surveys)
+        assert Response.objects(survey__in=surveys).count() == 120
+    finally:
+        admins = User.objects(username__startswith='seed991')
+        surveys = Survey.objects(owner__in=admins)
+        Response.objects(survey__in=surveys).delete()
+        surveys.delete()
+        admins.delete()
@@ -0,0 +1,63 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+from app.models import Answer, Question, Response, Survey, User
+from app.utils.filters import response_filter
+from app.tests.conftest import get_token
+
+QUESTIONS = [
+    {'question_id': 'plan', 'type': 'multiple_choice', 'text': 'Plan', 'order': 1, 'choices': ['Free', 'Pro']},
+    {'question_id': 'tools', 'type': 'checkbox', 'text': 'Tools', 'order': 2, 'choices': ['a', 'b', 'c']},
+    {'question_id': 'nps', 'type': 'rating', 'text': 'Recommend?', 'order': 3},
+]
+
+
+def test_filters_compile_to_a_match():
+    survey = Survey(questions=[Question(**q) for q in QUESTIONS])
+    query = response_filter(survey, MultiDict([('answer', 'nps:9'), ('answer', 'tools:b'),
+                                               ('respondent', '64b000000000000000000001')]))
+    assert query['$and'][1:] == [
+        {'answers': {'$elemMatch': {'question_id': 'nps', 'value': 9}}},
+        {'answers': {'$elemMatch': {'question_id': 'tools', 'value': 'b'}}},
+    ]
+    assert str(query['$and'][0]['respondent']) == '64b000000000000000000001'
+    assert response_filter(survey, MultiDict()) == {}
+
+
+@pytest.mark.parametrize('args,message', [
+    ({'answer': 'nps'}, 'answer filters look like <question id>:<value>, got: nps'),
+    ({'answer': 'missing:1'}, 'Unknown question in answer filter: missing'),
+    ({'answer': 'nps:great'}, 'Invalid value for question nps in answer filter: great'),
+    ({'respondent': 'someone'}, 'Invalid respondent id in: someone'),
+])
+def test_invalid_filters(args, message):
+    survey = Survey(questions=[Question(**q) for q in QUESTIONS])
+    with pytest.raises(ValueError, match=message):
+        response_filter(survey, MultiDict(args))
+
+
+def test_segmented_analytics(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = seeded_client.post('/surveys/', headers=headers, json={'title': 'Segments', 'questions': QUESTIONS})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    analyst = User.objects(username='analyst').first()
+    for respondent, plan, tools, nps in [(analyst, 'Pro', ['a', 'b'], 9), (None, 'Pro', ['c'], 7),
+                                         (None, 'Free', ['b'], 9), (analyst, 'Free', [], 3)]:
+        Response(survey=survey, respondent=respondent, answers=[
+            Answer(question_id='plan', value=plan), Answer(question_id='tools', value=tools),
+            Answer(question_id='nps', value=nps)]).save()
+    url = f'/surveys/{survey.id}/analytics'
+
+    pro = seeded_client.get(url + '?answer=plan:Pro', headers=headers).get_json()
+    assert pro['plan']['counts'] == {'Pro': 2} and pro['nps']['average'] == 8
+    both = seeded_client.get(url + '?answer=tools:b&answer=nps:9', headers=headers).get_json()
+    assert both['plan']['counts'] == {'Pro': 1, 'Free': 1}
+    mine = seeded_client.get(url + f'?respondent={analyst.id}&time_series=1&interval=hourly', headers=headers)
+    assert mine.get_json()['nps']['distribution'] == {'9': 1, '3': 1}
+    assert sum(b['count'] for b in mine.get_json()['time_series']) == 2
+
+    # The same filters in another order are served from the same cache entry
+    swapped = seeded_client.get(url + '?answer=nps:9&answer=tools:b', headers=headers)
+    assert swapped.headers['X-Cache'] == 'HIT'
+    assert seeded_client.get(url + '?answer=plan:Pro&include_archived=1', headers=headers).status_code == 400
+    assert seeded_client.get(url + '?answer=plan', headers=headers).status_code == 400
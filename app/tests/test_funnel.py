@@ -0,0 +1,46 @@
+from app.models import Response, Survey
+from app.tests.conftest import get_token
+
+QUESTIONS = [
+    {'question_id': 'q1', 'type': 'multiple_choice', 'text': 'Plan', 'order': 1, 'choices': ['Free', 'Pro'],
+     'required': True},
+    {'question_id': 'q3', 'type': 'text', 'text': 'Why?', 'order': 3},
+    {'question_id': 'q2', 'type': 'rating', 'text': 'Recommend?', 'order': 2},
+]
+
+
+def _answers(**values):
+    return [{'question_id': qid, 'value': value} for qid, value in values.items()]
+
+
+def test_funnel(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = seeded_client.post('/surveys/', headers=headers, json={'title': 'Funnel', 'questions': QUESTIONS})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    patterns = [(_answers(q1='Pro', q2=5, q3='fine'), 3),
+                (_answers(q3='fine', q2=4, q1='Free'), 1),  # answers out of order
+                (_answers(q1='Pro', q3='meh'), 2),  # skipped q2
+                (_answers(q1='Free', q2=2), 2),  # stopped after q2
+                (_answers(q1='Free', q2=None, gone='old'), 1),  # null answer, removed question
+                ([], 1)]
+    Response._get_collection().insert_many([{'survey': survey.id, 'answers': answers}
+                                            for answers, n in patterns for _ in range(n)])
+    url = f'/surveys/{survey.id}/analytics/funnel'
+
+    result = seeded_client.get(url, headers=headers).get_json()
+    assert result['total_responses'] == 10
+    assert [q['question_id'] for q in result['questions']] == ['q1', 'q2', 'q3']
+    assert [(q['answered'], q['reached'], q['stopped']) for q in result['questions']] == \
+        [(9, 9, 1), (6, 8, 2), (6, 6, 6)]
+    assert result['questions'][1]['answer_rate'] == 60 and result['questions'][0]['required']
+    assert result['answer_counts'] == {'0': 1, '1': 1, '2': 4, '3': 4}
+    assert result['skip_patterns'] == [
+        {'skipped': [], 'count': 4}, {'skipped': ['q2'], 'count': 2}, {'skipped': ['q3'], 'count': 2},
+        {'skipped': ['q1', 'q2', 'q3'], 'count': 1}, {'skipped': ['q2', 'q3'], 'count': 1}]
+
+    pro = seeded_client.get(url + '?answer=q1:Pro', headers=headers)
+    assert pro.get_json()['total_responses'] == 5
+    assert seeded_client.get(url + '?answer=q1:Pro', headers=headers).headers['X-Cache'] == 'HIT'
+    assert seeded_client.get(url + '?include_archived=1', headers=headers).status_code == 400
+    assert seeded_client.get(url + '?from=yesterday', headers=headers).status_code == 400
@@ -0,0 +1,35 @@
+from app.models import Survey
+from app.utils.indexes import declared_indexes, index_report
+
+
+def test_models_declare_compound_and_partial_indexes():
+    from app.models import Response
+    indexes = declared_indexes(Response)
+    assert indexes['survey_1_submitted_at_-1'] == ([('survey', 1), ('submitted_at', -1)], {})
+    keys, options = indexes['respondent_1_partial']
+    assert options['partialFilterExpression'] == {'respondent': {'$exists': True}}
+    assert 'owner_1_created_at_-1' in declared_indexes(Survey)
+    assert Response._meta['auto_create_index'] is False
+
+
+def test_ensure_indexes_command(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['db', 'ensure-indexes'])
+    assert result.exit_code == 0, result.output
+    assert ': create ' not in result.output  # the app fixture already built them
+    assert all(not c['missing'] for c in index_report())
+
+    collection = Survey._get_collection()
+    collection.create_index('title', name='title_1')
+    collection.create_index('created_at', name='created_at_1')
+    report = {c['collection']: c for c in index_report()}['surveys']
+    assert report['unmanaged'] == ['title_1', 'created_at_1']
+
+    result = runner.invoke(args=['db', 'ensure-indexes', '--drop-unmanaged', '--dry-run'])
+    assert 'surveys: would drop title_1' in result.output
+    assert 'title_1' in collection.index_information()
+
+    result = runner.invoke(args=['db', 'ensure-indexes', '--drop-unmanaged'])
+    assert result.exit_code == 0, result.output
+    assert 'surveys: drop title_1' in result.output
+    assert set(collection.index_information()) == {'_id_', 'created_at_-1', 'owner_1_created_at_-1'}
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+from flask import g
+from app import instrumentation
+from app.tests.conftest import get_token
+
+METRICS_AUTH = {'Authorization': 'Bearer test-metrics-token'}
+
+
+def test_metrics_endpoint_reports_requests(seeded_client):
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    resp = seeded_client.get('/surveys/', headers={'Authorization': f'Bearer {token}'})
+    assert resp.status_code == 200
+    resp = seeded_client.get('/metrics', headers=METRICS_AUTH)
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    body = resp.get_data(as_text=True)
+    assert 'survey_api_requests_total{endpoint="/surveys/",method="GET",status="200"}' in body
+    assert 'survey_api_request_duration_seconds_bucket{endpoint="/surveys/",le="0.005",method="GET"}' in body
+    assert 'survey_api_response_size_bytes_count{endpoint="/surveys/",method="GET"}' in body
+    # The JWT blocklist check goes through the instrumented redis_client
+    assert 'survey_api_redis_command_duration_seconds_count{command="EXISTS"}' in body
+
+
+def test_metrics_endpoint_needs_the_token(client, app, monkeypatch):
+    assert client.get('/metrics').status_code == 401
+    resp = client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+    assert resp.status_code == 401 and resp.headers['WWW-Authenticate'] == 'Bearer'
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+    assert client.get('/metrics', headers=METRICS_AUTH).status_code == 403
+
+
+def test_server_timing_header(seeded_client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SERVER_TIMING_HEADER', True)
+    token = get_token(seeded_client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    resp = seeded_client.get('/surveys/', headers={'Authorization': f'Bearer {token}'})
+    timing = resp.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'mongo;dur=' in timing
+    assert 'redis;dur=' in timing and '1 commands' in timing
+
+
+def test_mongo_listener_accumulates_per_request(app):
+    listener = instrumentation._listener
+    with app.test_request_context('/surveys/'):
+        instrumentation.before_request()
+        for micros in (1500, 2500):
+            listener.succeeded(SimpleNamespace(command_name='find', duration_micros=micros))
+        listener.failed(SimpleNamespace(command_name='insert', duration_micros=1000))
+        assert g.request_stats.mongo_commands == 3
+        assert abs(g.request_stats.mongo_seconds - 0.005) < 1e-9
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.models import Job, Response, Survey, User
+from app.utils.purge import _bump, batched, resume_jobs, run_job
+from app.tests.conftest import get_token
+
+
+def test_batched_works_in_id_ranges(app):
+    collection = Response._get_collection().database['purge_batch_test']
+    collection.insert_many([{'n': i, 'keep': i % 3 == 0} for i in range(10)])
+    assert list(batched(collection, {'keep': True}, batch_size=3, update={'$set': {'seen': True}})) == [3, 1]
+    assert list(batched(collection, {'keep': False}, batch_size=4)) == [4, 2]
+    assert sorted(d['n'] for d in collection.find({'seen': True})) == [0, 3, 6, 9]
+    collection.drop()
+
+
+def test_user_delete_is_soft_then_purged_in_batches(seeded_client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PURGE_BATCH_SIZE', 2)
+    admin_token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    admin_headers = {'Authorization': f'Bearer {admin_token}'}
+    owner_token = get_token(seeded_client, 'purgeowner', 'purgeowner@example.com', 'password123', 'admin')
+    respondent_token = get_token(seeded_client, 'purgeresp', 'purgeresp@example.com', 'password123', 'respondent')
+
+    resp = seeded_client.post('/surveys/', headers={'Authorization': f'Bearer {owner_token}'}, json={
+        'title': 'Purge me', 'questions': [{'question_id': 'q1', 'type': 'text', 'text': 'Why?', 'order': 1}]
+    })
+    survey_id = resp.get_json()['id']
+    for i in range(3):
+        resp = seeded_client.post(f'/surveys/{survey_id}/responses', headers={'Authorization': f'Bearer {respondent_token}'},
+                                  json={'answers': [{'question_id': 'q1', 'value': f'answer {i}'}]})
+        assert resp.status_code == 201
+    respondent = User.objects(username='purgeresp').first()
+    owner = User.objects(username='purgeowner').first()
+
+    # The respondent's answers survive their deletion, anonymised
+    resp = seeded_client.delete(f'/users/{respondent.id}', headers=admin_headers)
+    assert resp.status_code == 202
+    job = seeded_client.get(resp.get_json()['status_url'], headers=admin_headers).get_json()
+    assert job['status'] == 'done' and job['kind'] == 'purge_user'
+    assert job['progress'] == {'responses_nullified': 3, 'users_deleted': 1}
+    assert User.all_objects(id=respondent.id).first() is None
+    assert Response.objects(survey=survey_id).count() == 3
+    assert all(r.respondent is None for r in Response.objects(survey=survey_id))
+
+    # The owner's surveys and their responses go with the owner
+    resp = seeded_client.delete(f'/users/{owner.id}', headers=admin_headers)
+    job_id = resp.get_json()['job_id']
+    job = Job.objects(id=job_id).first()
+    assert job.status == 'done'
+    assert job.progress == {'responses_deleted': 3, 'surveys_deleted': 1, 'users_deleted': 1}
+    assert Survey.all_objects(id=survey_id).first() is None
+    assert Response.objects(survey=survey_id).count() == 0
+    jobs = seeded_client.get('/admin/jobs?status=done', headers=admin_headers).get_json()
+    assert job_id in [j['id'] for j in jobs]
+    for limit in ('abc', '0'):
+        resp = seeded_client.get(f'/admin/jobs?limit={limit}', headers=admin_headers)
+        assert resp.status_code == 400 and resp.get_json()['message'].startswith('limit must be a positive integer')
+
+
+def test_soft_deleted_survey_is_hidden_until_purged(seeded_client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOBS_RUN_INLINE', False)
+    monkeypatch.setattr('app.utils.purge.threading.Thread.start', lambda self: None)  # keep the job pending
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    survey_id = seeded_client.post('/surveys/', headers=headers, json={'title': 'Hidden'}).get_json()['id']
+
+    resp = seeded_client.delete(f'/surveys/{survey_id}', headers=headers)
+    assert resp.status_code == 202
+    assert seeded_client.get(f'/surveys/{survey_id}', headers=headers).status_code == 404
+    assert survey_id not in [s['id'] for s in seeded_client.get('/surveys/?per_page=100', headers=headers).get_json()['items']]
+    assert Survey.all_objects(id=survey_id).first().deleted_at is not None
+    assert Job.objects(id=resp.get_json()['job_id']).first().status == 'pending'
+
+    result = app.test_cli_runner().invoke(args=['jobs', 'resume'])
+    assert result.exit_code == 0, result.output
+    assert 'purge_survey' in result.output and 'done' in result.output
+    assert Survey.all_objects(id=survey_id).first() is None
+
+
+def test_running_jobs_are_only_taken_over_once_stale(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOB_LEASE_SECONDS', 60)
+    target = ObjectId()  # nothing to purge, the job only has to run
+    live = Job(kind='purge_survey', target=target, status='running', updated_at=datetime.utcnow()).save()
+    stale = Job(kind='purge_survey', target=target, status='running',
+                updated_at=datetime.utcnow() - timedelta(seconds=120)).save()
+    try:
+        assert run_job(live.id).status == 'running'
+        assert {job.id: job.status for job in resume_jobs()}[stale.id] == 'done'
+        assert Job.objects(id=live.id).first().status == 'running'
+        assert Job.objects(id=stale.id).first().started_at is not None
+    finally:
+        Job.objects(id__in=[live.id, stale.id]).delete()
+
+
+def test_progress_counters_add_up_across_runs(app):
+    job = Job(kind='purge_survey', target=ObjectId(), progress={'responses_deleted': 5}).save()
+    try:
+        # Two runs each holding their own copy of the job
+        first, second = Job.objects(id=job.id).first(), Job.objects(id=job.id).first()
+        _bump(first, 'responses_deleted', 2)
+        _bump(second, 'responses_deleted', 3)
+        _bump(second, 'surveys_deleted', 1)
+        assert Job.objects(id=job.id).first().progress == {'responses_deleted': 10, 'surveys_deleted': 1}
+    finally:
+        job.delete()
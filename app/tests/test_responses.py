@@ -1,5 +1,7 @@
 import pytest
 from app.models import User, Survey, Question, Response, Answer
+from app.schemas import ResponseSchema, dump_response
+from app.utils.content import packb, unpackb
 from datetime import datetime, timedelta
 import csv
 import io
@@ -294,4 +296,44 @@ def test_response_export(seeded_client, app):
     assert resp_json.mimetype == 'application/json'
     json_data = resp_json.get_json()
     with app.app_context():
-        assert len(json_data) == Response.objects(survey=survey).count() 
\ No newline at end of file
+        assert len(json_data) == Response.objects(survey=survey).count()
+
+
+def test_response_compiled_dump_matches_schema(seeded_client, app):
+    with app.app_context():
+        survey = Survey.objects(title='Test Survey 1').first()
+        for response in Response.objects(survey=survey):
+            raw = Response.objects(id=response.id).as_pymongo().first()
+            assert dump_response(raw) == {'id': str(response.id), **ResponseSchema().dump(response)}
+
+def test_response_msgpack_negotiation(client):
+    admin_token = get_token(client, 'admin', 'admin@example.com', 'adminpass', 'admin')
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    resp = client.post('/surveys/', json={
+        'title': 'MessagePack Survey',
+        'questions': [
+            {'question_id': 'mc1', 'type': 'multiple_choice', 'text': 'Pick', 'order': 1, 'choices': ['A', 'B'], 'required': True},
+            {'question_id': 'r1', 'type': 'rating', 'text': 'Rate', 'order': 2, 'required': True}
+        ]
+    }, headers=headers)
+    survey_id = resp.get_json()['id']
+    msgpack_headers = {**headers, 'Accept': 'application/msgpack'}
+    body = packb({'answers': [{'question_id': 'mc1', 'value': 'A'}, {'question_id': 'r1', 'value': 3}]})
+    resp = client.post(f'/surveys/{survey_id}/responses', data=body,
+                       content_type='application/msgpack', headers=msgpack_headers)
+    assert resp.status_code == 201
+    assert resp.mimetype == 'application/msgpack'
+    created = unpackb(resp.data)
+    assert created['survey'] == survey_id
+    resp = client.get(f'/surveys/{survey_id}/responses', headers=msgpack_headers)
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/msgpack'
+    listing = unpackb(resp.data)
+    assert [item['id'] for item in listing['items']] == [created['id']]
+    # JSON stays the default
+    resp = client.get(f'/surveys/{survey_id}/responses', headers=headers)
+    assert resp.mimetype == 'application/json'
+    assert resp.get_json() == listing
+    resp = client.get(f'/surveys/{survey_id}/analytics', headers=msgpack_headers)
+    assert resp.status_code == 200
+    assert unpackb(resp.data)['mc1']['counts'] == {'A': 1}
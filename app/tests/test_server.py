@@ -0,0 +1,18 @@
+from mongoengine.connection import get_connection
+from app import reconnect, mongo
+from app.models import User
+
+
+def test_reconnect_replaces_mongo_client(client, app):
+    before = get_connection()
+    reconnect(app)
+    after = get_connection()
+    assert after is not before
+    assert app.extensions['mongoengine'][mongo]['conn'] is after
+    # Queries and Redis keep working on the fresh connections
+    User(username='reconnect', email='reconnect@example.com', password='x', role='respondent').save()
+    assert User.objects(username='reconnect').count() == 1
+    User.objects(username='reconnect').delete()
+    from app import redis_client  # created by create_app
+    redis_client.set('reconnect-check', '1')
+    assert redis_client.get('reconnect-check') == b'1'
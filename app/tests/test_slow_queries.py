@@ -0,0 +1,97 @@
+import redis
+from types import SimpleNamespace
+from bson import ObjectId
+from flask import Response as FlaskResponse
+from app import instrumentation, slow_query_log
+from app.utils import slow_queries
+from app.utils.slow_queries import query_shape, summarize_plan, clear_slow_queries
+from app.tests.conftest import get_token
+
+COLLSCAN_EXPLAIN = {
+    'queryPlanner': {
+        'namespace': 'survey_test.response',
+        'winningPlan': {
+            'stage': 'SORT',
+            'sortPattern': {'submitted_at': 1},
+            'inputStage': {'stage': 'COLLSCAN', 'filter': {'survey': {'$eq': 'x'}}, 'direction': 'forward'},
+        },
+        'rejectedPlans': [],
+    },
+    'ok': 1,
+}
+
+
+def test_summarize_plan_flags_collscan_and_in_memory_sort():
+    assert summarize_plan(COLLSCAN_EXPLAIN) == {
+        'stages': ['SORT', 'COLLSCAN'], 'indexes': [], 'flags': ['COLLSCAN', 'IN_MEMORY_SORT']
+    }
+    indexed = {'stages': [{'$cursor': {'queryPlanner': {'winningPlan': {
+        'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'survey_1_submitted_at_1'}
+    }}}}]}
+    assert summarize_plan(indexed) == {'stages': ['FETCH', 'IXSCAN'], 'indexes': ['survey_1_submitted_at_1'], 'flags': []}
+
+
+def test_query_shape_hides_values_but_keeps_sort():
+    command = {'find': 'response', 'filter': {'survey': ObjectId(), 'answers.value': {'$in': ['a', 'b']}},
+               'sort': {'submitted_at': 1}, 'skip': 40}
+    assert query_shape(command) == {'find': 'str', 'filter': {'survey': 'ObjectId', 'answers.value': {'$in': ['str']}},
+                                    'sort': {'submitted_at': 1}, 'skip': 'int'}
+
+
+def test_slow_commands_are_explained_and_listed(app, seeded_client, monkeypatch):
+    explained = []
+    monkeypatch.setattr(slow_queries, 'run_explain', lambda db, cmd: explained.append(cmd) or COLLSCAN_EXPLAIN)
+    clear_slow_queries()
+    listener = instrumentation._listener
+    command = {'find': 'response', 'filter': {'survey': ObjectId()}, 'sort': {'submitted_at': 1}, 'lsid': {'id': 1}, '$db': 'survey_test'}
+    with app.test_request_context('/surveys/'):
+        instrumentation.before_request()
+        slow_query_log.before_request()
+        for request_id, micros in ((1, 250_000), (2, 1_000)):
+            listener.started(SimpleNamespace(command_name='find', request_id=request_id, command=command))
+            listener.succeeded(SimpleNamespace(command_name='find', request_id=request_id, duration_micros=micros,
+                                               database_name='survey_test'))
+        slow_query_log.after_request(FlaskResponse())
+    # Only the slow command is recorded, and driver fields are stripped before explaining
+    assert len(explained) == 1 and 'lsid' not in explained[0] and '$db' not in explained[0]
+
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    resp = seeded_client.get('/admin/slow-queries?flagged=1', headers={'Authorization': f'Bearer {token}'})
+    assert resp.status_code == 200
+    [entry] = resp.get_json()
+    assert entry['endpoint'] == '/surveys/'
+    assert entry['collection'] == 'response'
+    assert entry['duration_ms'] == 250.0
+    assert entry['plan']['flags'] == ['COLLSCAN', 'IN_MEMORY_SORT']
+
+    result = app.test_cli_runner().invoke(args=['slow-queries', '--flagged'])
+    assert result.exit_code == 0
+    assert 'COLLSCAN,IN_MEMORY_SORT' in result.output
+    assert seeded_client.delete('/admin/slow-queries', headers={'Authorization': f'Bearer {token}'}).status_code == 204
+    assert seeded_client.get('/admin/slow-queries', headers={'Authorization': f'Bearer {token}'}).get_json() == []
+
+
+def test_redis_errors_do_not_fail_the_request(app, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise redis.ConnectionError('Redis is down')
+    monkeypatch.setattr(slow_queries, 'run_explain', lambda db, cmd: COLLSCAN_EXPLAIN)
+    monkeypatch.setattr(slow_queries, 'record_slow_operation', unreachable)
+    listener = instrumentation._listener
+    with app.test_request_context('/surveys/'):
+        instrumentation.before_request()
+        slow_query_log.before_request()
+        listener.started(SimpleNamespace(command_name='find', request_id=1, command={'find': 'response'}))
+        listener.succeeded(SimpleNamespace(command_name='find', request_id=1, duration_micros=250_000,
+                                           database_name='survey_test'))
+        assert slow_query_log.after_request(FlaskResponse()).status_code == 200
+
+
+def test_clear_deletes_every_cached_plan(app):
+    redis_client = slow_queries._redis()
+    for i in range(slow_queries.CLEAR_BATCH_SIZE + 3):
+        redis_client.set(f'{slow_queries.SLOW_QUERY_PLAN_PREFIX}{i}', '{}')
+    redis_client.set('unrelated', '1')
+    clear_slow_queries()
+    assert not list(redis_client.scan_iter(match=f'{slow_queries.SLOW_QUERY_PLAN_PREFIX}*'))
+    assert redis_client.get('unrelated')
+    redis_client.delete('unrelated')
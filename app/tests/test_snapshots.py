@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from random import Random
+from app.models import Response, Survey
+from app.utils import columnar, crosstab, datagen, snapshots
+from app.tests.conftest import get_token
+
+
+@pytest.fixture
+def snapshot_config(app, tmp_path):
+    saved = {k: app.config.get(k) for k in ('SNAPSHOTS_ENABLED', 'SNAPSHOT_DIR', 'SNAPSHOT_MIN_RESPONSES',
+                                            'SNAPSHOT_MAX_SEGMENTS', 'SNAPSHOT_DISK_BUDGET_MB')}
+    app.config.update(SNAPSHOTS_ENABLED=True, SNAPSHOT_DIR=str(tmp_path), SNAPSHOT_MIN_RESPONSES=1,
+                      SNAPSHOT_MAX_SEGMENTS=2, SNAPSHOT_DISK_BUDGET_MB=1024)
+    yield app.config
+    app.config.update(saved)
+
+
+def _survey(client, rng, title, count):
+    token = get_token(client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    raw = datagen.make_survey(None, rng, questions=4, choices=3)
+    resp = client.post('/surveys/', headers={'Authorization': f'Bearer {token}'},
+                       json={'title': title, 'questions': raw['questions']})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    raw['_id'] = survey.id
+    _insert(raw, count, rng)
+    return survey, raw
+
+
+def _insert(raw, count, rng, start=None):
+    end = start + timedelta(minutes=1) if start else None
+    responses = datagen.make_responses(raw, count, rng, start=start, end=end)
+    datagen.insert_batches(Response._get_collection(), responses, 100)
+
+
+def _manifest(survey):
+    return snapshots._read_manifest(survey)
+
+
+def test_snapshot_is_memory_mapped_and_appends_deltas(seeded_client, snapshot_config):
+    rng = Random(3)
+    survey, raw = _survey(seeded_client, rng, 'Snapshot', 300)
+
+    assert snapshots.survey_state(survey) == columnar.survey_state(survey)
+    manifest = _manifest(survey)
+    assert manifest['count'] == 300 and len(manifest['segments']) == 1
+    segment = snapshots.read_segment(os.path.join(snapshot_config['SNAPSHOT_DIR'], str(survey.id),
+                                                  manifest['segments'][0]['name']), survey.questions)
+    assert isinstance(segment.columns['submitted_day'], np.memmap)
+
+    # New responses become a delta segment, and past SNAPSHOT_MAX_SEGMENTS they are compacted
+    _insert(raw, 20, rng, start=datetime.utcnow())
+    assert snapshots.survey_state(survey) == columnar.survey_state(survey)
+    assert [s['count'] for s in _manifest(survey)['segments']] == [20, 300]
+    _insert(raw, 5, rng, start=datetime.utcnow() + timedelta(minutes=1))
+    assert snapshots.survey_state(survey) == columnar.survey_state(survey)
+    assert [s['count'] for s in _manifest(survey)['segments']] == [325]
+
+
+def test_snapshot_is_rebuilt_after_deletions_and_question_changes(seeded_client, snapshot_config):
+    rng = Random(4)
+    survey, raw = _survey(seeded_client, rng, 'Shrinking', 200)
+    snapshots.survey_state(survey)
+
+    collection = Response._get_collection()
+    collection.delete_many({'_id': {'$in': [d['_id'] for d in collection.find({'survey': survey.id}).limit(30)]}})
+    assert snapshots.survey_state(survey) == columnar.survey_state(survey)
+    assert _manifest(survey)['count'] == 170
+
+    # A response submitted before the snapshot's newest one is missed by the delta query
+    collection.insert_one({'survey': survey.id, 'submitted_at': datetime(2000, 1, 1), 'answers': []})
+    assert snapshots.survey_state(survey)['responses'] == 171
+
+    survey.questions[0].text = 'Renamed'
+    survey.questions.pop()
+    survey.save()
+    assert _manifest(survey) is None
+    assert snapshots.survey_state(survey) == columnar.survey_state(survey)
+
+
+def test_small_surveys_are_not_snapshotted(seeded_client, snapshot_config):
+    survey, _ = _survey(seeded_client, Random(5), 'Small', 50)
+    snapshot_config['SNAPSHOT_MIN_RESPONSES'] = 100
+    assert snapshots.survey_state(survey) == columnar.survey_state(survey)
+    assert snapshots.list_snapshots() == []
+
+
+def test_least_recently_used_snapshots_are_evicted(seeded_client, snapshot_config, app):
+    rng = Random(6)
+    old, _ = _survey(seeded_client, rng, 'Old', 100)
+    new, _ = _survey(seeded_client, rng, 'New', 100)
+    snapshots.survey_state(old)
+    manifest = os.path.join(snapshot_config['SNAPSHOT_DIR'], str(old.id), 'manifest.json')
+    stale = (datetime.now() - timedelta(days=1)).timestamp()
+    os.utime(manifest, (stale, stale))
+
+    snapshot_config['SNAPSHOT_DISK_BUDGET_MB'] = 0
+    snapshots.survey_state(new)
+    assert [s['survey'] for s in snapshots.list_snapshots()] == [str(new.id)]
+
+    runner = app.test_cli_runner()
+    assert '1 snapshots' in runner.invoke(args=['snapshots', 'list']).output
+    assert 'Dropped 1 snapshots' in runner.invoke(args=['snapshots', 'clear']).output
+    assert snapshots.list_snapshots() == []
+
+
+def test_crosstab_reads_the_snapshot(seeded_client, snapshot_config):
+    rng = Random(9)
+    survey, raw = _survey(seeded_client, rng, 'Snapshot crosstab', 200)
+    tabulated = [q for q in survey.questions if q.type in crosstab.CROSSTAB_TYPES]
+    crosstab.crosstab(survey, tabulated, tabulated)
+    assert len(_manifest(survey)['segments']) == 1
+    _insert(raw, 30, rng, start=datetime.utcnow())
+    tables = crosstab.crosstab(survey, tabulated, tabulated)
+    assert len(_manifest(survey)['segments']) == 2
+    assert sum(t['total_responses'] for t in tables if t['rows'] == t['cols'] == tabulated[0].question_id) > 0
+    snapshot_config['SNAPSHOTS_ENABLED'] = False
+    assert tables == crosstab.crosstab(survey, tabulated, tabulated)
+
+
+def test_snapshot_terms_match_the_columnar_path(seeded_client, snapshot_config):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    resp = seeded_client.post('/surveys/', headers={'Authorization': f'Bearer {token}'}, json={
+        'title': 'Snapshot terms', 'questions': [{'question_id': 'why', 'type': 'text', 'text': 'Why?', 'order': 1}]})
+    survey = Survey.objects(id=resp.get_json()['id']).first()
+    words = [f'term{chr(97 + i // 26)}{chr(97 + i % 26)}' for i in range(300)]
+
+    def insert(texts, submitted_at):
+        Response._get_collection().insert_many([
+            {'survey': survey.id, 'submitted_at': submitted_at, 'answers': [{'question_id': 'why', 'value': text}]}
+            for text in texts])
+    insert([' '.join(words[i:i + 3]) for i in range(0, 300, 3)], datetime.utcnow() - timedelta(days=1))
+    snapshots.survey_state(survey)
+    insert([' '.join(words[i:i + 2]) for i in range(150, 300, 2)], datetime.utcnow())
+
+    # More than TERMS_KEPT terms per segment: merging dumped segments would have trimmed them
+    state = snapshots.survey_state(survey)
+    assert len(_manifest(survey)['segments']) == 2
+    assert state == columnar.survey_state(survey)
+    assert len(state['questions']['why']['terms']) == 300
@@ -1,5 +1,6 @@
 import pytest
 from app.models import User, Survey, Question, Response
+from app.schemas import SurveySchema, dump_survey
 from datetime import datetime, timedelta
 from app.tests.conftest import get_token
 import uuid
@@ -221,7 +222,7 @@ def test_survey_permissions(seeded_client):
         (f'/surveys/{survey_id}', 'get', 200, 200),
         (f'/surveys/{survey_id}/questions', 'post', 201, 403),
         (f'/surveys/{survey_id}', 'put', 200, 403),
-        (f'/surveys/{survey_id}', 'delete', 200, 403),
+        (f'/surveys/{survey_id}', 'delete', 202, 403),
     ]
     for endpoint, method, admin_expected, resp_expected in permission_tests:
         if method == 'get':
@@ -289,7 +290,19 @@ def test_survey_cascade_delete(seeded_client, app):
         initial_question_count = len(survey_to_delete.questions)
         assert initial_question_count > 0, "Survey should have questions."
     resp = seeded_client.delete(f'/surveys/{survey_id}', headers=admin_headers)
-    assert resp.status_code == 200, f"Failed to delete survey. Response: {resp.get_data(as_text=True)}"
+    assert resp.status_code == 202, f"Failed to delete survey. Response: {resp.get_data(as_text=True)}"
+    # TestConfig runs the purge job inline, so it has finished already
+    job = seeded_client.get(resp.get_json()['status_url'], headers=admin_headers).get_json()
+    assert job['status'] == 'done'
+    assert job['progress'] == {'responses_deleted': initial_response_count, 'surveys_deleted': 1}
     with app.app_context():
         assert Survey.objects(id=survey_id).first() is None, "Survey was not deleted from DB."
-        assert Response.objects(survey=survey_id).count() == 0, "Responses were not deleted after survey deletion." 
\ No newline at end of file
+        assert Response.objects(survey=survey_id).count() == 0, "Responses were not deleted after survey deletion."
+        assert Survey.all_objects(id=survey_id).first() is None, "Soft-deleted survey was not purged."
+
+
+def test_survey_compiled_dump_matches_schema(seeded_client, app):
+    with app.app_context():
+        for survey in Survey.objects():
+            raw = Survey.objects(id=survey.id).as_pymongo().first()
+            assert dump_survey(raw) == {'id': str(survey.id), **SurveySchema().dump(survey)}
@@ -0,0 +1,108 @@
+import pytest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from app.models import Answer, Response, Survey
+from app.utils import timeseries
+from app.tests.conftest import get_token
+
+BERLIN = ZoneInfo('Europe/Berlin')
+
+
+def test_series_fills_gaps():
+    counts = {'2024-01-01': 2, '2024-01-04': 1}
+    assert timeseries.series(counts, 'daily') == [
+        {'date': '2024-01-01', 'count': 2, 'cumulative': 2},
+        {'date': '2024-01-02', 'count': 0, 'cumulative': 2},
+        {'date': '2024-01-03', 'count': 0, 'cumulative': 2},
+        {'date': '2024-01-04', 'count': 1, 'cumulative': 3},
+    ]
+    months = timeseries.series({'2024-01-01': 1}, 'monthly', first=datetime(2023, 11, 15), last=datetime(2024, 2, 1))
+    assert [(m['date'], m['count']) for m in months] == [
+        ('2023-11-01', 0), ('2023-12-01', 0), ('2024-01-01', 1), ('2024-02-01', 0)]
+    assert timeseries.series({}, 'weekly') == []
+
+
+def test_buckets_follow_the_time_zone_across_dst():
+    # 2024-03-31 01:30 UTC is 03:30 in Berlin, an hour after clocks went forward
+    moment = datetime(2024, 3, 31, 1, 30)
+    assert timeseries.truncate(moment, 'hourly', BERLIN).isoformat() == '2024-03-31T03:00:00+02:00'
+    assert timeseries.truncate(datetime(2024, 3, 30, 23, 30), 'daily', BERLIN).isoformat() == \
+        '2024-03-31T00:00:00+01:00'
+    assert timeseries.truncate(moment, 'weekly', BERLIN).date().isoformat() == '2024-03-25'
+
+    hours = timeseries.series({}, 'hourly', BERLIN, first=datetime(2024, 3, 30, 23, 0), last=moment)
+    assert [h['date'] for h in hours] == ['2024-03-31T00:00:00+01:00', '2024-03-31T01:00:00+01:00',
+                                         '2024-03-31T03:00:00+02:00']
+
+
+def _survey(client, headers):
+    resp = client.post('/surveys/', headers=headers, json={'title': 'Time zones', 'questions': [
+        {'question_id': 'r', 'type': 'rating', 'text': 'Rate', 'order': 1}]})
+    return Survey.objects(id=resp.get_json()['id']).first()
+
+
+def test_time_series_in_a_time_zone_and_window(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    survey = _survey(seeded_client, headers)
+    # In New York (UTC-4 in July) the first two are on June 30th
+    for submitted_at, rating in [(datetime(2024, 7, 1, 2), 1), (datetime(2024, 7, 1, 3, 30), 2),
+                                 (datetime(2024, 7, 1, 15), 3), (datetime(2024, 7, 3, 15), 4)]:
+        Response(survey=survey, submitted_at=submitted_at, answers=[Answer(question_id='r', value=rating)]).save()
+    url = f'/surveys/{survey.id}/analytics?time_series=1'
+
+    utc = seeded_client.get(url, headers=headers).get_json()['time_series']
+    assert [(d['date'], d['count']) for d in utc] == [('2024-07-01', 3), ('2024-07-02', 0), ('2024-07-03', 1)]
+
+    new_york = seeded_client.get(url + '&tz=America/New_York', headers=headers).get_json()['time_series']
+    assert [(d['date'], d['count']) for d in new_york] == [
+        ('2024-06-30', 2), ('2024-07-01', 1), ('2024-07-02', 0), ('2024-07-03', 1)]
+
+    # from/to are local times in tz; the per-question statistics cover the window too
+    window_url = url + '&interval=hourly&tz=America/New_York&from=2024-06-30T22:00&to=2024-07-01T00:00'
+    window = seeded_client.get(window_url, headers=headers).get_json()
+    assert window['time_series'] == [
+        {'date': '2024-06-30T22:00:00-04:00', 'count': 1, 'cumulative': 1},
+        {'date': '2024-06-30T23:00:00-04:00', 'count': 1, 'cumulative': 2},
+    ]
+    assert window['r']['total_responses'] == 2 and window['r']['average'] == 1.5
+
+    since = seeded_client.get(f'/surveys/{survey.id}/analytics?from=2024-07-02', headers=headers).get_json()
+    assert since['r']['total_responses'] == 1
+
+    recent = datetime.utcnow() - timedelta(hours=2)
+    recent_hours = seeded_client.get(url + f'&interval=hourly&from={recent.isoformat()}', headers=headers).get_json()
+    assert len(recent_hours['time_series']) >= 3 and {d['count'] for d in recent_hours['time_series']} == {0}
+
+
+def test_invalid_time_series_parameters(seeded_client):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    headers = {'Authorization': f'Bearer {token}'}
+    survey = _survey(seeded_client, headers)
+    url = f'/surveys/{survey.id}/analytics?time_series=1'
+
+    resp = seeded_client.get(url + '&tz=Mars/Olympus', headers=headers)
+    assert resp.status_code == 400 and resp.get_json()['message'] == 'Unknown time zone: Mars/Olympus'
+    assert seeded_client.get(url + '&interval=yearly', headers=headers).status_code == 400
+    assert seeded_client.get(url + '&from=yesterday', headers=headers).status_code == 400
+
+    resp = seeded_client.get(url + '&from=0001-01-01&tz=Asia/Tokyo', headers=headers)
+    assert resp.status_code == 400 and resp.get_json()['message'] == 'Date or time out of range: 0001-01-01'
+    assert seeded_client.get(url + '&to=9999-12-31', headers=headers).status_code == 400
+    resp = seeded_client.get(url + '&from=2024-07-02&to=2024-07-01', headers=headers)
+    assert resp.status_code == 400 and resp.get_json()['message'] == 'from must be earlier than to.'
+    assert seeded_client.get(url + '&from=2024-07-01&to=2024-07-01', headers=headers).status_code == 400
+    for interval in ('hourly', 'daily'):
+        resp = seeded_client.get(url + f'&interval={interval}&from=1990-01-01&to=2026-01-01&tz=Europe/Berlin',
+                                 headers=headers)
+        assert resp.status_code == 400 and 'more than 10000' in resp.get_json()['message']
+    assert seeded_client.get(url + '&interval=monthly&from=1990-01-01&to=2026-01-01', headers=headers).status_code == 200
+
+
+def test_series_bucket_limit():
+    first, last = datetime(2024, 1, 1), datetime(2024, 1, 3, 23)
+    assert len(timeseries.series({}, 'hourly', first=first, last=last, max_buckets=72)) == 72
+    with pytest.raises(ValueError, match='more than 71 hourly buckets'):
+        timeseries.series({}, 'hourly', first=first, last=last, max_buckets=71)
+    for interval, expected in (('daily', 3), ('weekly', 1), ('monthly', 1)):
+        assert len(timeseries.series({}, interval, first=first, last=last, max_buckets=expected)) == expected
@@ -0,0 +1,35 @@
+import glob
+from app.models import Survey
+from app.utils.tracing import REDACTED, load_traces
+from app.tests.conftest import get_token
+
+
+def test_trace_capture_records_anonymized_shapes(seeded_client, app, monkeypatch, tmp_path):
+    token = get_token(seeded_client, 'analyst', 'analyst@example.com', 'password123', 'admin')
+    monkeypatch.setitem(app.config, 'TRACE_CAPTURE_ENABLED', True)
+    monkeypatch.setitem(app.config, 'TRACE_CAPTURE_PATH', str(tmp_path / 'requests-{pid}.jsonl'))
+    survey_id = str(Survey.objects.first().id)
+    headers = {'Authorization': f'Bearer {token}'}
+    seeded_client.get(f'/surveys/{survey_id}/responses?page=2&q=secret', headers=headers)
+    seeded_client.get(f'/surveys/{survey_id}/responses?page=1', headers=headers)
+    seeded_client.get('/metrics')  # excluded
+    seeded_client.get('/surveys/')  # no token
+
+    [path] = glob.glob(str(tmp_path / 'requests-*.jsonl'))
+    with open(path) as fh:
+        raw = fh.read()
+    assert survey_id not in raw and 'secret' not in raw and token not in raw
+    first, second, anonymous = list(load_traces(path))
+    assert first['route'] == '/surveys/<string:survey_id>/responses'
+    assert first['method'] == 'GET' and first['status'] == 200 and first['role'] == 'admin'
+    assert first['args'] == {'page': '2', 'q': REDACTED}
+    # The same survey gets the same pseudonym within a capture
+    assert first['path_params'] == second['path_params'] and len(first['path_params']['survey_id']) == 12
+    assert first['response_bytes'] > 0 and first['duration_ms'] > 0
+    assert anonymous['role'] == 'anonymous' and anonymous['status'] == 401
+
+
+def test_trace_capture_is_off_by_default(seeded_client, app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRACE_CAPTURE_PATH', str(tmp_path / 'requests-{pid}.jsonl'))
+    seeded_client.get('/surveys/')
+    assert not glob.glob(str(tmp_path / '*.jsonl'))
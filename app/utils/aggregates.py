@@ -0,0 +1,325 @@
+"""
+Mergeable per-survey analytics state.
+
+``SurveyAnalyticsResource`` folds raw response documents into a state with
+``add_response`` and turns it into the API payload with ``finalize``. The
+state only holds counters (responses per day, selections per choice,
+responses per rating value, text lengths and a few samples), so two states
+can be added together without changing the result. Archived responses are
+kept as such states (``dump`` / ``merge``), and analytics can include them
+without reading the responses again.
+
+Rating statistics (mean, standard deviation, percentiles) are computed
+exactly from the histogram of rating values, which merges by addition.
+Text answers keep a frequent-terms summary: the number of answers mentioning
+each term. It is trimmed to its ``TERMS_KEPT`` most frequent terms when
+stored and past ``TERMS_LIMIT`` terms in memory. ``terms_error`` adds up the
+largest count dropped by each trim and bounds how far any reported count can
+be under the true one (a mergeable Misra-Gries summary).
+
+Text samples are a uniform random sample of the answers, not the newest
+ones. Every answer gets a pseudo-random key hashed from its response ``_id``,
+the question and ``ANALYTICS_SAMPLE_SEED``. The ``ANALYTICS_TEXT_SAMPLES``
+answers with the smallest keys are kept (bottom-k sampling). This needs
+O(k) memory and one pass. Merging two samples gives the sample of the union,
+whatever order responses are read or partitioned in, and the same seed
+always gives the same sample, so cached and recomputed analytics agree.
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from bson import ObjectId
+from flask import current_app, has_app_context
+from app.utils import timeseries
+
+TEXT_SAMPLES = 5  # default of ANALYTICS_TEXT_SAMPLES
+MASK64 = (1 << 64) - 1
+TOP_TERMS = 10  # terms reported per text question
+TERMS_KEPT = 100  # terms stored per text question in archive batches and rollups
+TERMS_LIMIT = 10000  # terms held per text question while aggregating
+PERCENTILES = (25, 50, 75, 90)
+Z_95 = 1.959964
+WORD = re.compile(r"[^\W\d_]{3,}")
+STOPWORDS = frozenset("""
+    about after all also and any are because been but can could did does for from had has have her his how
+    into its just more most not now only other our out over she should some than that the their them then
+    there these they this very was were what when which who why will with would you your
+""".split())
+
+
+def sampling():
+    """``(size, seed)`` of text samples, from the app config when there is one."""
+    if has_app_context():
+        config = current_app.config
+        return config.get('ANALYTICS_TEXT_SAMPLES', TEXT_SAMPLES), config.get('ANALYTICS_SAMPLE_SEED', 0)
+    return TEXT_SAMPLES, 0
+
+
+def empty():
+    return {'responses': 0, 'daily': Counter(), 'questions': {}, 'sampling': sampling()}
+
+
+def mix64(x):
+    """splitmix64's finalizer: spreads any 64-bit value over the whole range."""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+
+@lru_cache(maxsize=1024)
+def sample_salt(seed, qid):
+    return int.from_bytes(hashlib.blake2b(f'{seed}:{qid}'.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def id_bits(doc_id):
+    """64 bits of a response ``_id``: its first 8 bytes XOR its last 4."""
+    binary = doc_id.binary
+    return int.from_bytes(binary[:8], 'big') ^ int.from_bytes(binary[8:], 'big')
+
+
+def sample_key(salt, doc_id, text):
+    """The answer's sampling key (63 bits, so it fits BSON's int64); without an ObjectId, the text's hash."""
+    if isinstance(doc_id, ObjectId):
+        bits = id_bits(doc_id)
+    else:
+        bits = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+    return mix64(bits ^ salt) >> 1
+
+
+def merge_samples(samples, other, size):
+    """The ``size`` ``[key, text]`` pairs with the smallest keys of both samples."""
+    return sorted(samples + other)[:size]
+
+
+def new_question(qtype):
+    return {'type': qtype, 'answered': 0, 'counts': Counter(), 'total_length': 0, 'samples': [],
+            'terms': Counter(), 'terms_error': 0}
+
+
+def _question(state, qid, qtype):
+    q = state['questions'].get(qid)
+    if q is None:
+        q = state['questions'][qid] = new_question(qtype)
+    return q
+
+
+def terms(text):
+    """The distinct terms of a text answer: lowercase words of 3+ letters, without stopwords."""
+    return set(WORD.findall(text.casefold())) - STOPWORDS
+
+
+def trim_terms(q, keep):
+    """Keep the ``keep`` most frequent terms of ``q`` (ties by term), adding the largest dropped count to the error."""
+    if len(q['terms']) <= keep:
+        return q
+    ranked = sorted(q['terms'].items(), key=lambda item: (-item[1], item[0]))
+    q['terms'] = Counter(dict(ranked[:keep]))
+    q['terms_error'] += ranked[keep][1]
+    return q
+
+
+def add_response(state, types, doc):
+    """Add one raw response document; ``types`` maps question ids to question types."""
+    state['responses'] += 1
+    submitted_at = doc.get('submitted_at')
+    if submitted_at is not None:
+        state['daily'][submitted_at.date().isoformat()] += 1
+    for answer in doc.get('answers') or ():
+        qtype = types.get(answer.get('question_id'))
+        if qtype is None:
+            continue
+        q = _question(state, answer['question_id'], qtype)
+        value = answer.get('value')
+        if qtype in ('multiple_choice', 'checkbox'):
+            q['answered'] += 1
+            for item in (value if isinstance(value, list) else [value]):
+                q['counts'][item] += 1
+        elif qtype == 'rating':
+            if isinstance(value, (int, float)):
+                q['answered'] += 1
+                q['counts'][value] += 1
+        elif qtype == 'text' and value is not None:
+            text = str(value)
+            q['answered'] += 1
+            q['total_length'] += len(text)
+            size, seed = state['sampling']
+            key = sample_key(sample_salt(seed, answer['question_id']), doc.get('_id'), text)
+            if len(q['samples']) < size or key < q['samples'][-1][0]:
+                q['samples'] = merge_samples(q['samples'], [[key, text]], size)
+            q['terms'].update(terms(text))
+            trim_terms(q, TERMS_LIMIT)
+    return state
+
+
+def _dump_question(qid, q):
+    q = trim_terms(dict(q), TERMS_KEPT)
+    return {'question_id': qid, 'type': q['type'], 'answered': q['answered'],
+            'counts': [[value, n] for value, n in q['counts'].items()],
+            'total_length': q['total_length'], 'samples': [text for _, text in q['samples']],
+            'sample_keys': [key for key, _ in q['samples']],
+            'terms': [[term, n] for term, n in q['terms'].items()], 'terms_error': q['terms_error']}
+
+
+def dump(state):
+    """The state as a BSON-safe document (choices may contain dots, so counts are pairs)."""
+    return {
+        'responses': state['responses'],
+        'daily': sorted([day, n] for day, n in state['daily'].items()),
+        'questions': [_dump_question(qid, q) for qid, q in state['questions'].items()],
+    }
+
+
+def merge(state, summary):
+    """Add a dumped state to ``state``. Questions whose type changed since are skipped."""
+    state['responses'] += summary.get('responses', 0)
+    for day, n in summary.get('daily', ()):
+        state['daily'][day] += n
+    for stored in summary.get('questions', ()):
+        q = _question(state, stored['question_id'], stored['type'])
+        if q['type'] != stored['type']:
+            continue
+        q['answered'] += stored['answered']
+        for value, n in stored['counts']:
+            q['counts'][value] += n
+        q['total_length'] += stored['total_length']
+        size, seed = state['sampling']
+        # Summaries stored before samples were keyed get keys from their texts
+        keys = stored.get('sample_keys') or [sample_key(sample_salt(seed, stored['question_id']), None, text)
+                                             for text in stored['samples']]
+        q['samples'] = merge_samples(q['samples'], [[k, t] for k, t in zip(keys, stored['samples'])], size)
+        # Summaries stored before terms were kept have none
+        for term, n in stored.get('terms', ()):
+            q['terms'][term] += n
+        q['terms_error'] += stored.get('terms_error', 0)
+        trim_terms(q, TERMS_LIMIT)
+    return state
+
+
+def combine(state, other):
+    """Add another in-memory state to ``state``; unlike ``dump`` / ``merge``, no terms are trimmed to ``TERMS_KEPT``."""
+    state['responses'] += other['responses']
+    state['daily'].update(other['daily'])
+    size = state['sampling'][0]
+    for qid, q in other['questions'].items():
+        target = _question(state, qid, q['type'])
+        if target['type'] != q['type']:
+            continue
+        target['answered'] += q['answered']
+        target['counts'].update(q['counts'])
+        target['total_length'] += q['total_length']
+        target['samples'] = merge_samples(target['samples'], q['samples'], size)
+        target['terms'].update(q['terms'])
+        target['terms_error'] += q['terms_error']
+        trim_terms(target, TERMS_LIMIT)
+    return state
+
+
+def _time_series(daily, interval, first=None, last=None, max_buckets=None):
+    """Gap-filled UTC series of the daily counts; hourly series need the responses (``timeseries``)."""
+    buckets = Counter()
+    for day, n in daily.items():
+        bucket = timeseries.truncate(datetime.fromisoformat(day), interval, timeseries.UTC)
+        buckets[timeseries.label(bucket, interval)] += n
+    return timeseries.series(buckets, interval, first=first, last=last, max_buckets=max_buckets)
+
+
+def _nth(sorted_counts, index):
+    """The ``index``-th value of the sorted multiset given as (value, count) pairs."""
+    for value, n in sorted_counts:
+        if index < n:
+            return value
+        index -= n
+    raise IndexError(index)
+
+
+def _percentile(sorted_counts, n, p):
+    """The ``p``-th percentile, interpolated between ranks like ``numpy.percentile``."""
+    position = (n - 1) * p / 100
+    lower, upper = _nth(sorted_counts, math.floor(position)), _nth(sorted_counts, math.ceil(position))
+    return lower + (upper - lower) * (position - math.floor(position))
+
+
+def _rating_statistics(sorted_counts, n):
+    mean = sum(value * count for value, count in sorted_counts) / n
+    variance = sum(count * (value - mean) ** 2 for value, count in sorted_counts) / (n - 1) if n > 1 else 0.0
+    stddev = math.sqrt(variance)
+    margin = Z_95 * stddev / math.sqrt(n)
+    return {
+        'average': mean,
+        'stddev': stddev,
+        'confidence_interval': [mean - margin, mean + margin],
+        'percentiles': {f'p{p}': _percentile(sorted_counts, n, p) for p in PERCENTILES},
+    }
+
+
+def finalize(state, questions, interval=None, first=None, last=None, max_buckets=None):
+    """
+    The analytics payload for ``questions``; a time series is added when
+    ``interval`` is set, spanning at least ``first`` to ``last`` when given
+    (``ValueError`` past ``max_buckets`` buckets).
+    """
+    analytics_data = {}
+    if interval:
+        analytics_data['time_series'] = _time_series(state['daily'], interval, first, last, max_buckets)
+
+    for question in questions:
+        qid, qtype = question.question_id, question.type
+        q = state['questions'].get(qid)
+        if q is None or q['type'] != qtype:
+            q = new_question(qtype)
+
+        if qtype in ('multiple_choice', 'checkbox'):
+            counts = dict(q['counts'])
+            if qtype == 'checkbox':
+                total = q['answered']
+            else:
+                total = sum(counts.values())
+            analytics_data[qid] = {
+                'type': qtype,
+                'counts': counts,
+                'percentages': {k: (v / total * 100) if total > 0 else 0 for k, v in counts.items()},
+                'total_responses': q['answered']
+            }
+
+        elif qtype == 'rating':
+            n = q['answered']
+            if n:
+                ratings = sorted(q['counts'].items())
+                mid = n // 2
+                if n % 2 == 0:
+                    median = (_nth(ratings, mid - 1) + _nth(ratings, mid)) / 2.0
+                else:
+                    median = _nth(ratings, mid)
+                distribution = Counter()
+                for value, count in ratings:
+                    distribution[str(int(value))] += count
+                statistics = _rating_statistics(ratings, n)
+                analytics_data[qid] = {
+                    'type': qtype,
+                    'average': statistics['average'],
+                    'median': median,
+                    'stddev': statistics['stddev'],
+                    'confidence_interval': statistics['confidence_interval'],
+                    'percentiles': statistics['percentiles'],
+                    'distribution': dict(distribution),
+                    'total_responses': n
+                }
+            else:
+                analytics_data[qid] = {'type': qtype, 'total_responses': 0, 'average': 0, 'median': 0, 'stddev': 0,
+                                       'confidence_interval': [0, 0], 'percentiles': {f'p{p}': 0 for p in PERCENTILES},
+                                       'distribution': {}}
+
+        elif qtype == 'text':
+            analytics_data[qid] = {
+                'type': qtype,
+                'response_count': q['answered'],
+                'average_length': q['total_length'] / q['answered'] if q['answered'] else 0,
+                'samples': [text for _, text in q['samples']],
+                'top_terms': [{'term': term, 'count': n} for term, n in
+                              sorted(q['terms'].items(), key=lambda item: (-item[1], item[0]))[:TOP_TERMS]],
+                'top_terms_error': q['terms_error']
+            }
+    return analytics_data
@@ -0,0 +1,105 @@
+"""
+Canonical answer values.
+
+``Answer.value`` is a ``DynamicField``, so it stores whatever type the
+client sent. Answers are normalized before they are saved so aggregations
+can rely on one type per question type:
+
+* rating: ``int`` (``"4"``, ``4.0`` become ``4``; ``4.5`` is rejected)
+* checkbox: ``list`` of ``str``, without repeats
+* multiple_choice and text: ``str``
+
+``flask db normalize-answers`` rewrites responses stored before this.
+"""
+from pymongo import UpdateOne
+from app.models import Response, Survey
+from app.utils import rollups, snapshots
+
+SCALARS = (str, int, float)
+
+
+def _scalar(value):
+    if isinstance(value, bool) or not isinstance(value, SCALARS):
+        raise TypeError(f"Expected a string or number, got {type(value).__name__}")
+    return value
+
+
+def _to_int(value):
+    value = _scalar(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+    if value.is_integer():
+        return int(value)
+    raise ValueError(f"Not a whole number: {value}")
+
+
+def normalize_value(qtype, value):
+    """The canonical value of an answer to a ``qtype`` question; raises ValueError/TypeError."""
+    if qtype == 'rating':
+        return _to_int(value)
+    if qtype == 'checkbox':
+        if not isinstance(value, list):
+            raise TypeError(f"Expected a list, got {type(value).__name__}")
+        return list(dict.fromkeys(str(_scalar(item)) for item in value))
+    return str(_scalar(value))
+
+
+def normalize_answers(types, answers):
+    """
+    Normalize raw answer documents; ``types`` maps question ids to question
+    types. Returns ``(answers, invalid)``; answers to unknown questions and
+    values that can't be converted are kept unchanged and counted as invalid.
+    """
+    normalized, invalid = [], 0
+    for answer in answers:
+        qtype = types.get(answer.get('question_id'))
+        if qtype is None:
+            normalized.append(answer)
+            invalid += 1
+            continue
+        try:
+            value = normalize_value(qtype, answer.get('value'))
+        except (TypeError, ValueError):
+            normalized.append(answer)
+            invalid += 1
+            continue
+        normalized.append(dict(answer, value=value))
+    return normalized, invalid
+
+
+def normalize_stored_answers(survey_id=None, batch_size=1000, dry_run=False):
+    """Rewrite stored answers to their canonical types; returns counters per survey."""
+    responses = Response._get_collection()
+    surveys = Survey.all_objects(id=survey_id) if survey_id else Survey.all_objects.order_by('id')
+    results = []
+    for survey in surveys:
+        types = {q.question_id: q.type for q in survey.questions}
+        counts = {'survey': str(survey.id), 'scanned': 0, 'updated': 0, 'invalid': 0}
+        updates = []
+        for doc in responses.find({'survey': survey.id}, {'answers': 1}).sort('_id', 1).batch_size(batch_size):
+            counts['scanned'] += 1
+            answers = doc.get('answers') or []
+            normalized, invalid = normalize_answers(types, answers)
+            counts['invalid'] += invalid
+            # Compare with types too: 4 == 4.0 and True == 1 in Python
+            if [(type(a.get('value')), a.get('value')) for a in normalized] != \
+                    [(type(a.get('value')), a.get('value')) for a in answers]:
+                counts['updated'] += 1
+                updates.append(UpdateOne({'_id': doc['_id']}, {'$set': {'answers': normalized}}))
+            if len(updates) >= batch_size:
+                if not dry_run:
+                    responses.bulk_write(updates, ordered=False)
+                updates = []
+        if updates and not dry_run:
+            responses.bulk_write(updates, ordered=False)
+        if counts['updated'] and not dry_run:
+            snapshots.invalidate(survey.id)
+            rollups.invalidate(survey.id)
+        results.append(counts)
+    return results
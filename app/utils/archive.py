@@ -0,0 +1,149 @@
+"""
+Cold storage for old responses.
+
+``flask archive`` moves the responses of a survey that are older than its
+``retention_days`` (``ARCHIVE_RETENTION_DAYS`` for surveys without one) out
+of the ``responses`` collection, ``ARCHIVE_BATCH_SIZE`` at a time in
+``_id`` order. Each batch is:
+
+1. written to cold storage, either a gzipped extended-JSON lines file under
+   ``ARCHIVE_DIR`` (``ARCHIVE_BACKEND = 'file'``) or the
+   ``responses_archive`` collection (``'collection'``)
+2. recorded as an ``ArchiveBatch`` holding the batch's pre-aggregated
+   analytics (see ``app.utils.aggregates``)
+3. deleted from ``responses``
+
+A batch is keyed by its last response ``_id`` and every step overwrites
+what an interrupted run may have left behind, so running the command
+again is safe. Analytics merge the batch summaries with ``?include_archived=1``;
+exports read the archived responses back.
+"""
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+from bson import json_util
+from flask import current_app
+from pymongo.errors import BulkWriteError
+from app.models import ArchiveBatch, Response, Survey
+from app.utils import aggregates, rollups, snapshots
+
+ARCHIVE_COLLECTION = 'responses_archive'
+
+
+def _archive_collection():
+    return Response._get_collection().database[ARCHIVE_COLLECTION]
+
+
+def _archive_dir():
+    return current_app.config.get('ARCHIVE_DIR', 'archive')
+
+
+def _write_file(survey_id, docs):
+    location = os.path.join(str(survey_id), f"{docs[-1]['_id']}.jsonl.gz")
+    path = os.path.join(_archive_dir(), location)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as fh:
+        for doc in docs:
+            fh.write(json_util.dumps(doc) + '\n')
+    os.replace(path + '.tmp', path)  # a crash never leaves a truncated archive behind
+    return location
+
+
+def _write_collection(docs):
+    try:
+        _archive_collection().insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        # Documents archived by an interrupted run are already there
+        if any(error['code'] != 11000 for error in exc.details['writeErrors']):
+            raise
+    return 'collection'
+
+
+def retention_days(survey):
+    return survey.retention_days or current_app.config.get('ARCHIVE_RETENTION_DAYS') or None
+
+
+def archive_survey(survey, now=None, dry_run=False):
+    """Archive the survey's responses past its retention horizon; yields the number moved per batch."""
+    days = retention_days(survey)
+    if not days:
+        return
+    config = current_app.config
+    backend = config.get('ARCHIVE_BACKEND', 'file')
+    batch_size = config.get('ARCHIVE_BATCH_SIZE', 1000)
+    pause = config.get('ARCHIVE_BATCH_PAUSE', 0.05)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    query = {'survey': survey.id, 'submitted_at': {'$lt': cutoff}}
+    responses = Response._get_collection()
+    if dry_run:
+        yield responses.count_documents(query)
+        return
+
+    types = {q.question_id: q.type for q in survey.questions}
+    last_id = None
+    while True:
+        page = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+        docs = list(responses.find(page).sort('_id', 1).limit(batch_size))
+        if not docs:
+            return
+        location = _write_file(survey.id, docs) if backend == 'file' else _write_collection(docs)
+        state = aggregates.empty()
+        for doc in docs:
+            aggregates.add_response(state, types, doc)
+        submitted = [d['submitted_at'] for d in docs if d.get('submitted_at')]
+        ArchiveBatch(
+            id=docs[-1]['_id'], survey=survey.id, first_id=docs[0]['_id'], count=len(docs),
+            oldest=min(submitted, default=None), newest=max(submitted, default=None),
+            location=location, summary=aggregates.dump(state)
+        ).save()
+        ids = [d['_id'] for d in docs]
+        responses.delete_many({'_id': {'$in': ids}})
+        snapshots.invalidate(survey.id)
+        rollups.invalidate(survey.id)
+        last_id = ids[-1]
+        yield len(docs)
+        if pause:
+            time.sleep(pause)
+
+
+def archive_all(survey_id=None, now=None, dry_run=False):
+    """Archive every survey with a retention horizon; returns ``[(survey, responses archived)]``."""
+    surveys = Survey.objects(id=survey_id) if survey_id else Survey.objects.order_by('id')
+    return [(survey, sum(archive_survey(survey, now=now, dry_run=dry_run))) for survey in surveys]
+
+
+def merge_archived(state, survey_id):
+    """Add the pre-aggregated analytics of the survey's archived responses to ``state``."""
+    for batch in ArchiveBatch.objects(survey=survey_id).order_by('-id').only('summary'):
+        aggregates.merge(state, batch.summary)
+    return state
+
+
+def iter_archived(survey_id):
+    """The survey's archived response documents, newest batch first."""
+    for batch in ArchiveBatch.objects(survey=survey_id).order_by('-id'):
+        if batch.location == 'collection':
+            yield from _archive_collection().find(
+                {'_id': {'$gte': batch.first_id, '$lte': batch.id}, 'survey': batch.survey}).sort('_id', -1)
+        else:
+            with gzip.open(os.path.join(_archive_dir(), batch.location), 'rt', encoding='utf-8') as fh:
+                docs = [json_util.loads(line) for line in fh if line.strip()]
+            yield from reversed(docs)
+
+
+def drop_archive(survey_id):
+    """Delete the survey's archived responses and summaries; returns how many responses they held."""
+    dropped = 0
+    for batch in ArchiveBatch.objects(survey=survey_id):
+        if batch.location == 'collection':
+            _archive_collection().delete_many({'_id': {'$gte': batch.first_id, '$lte': batch.id},
+                                               'survey': batch.survey})
+        else:
+            try:
+                os.remove(os.path.join(_archive_dir(), batch.location))
+            except FileNotFoundError:
+                pass
+        batch.delete()
+        dropped += batch.count
+    return dropped
@@ -0,0 +1,383 @@
+"""
+Columnar analytics over NumPy arrays.
+
+``load_columns`` reads a survey's responses with a raw pymongo projection
+and lays the answers out as one array per question, aligned by response
+(row ``i`` of every column is the ``i``-th response, newest first):
+
+* ``submitted_day``: ``datetime64[D]``
+* multiple_choice: ``int16`` index into the question's choices, -1 when
+  unanswered
+* checkbox: ``uint64`` bitmask of the selected choices, plus an
+  ``answered`` flag (an empty selection still counts as answered)
+* rating: ``int8`` values plus an ``answered`` flag
+* text: ``int32`` lengths, -1 when unanswered, plus the sampled answers and
+  the frequent-terms summary
+
+Decoding the BSON costs more than the encoding below, mostly in the two-key
+dict the driver builds for every answer. So ``load_columns`` has MongoDB
+reshape each response into parallel ``qids`` and ``values`` lists
+(``$map``), keeping only the answers to the wanted questions (``$filter``)
+and leaving ``_id`` out unless text samples or snapshots need it. The
+cyclic garbage collector is paused meanwhile: decoded documents hold no
+reference cycles, yet the millions of lists and dicts they are made of keep
+triggering collections that took about two thirds of the decoding time.
+
+Responses are encoded ``CHUNK_SIZE`` at a time: the answers of a chunk are
+flattened once and each question's values are mapped to codes with C-level
+``map`` calls, so no Python statement runs per answer. ``SurveyColumns.state``
+then reduces the arrays with ``bincount`` / ``unpackbits`` into the state
+``app.utils.aggregates`` builds one answer at a time, so results are
+identical and archived summaries still merge in.
+
+Answers that don't fit the layout (values written before answers were
+normalized, choices removed from a question since, more than 64 checkbox
+choices, repeated answers to one question) raise ``ColumnarUnsupported``;
+``survey_state`` then falls back to the per-answer path.
+"""
+import gc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain, compress, islice, repeat
+from operator import attrgetter, is_not, itemgetter
+import numpy as np
+from bson import ObjectId
+from app.models import Response
+from app.utils import aggregates
+
+CHUNK_SIZE = 50000
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+class ColumnarUnsupported(Exception):
+    """The survey's stored answers don't fit the columnar layout."""
+
+
+def _codes(vocab, values, count):
+    try:
+        codes = np.fromiter(map(vocab.get, values, repeat(-1)), dtype=np.int16, count=count)
+    except TypeError:
+        raise ColumnarUnsupported("unhashable choice")
+    if (codes < 0).any():
+        raise ColumnarUnsupported("answer not among the question's choices")
+    return codes
+
+
+def _encode_choice(question, vocab, n, rows, values):
+    column = np.full(n, -1, dtype=np.int16)
+    column[rows] = _codes(vocab, values, len(rows))
+    return {'codes': column}
+
+
+def _encode_checkbox(question, vocab, n, rows, values):
+    if len(vocab) > 64:
+        raise ColumnarUnsupported("more than 64 checkbox choices")
+    if not set(map(type, values)) <= {list}:
+        raise ColumnarUnsupported("checkbox answer that is not a list")
+    sizes = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    items = list(chain.from_iterable(values))
+    codes = _codes(vocab, items, len(items)).astype(np.int64)
+    item_rows = np.repeat(rows, sizes)
+    if np.unique(item_rows * 64 + codes).size != codes.size:
+        raise ColumnarUnsupported("repeated checkbox choice")
+    masks = np.zeros(n, dtype=np.uint64)
+    np.bitwise_or.at(masks, item_rows, np.left_shift(np.uint64(1), codes.astype(np.uint64)))
+    answered = np.zeros(n, dtype=bool)
+    answered[rows] = True
+    return {'masks': masks, 'answered': answered}
+
+
+def _encode_rating(question, vocab, n, rows, values):
+    kinds = set(map(type, values))
+    if bool in kinds or float in kinds:
+        raise ColumnarUnsupported("bool or float rating")
+    # Like the per-answer path, non-numeric ratings are not counted
+    numeric = np.fromiter(map(isinstance, values, repeat(int)), dtype=bool, count=len(values))
+    ints = np.fromiter(compress(values, numeric), dtype=np.int64, count=int(numeric.sum()))
+    if ints.size and (ints.min() < -128 or ints.max() > 127):
+        raise ColumnarUnsupported("rating outside the int8 range")
+    column = np.zeros(n, dtype=np.int8)
+    answered = np.zeros(n, dtype=bool)
+    column[rows[numeric]] = ints
+    answered[rows[numeric]] = True
+    return {'values': column, 'answered': answered}
+
+
+def _encode_text(question, vocab, n, rows, values):
+    present = np.fromiter(map(is_not, values, repeat(None)), dtype=bool, count=len(values))
+    texts = list(map(str, compress(values, present)))
+    column = np.full(n, -1, dtype=np.int32)
+    column[rows[present]] = np.fromiter(map(len, texts), dtype=np.int32, count=len(texts))
+    distinct = Counter(texts)
+    if len(distinct) * 2 <= len(texts):
+        # Mostly repeated answers ("N/A", "Good"): tokenize each distinct one once
+        terms = Counter()
+        for text, n in distinct.items():
+            for term in aggregates.terms(text):
+                terms[term] += n
+    else:
+        terms = Counter(chain.from_iterable(map(aggregates.terms, texts)))
+    return {'lengths': column, 'texts': texts, 'text_rows': rows[present], 'terms': terms}
+
+
+def _take(values, indices):
+    """``[values[i] for i in indices]`` without a Python loop."""
+    if len(indices) == 0:
+        return []
+    if len(indices) == 1:
+        return [values[indices[0]]]
+    return list(itemgetter(*indices)(values))
+
+
+def _days(dates):
+    """``datetime64[D]`` array of the dates' days, NaT where there is no date."""
+    if None in dates:
+        return np.array([d.date() if d is not None else None for d in dates], dtype='datetime64[D]')
+    ordinals = np.fromiter(map(datetime.toordinal, dates), dtype=np.int64, count=len(dates))
+    return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def _mix64(x):
+    """``aggregates.mix64`` over a ``uint64`` array (multiplication wraps around)."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _id_bits(ids):
+    """``aggregates.id_bits`` of each ObjectId, or None when some _id isn't one."""
+    if not ids or not set(map(type, ids)) <= {ObjectId}:
+        return None
+    raw = np.frombuffer(b''.join(map(attrgetter('binary'), ids)), dtype=np.uint8).reshape(-1, 12)
+    high = raw[:, :8].copy().view('>u8').ravel().astype(np.uint64)
+    low = np.zeros((len(ids), 4), dtype=np.uint8)
+    low[:, :] = raw[:, 8:]
+    return high ^ low.view('>u4').ravel().astype(np.uint64)
+
+
+def _sample(salt, bits, ids, rows, texts, size):
+    """The ``size`` smallest-key ``[key, text]`` pairs of the texts, keyed like ``aggregates.sample_key``."""
+    if bits is not None:
+        keys = (_mix64(bits[rows] ^ np.uint64(salt)) >> np.uint64(1)).tolist()
+    else:
+        keys = list(map(aggregates.sample_key, repeat(salt), _take(ids, rows), texts))
+    if len(keys) > size:
+        smallest = np.argpartition(np.array(keys, dtype=np.int64), size)[:size].tolist()
+        return sorted([keys[i], texts[i]] for i in smallest)
+    return sorted(map(list, zip(keys, texts)))
+
+
+ENCODERS = {'multiple_choice': _encode_choice, 'checkbox': _encode_checkbox,
+            'rating': _encode_rating, 'text': _encode_text}
+
+
+class SurveyColumns:
+    """A survey's answers as per-question arrays aligned by response."""
+
+    def __init__(self, questions, track_ids=False):
+        self.questions = list(questions)
+        self.vocabs = {q.question_id: {choice: code for code, choice in enumerate(dict.fromkeys(q.choices))}
+                       for q in self.questions}
+        # Bottom-k sample of each text question, as sorted [key, text] pairs (see app.utils.aggregates)
+        self.samples = {q.question_id: [] for q in self.questions if q.type == 'text'}
+        self.sampling = aggregates.sampling()
+        self.terms = {q.question_id: aggregates.new_question('text') for q in self.questions if q.type == 'text'}
+        self.columns = None
+        # Highest _id and submitted_at seen, for snapshots (comparing ObjectIds isn't free)
+        self.track_ids = track_ids
+        self.last_id = None
+        self.newest = None
+        self._chunks = []
+
+    @classmethod
+    def from_arrays(cls, questions, columns, samples, terms=None):
+        """
+        Wrap arrays (e.g. memory-mapped ones) laid out like ``finish()`` leaves
+        them; ``terms`` maps text questions to ``(term counts, error)``.
+        """
+        self = cls(questions)
+        self.columns = columns
+        self.samples.update(samples)
+        for qid, (counts, error) in (terms or {}).items():
+            self.terms[qid]['terms'].update(counts)
+            self.terms[qid]['terms_error'] = error
+        return self
+
+    def add_chunk(self, docs):
+        """Encode a list of raw response documents."""
+        answer_lists = [doc.get('answers') or () for doc in docs]
+        answers = list(chain.from_iterable(answer_lists))
+        return self._add(docs, list(map(len, answer_lists)), list(map(dict.get, answers, repeat('question_id'))),
+                         list(map(dict.get, answers, repeat('value'))))
+
+    def add_flat_chunk(self, docs):
+        """Encode a list of documents shaped by ``flat_pipeline``, with parallel ``qids`` and ``values``."""
+        qid_lists = list(map(itemgetter('qids'), docs))
+        return self._add(docs, list(map(len, qid_lists)), list(chain.from_iterable(qid_lists)),
+                         list(chain.from_iterable(map(itemgetter('values'), docs))))
+
+    def _add(self, docs, sizes, qids, values):
+        n = len(docs)
+        rows = np.repeat(np.arange(n), np.array(sizes, dtype=np.int64))
+        index = {q.question_id: k for k, q in enumerate(self.questions)}
+        qcodes = np.fromiter(map(index.get, qids, repeat(-1)), dtype=np.int32, count=len(qids))
+
+        chunk = {}
+        ids = bits = None
+        if self.samples:
+            ids = list(map(dict.get, docs, repeat('_id')))
+            bits = _id_bits(ids)
+        size, seed = self.sampling
+        for k, question in enumerate(self.questions):
+            qid = question.question_id
+            selected = np.flatnonzero(qcodes == k)
+            question_rows = rows[selected]
+            if (np.diff(question_rows) == 0).any():  # rows are sorted, repeats are adjacent
+                raise ColumnarUnsupported(f"repeated answer to {qid}")
+            encoded = ENCODERS[question.type](question, self.vocabs[qid], n, question_rows,
+                                              _take(values, selected))
+            texts = encoded.pop('texts', None)
+            if texts is not None:
+                sample = _sample(aggregates.sample_salt(seed, qid), bits, ids, encoded.pop('text_rows'), texts, size)
+                self.samples[qid] = aggregates.merge_samples(self.samples[qid], sample, size)
+                self.terms[qid]['terms'].update(encoded.pop('terms'))
+                aggregates.trim_terms(self.terms[qid], aggregates.TERMS_LIMIT)
+            chunk[qid] = encoded
+        dates = list(map(dict.get, docs, repeat('submitted_at')))
+        chunk['submitted_day'] = _days(dates)
+        if self.track_ids and docs:
+            last_id = max(map(itemgetter('_id'), docs))
+            self.last_id = last_id if self.last_id is None else max(self.last_id, last_id)
+            newest = max(filter(None, dates), default=None)
+            if newest is not None and (self.newest is None or newest > self.newest):
+                self.newest = newest
+        self._chunks.append(chunk)
+        return self
+
+    def finish(self):
+        chunks, self._chunks = self._chunks, []
+        self.columns = {'submitted_day': np.concatenate([c['submitted_day'] for c in chunks])
+                        if chunks else np.array([], dtype='datetime64[D]')}
+        for question in self.questions:
+            qid = question.question_id
+            if chunks:
+                self.columns[qid] = {name: np.concatenate([c[qid][name] for c in chunks]) for name in chunks[0][qid]}
+            else:
+                self.columns[qid] = ENCODERS[question.type](question, self.vocabs[qid], 0,
+                                                            np.array([], dtype=np.int64), [])
+                for name in ('texts', 'text_rows', 'terms'):
+                    self.columns[qid].pop(name, None)
+        return self
+
+    def __len__(self):
+        return len(self.columns['submitted_day'])
+
+    def _question_state(self, question):
+        qid = question.question_id
+        column = self.columns[qid]
+        labels = list(self.vocabs[qid])
+        state = aggregates.new_question(question.type)
+        if question.type == 'multiple_choice':
+            codes = column['codes'][column['codes'] >= 0]
+            counts = np.bincount(codes, minlength=len(labels))
+            state['answered'] = int(codes.size)
+            state['counts'] = Counter({labels[i]: int(counts[i]) for i in np.flatnonzero(counts)})
+        elif question.type == 'checkbox':
+            # (n, 64) matrix of bits, choice 0 first
+            bits = np.unpackbits(column['masks'].astype('<u8', copy=False).view(np.uint8).reshape(-1, 8),
+                                 axis=1, bitorder='little')
+            counts = bits.sum(axis=0, dtype=np.int64)
+            state['answered'] = int(np.count_nonzero(column['answered']))
+            state['counts'] = Counter({labels[i]: int(counts[i]) for i in np.flatnonzero(counts)})
+        elif question.type == 'rating':
+            values = column['values'][column['answered']].astype(np.int16) + 128
+            counts = np.bincount(values, minlength=256)
+            state['answered'] = int(values.size)
+            state['counts'] = Counter({int(v) - 128: int(counts[v]) for v in np.flatnonzero(counts)})
+        elif question.type == 'text':
+            lengths = column['lengths'][column['lengths'] >= 0]
+            state['answered'] = int(lengths.size)
+            state['total_length'] = int(lengths.sum(dtype=np.int64))
+            state['samples'] = [list(pair) for pair in self.samples[qid]]
+            state['terms'] = Counter(self.terms[qid]['terms'])
+            state['terms_error'] = self.terms[qid]['terms_error']
+        return state
+
+    def state(self):
+        """The ``app.utils.aggregates`` state of these responses."""
+        state = aggregates.empty()
+        state['sampling'] = self.sampling
+        state['responses'] = len(self)
+        days = self.columns['submitted_day']
+        days, counts = np.unique(days[~np.isnat(days)], return_counts=True)
+        state['daily'] = Counter({str(day): int(n) for day, n in zip(days, counts)})
+        for question in self.questions:
+            state['questions'][question.question_id] = self._question_state(question)
+        return state
+
+
+@contextmanager
+def paused_gc():
+    """Disable the cyclic garbage collector for the block, unless it already was."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def flat_pipeline(survey, query=None, questions=None, with_ids=True):
+    """
+    Aggregation of the survey's responses (newest first, like the API) as
+    ``{_id, submitted_at, qids, values}``, with the answers to ``questions`` only when given.
+    """
+    answers = {'$ifNull': ['$answers', []]}
+    if questions is not None:
+        wanted = [q.question_id for q in questions]
+        answers = {'$filter': {'input': answers, 'cond': {'$in': ['$$this.question_id', wanted]}}}
+    return [
+        {'$match': dict(query or {}, survey=survey.id)},
+        {'$sort': {'submitted_at': -1}},
+        {'$project': {
+            '_id': int(with_ids),
+            'submitted_at': 1,
+            # $map keeps a missing field as null, so the two lists stay aligned
+            'qids': {'$map': {'input': answers, 'in': '$$this.question_id'}},
+            'values': {'$map': {'input': answers, 'in': '$$this.value'}},
+        }},
+    ]
+
+
+def load_columns(survey, query=None, chunk_size=CHUNK_SIZE, track_ids=False, questions=None):
+    """
+    Read the survey's responses (newest first, like the API) into
+    ``SurveyColumns``, of all its questions or only of ``questions``.
+    """
+    columns = SurveyColumns(survey.questions if questions is None else questions, track_ids=track_ids)
+    # Text samples are keyed by _id
+    with_ids = track_ids or bool(columns.samples)
+    pipeline = flat_pipeline(survey, query, None if questions is None else columns.questions, with_ids)
+    cursor = Response._get_collection().aggregate(pipeline, allowDiskUse=True, batchSize=min(chunk_size, 10000))
+    with paused_gc():
+        while True:
+            docs = list(islice(cursor, chunk_size))
+            if not docs:
+                break
+            columns.add_flat_chunk(docs)
+    return columns.finish()
+
+
+def survey_state(survey, query=None):
+    """The analytics state of the survey's live responses (matching ``query``)."""
+    try:
+        return load_columns(survey, query=query).state()
+    except ColumnarUnsupported:
+        types = {q.question_id: q.type for q in survey.questions}
+        state = aggregates.empty()
+        docs = Response.objects(__raw__=dict(query or {}, survey=survey.id)).only('submitted_at', 'answers')
+        for doc in docs.as_pymongo():
+            aggregates.add_response(state, types, doc)
+        return state
@@ -0,0 +1,149 @@
+"""
+Response compression (gzip, and brotli when the ``brotli`` package is
+installed).
+
+Only bodies above ``COMPRESS_MIN_SIZE`` bytes with a mimetype listed in
+``COMPRESS_MIMETYPES`` are compressed. Streamed responses are compressed
+chunk by chunk and flushed as they go so clients still receive data
+progressively. Responses that already carry a ``Content-Encoding`` (for
+instance payloads that were cached pre-compressed) are left untouched.
+"""
+import gzip
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+DEFAULT_MIN_SIZE = 500
+DEFAULT_MIMETYPES = [
+    'application/json',
+    'application/msgpack',
+    'application/javascript',
+    'text/csv',
+    'text/css',
+    'text/html',
+    'text/plain',
+]
+
+
+def supported_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def accepted_encoding():
+    """Return the best encoding the client accepts, or None."""
+    return request.accept_encodings.best_match(supported_encodings())
+
+
+def is_compressible(mimetype, size=None):
+    config = current_app.config
+    if mimetype not in config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES):
+        return False
+    return size is None or size >= config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+
+def compress_bytes(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config.get('COMPRESS_BR_LEVEL', 4))
+    return gzip.compress(data, compresslevel=current_app.config.get('COMPRESS_LEVEL', 6))
+
+
+def decompress_bytes(data, encoding):
+    if encoding == 'br':
+        return brotli.decompress(data)
+    return gzip.decompress(data)
+
+
+def _stream_compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=current_app.config.get('COMPRESS_BR_LEVEL', 4))
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    # wbits=31 selects the gzip container
+    compressor = zlib.compressobj(current_app.config.get('COMPRESS_LEVEL', 6), zlib.DEFLATED, 31)
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def compress_stream(iterable, encoding, charset='utf-8'):
+    """Compress an iterable of str/bytes chunks, flushing after each chunk."""
+    # Build the compressor now: the returned generator runs outside the app context
+    process, finish = _stream_compressor(encoding)
+    return _compressed_chunks(iterable, process, finish, charset)
+
+
+def _compressed_chunks(iterable, process, finish, charset):
+    try:
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            if chunk:
+                yield process(chunk)
+        yield finish()
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+class Compress:
+    """Flask extension compressing eligible responses in ``after_request``."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.direct_passthrough):
+            return response
+        if not is_compressible(response.mimetype, response.content_length):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = accepted_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, response.charset)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if not is_compressible(response.mimetype, len(data)):
+                return response
+            response.set_data(compress_bytes(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def compress_for_cache(data, mimetype):
+    """
+    Compress a serialized payload before it is written to the cache, so cache
+    hits are served without recompressing. Returns ``(payload, encoding)``;
+    ``encoding`` is None when the payload is stored as-is.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if not is_compressible(mimetype, len(data)):
+        return data, None
+    encoding = current_app.config.get('COMPRESS_CACHE_ENCODING', 'gzip')
+    if encoding not in supported_encodings():
+        encoding = 'gzip'
+    return compress_bytes(data, encoding), encoding
+
+
+def make_cached_response(payload, encoding, status, mimetype):
+    """Build a response for a cached payload produced by ``compress_for_cache``."""
+    response = current_app.response_class(status=status, mimetype=mimetype)
+    if encoding is not None:
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings[encoding]:
+            response.headers['Content-Encoding'] = encoding
+        else:
+            payload = decompress_bytes(payload, encoding)
+    response.set_data(payload)
+    return response
@@ -0,0 +1,58 @@
+"""
+MessagePack content negotiation.
+
+JSON stays the default; clients sending ``Accept: application/msgpack`` get
+MessagePack-encoded responses and clients sending
+``Content-Type: application/msgpack`` can post MessagePack bodies.
+"""
+import msgpack
+from flask import Request, make_response, request
+from werkzeug.exceptions import BadRequest
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+# Older clients still send the unregistered x- variant
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+def packb(data):
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def unpackb(payload):
+    return msgpack.unpackb(payload, raw=False)
+
+
+def output_msgpack(data, code, headers=None):
+    """Flask-RESTful representation for ``application/msgpack``."""
+    resp = make_response(packb(data), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def add_msgpack_representation(api):
+    """Register the MessagePack representation on a Flask-RESTful ``Api``."""
+    api.representations[MSGPACK_MIMETYPE] = output_msgpack
+    return api
+
+
+def preferred_mimetype():
+    """Return the response mimetype negotiated from the ``Accept`` header."""
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE)
+
+
+class ApiRequest(Request):
+    """
+    Request class whose ``get_json`` also decodes MessagePack bodies, so the
+    resources keep a single ``request.get_json()`` code path.
+    """
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype in MSGPACK_MIMETYPES:
+            try:
+                return unpackb(self.get_data(cache=cache))
+            except (ValueError, msgpack.UnpackException) as err:
+                if silent:
+                    return None
+                raise BadRequest(f"Failed to decode MessagePack body: {err}")
+        return super().get_json(force=force, silent=silent, cache=cache)
@@ -0,0 +1,109 @@
+"""
+Co-occurrence of checkbox choices.
+
+For every checkbox question, ``co_occurrence`` reports how often each pair
+of choices was selected together, and the most common selections. Each
+response's selection is already a ``uint64`` bitmask in the
+``app.utils.columnar`` layout (or a snapshot segment). The work is all
+vectorized:
+
+1. ``np.unique`` of the masks gives the distinct selections and their
+   counts; segments are merged by adding the counts of equal masks
+2. the distinct masks are unpacked into a ``(selections, choices)`` bit
+   matrix, and the choice-by-choice matrix is ``bits.T @ (bits * counts)``,
+   computed ``CHUNK_SIZE`` selections at a time in float64 (exact below
+   2**53)
+
+So the cost is one pass over the masks plus a matrix product over the
+distinct selections, however many responses there are. The diagonal holds
+the choice counts. An empty selection is a combination too.
+
+Answers the columnar layout can't hold (more than 64 choices, values
+written before answers were normalized) are counted one response at a time.
+"""
+from collections import Counter
+import numpy as np
+from app.models import Response
+from app.utils.crosstab import load_segments
+
+TOP_COMBINATIONS = 10
+CHUNK_SIZE = 65536
+
+
+def _bits(masks, width):
+    """``(len(masks), width)`` boolean matrix of the masks' bits, lowest bit first."""
+    bits = np.unpackbits(masks.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    return bits[:, :width].astype(bool)
+
+
+def _selections(segments, question):
+    """Distinct selection masks of the question's answers and how many responses made each."""
+    masks, counts = [], []
+    for segment in segments:
+        column = segment.columns[question.question_id]
+        unique, n = np.unique(np.asarray(column['masks'])[np.asarray(column['answered'])], return_counts=True)
+        masks.append(unique)
+        counts.append(n)
+    unique, inverse = np.unique(np.concatenate(masks), return_inverse=True)
+    return unique, np.bincount(inverse, weights=np.concatenate(counts), minlength=unique.size).astype(np.int64)
+
+
+def _fallback_selections(survey, questions, query):
+    """``{qid: (labels, bits, counts)}``, counted one response at a time."""
+    wanted = {q.question_id: q for q in questions}
+    labels = {qid: list(dict.fromkeys(q.choices)) for qid, q in wanted.items()}
+    selections = {qid: Counter() for qid in wanted}
+    docs = Response.objects(__raw__=dict(query or {}, survey=survey.id)).only('answers').as_pymongo()
+    for doc in docs:
+        for answer in doc.get('answers') or ():
+            qid = answer.get('question_id')
+            if qid not in wanted or answer.get('value') is None:
+                continue
+            value = answer['value'] if isinstance(answer['value'], list) else [answer['value']]
+            for item in value:
+                if item not in labels[qid]:
+                    labels[qid].append(item)
+            selections[qid][frozenset(labels[qid].index(item) for item in value)] += 1
+    result = {}
+    for qid, counter in selections.items():
+        bits = np.zeros((len(counter), len(labels[qid])), dtype=bool)
+        for row, selected in enumerate(counter):
+            bits[row, list(selected)] = True
+        result[qid] = (labels[qid], bits, np.fromiter(counter.values(), dtype=np.int64, count=len(counter)))
+    return result
+
+
+def matrix(bits, counts):
+    """Choice-by-choice counts of the selections (rows of ``bits``) made ``counts`` times."""
+    width = bits.shape[1]
+    total = np.zeros((width, width), dtype=np.float64)
+    for start in range(0, len(bits), CHUNK_SIZE):
+        chunk = bits[start:start + CHUNK_SIZE].astype(np.float64)
+        total += chunk.T @ (chunk * counts[start:start + CHUNK_SIZE, None])
+    return total.astype(np.int64)
+
+
+def _summary(labels, bits, counts):
+    top = np.argsort(-counts, kind='stable')[:TOP_COMBINATIONS]
+    return {
+        'choices': labels,
+        'matrix': matrix(bits, counts).tolist(),
+        'top_combinations': [{'choices': [labels[i] for i in np.flatnonzero(bits[row])], 'count': int(counts[row])}
+                             for row in top],
+    }
+
+
+def co_occurrence(survey, questions, query=None):
+    """``{qid: {'choices', 'matrix', 'top_combinations'}}`` of the checkbox ``questions``."""
+    if not questions:
+        return {}
+    segments = load_segments(survey, questions, query)
+    if segments is None:
+        fallback = _fallback_selections(survey, questions, query)
+        return {qid: _summary(*selections) for qid, selections in fallback.items()}
+    result = {}
+    for question in questions:
+        labels = list(segments[0].vocabs[question.question_id])
+        masks, counts = _selections(segments, question)
+        result[question.question_id] = _summary(labels, _bits(masks, len(labels)), counts)
+    return result
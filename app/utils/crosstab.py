@@ -0,0 +1,239 @@
+"""
+Cross-tabulation of choice, checkbox and rating questions.
+
+``crosstab`` counts how the answers to one question are spread over the
+answers to another, in one vectorized pass over the ``app.utils.columnar``
+arrays (or the survey's snapshot segments, when it has a snapshot and no
+filter applies). Every question becomes either an array of category codes
+(multiple_choice and rating, -1 when unanswered) or a boolean matrix of
+selected choices (checkbox, which is multi-valued: a response counts once in
+the cell of every choice it selected). A table of two single-valued
+questions is one ``bincount`` of the combined codes; a checkbox side takes
+one masked reduction per choice.
+
+Choice labels are the question's choices in order, rating labels the values
+that occur. ``chi_square`` tests the independence of two single-valued
+questions (Pearson's statistic on the non-empty rows and columns, with
+Cramér's V). Checkbox tables count a response in several cells, which breaks
+the test's assumptions, so they get none.
+
+Answers that don't fit the columnar layout fall back to reading the
+responses one by one, like ``columnar.survey_state``.
+"""
+import math
+import numpy as np
+from app.models import Response
+from app.utils import columnar, snapshots
+
+CROSSTAB_TYPES = ('multiple_choice', 'checkbox', 'rating')
+
+
+def parse_questions(survey, value, name):
+    """The survey's questions listed (comma-separated) in ``value``; raises ``ValueError``."""
+    ids = [part.strip() for part in (value or '').split(',') if part.strip()]
+    if not ids:
+        raise ValueError(f"{name} must list at least one question id.")
+    questions = {q.question_id: q for q in survey.questions}
+    found = []
+    for qid in ids:
+        question = questions.get(qid)
+        if question is None:
+            raise ValueError(f"Unknown question: {qid}")
+        if question.type not in CROSSTAB_TYPES:
+            raise ValueError(f"Question {qid} is a {question.type} question; crosstabs need "
+                             f"{', '.join(CROSSTAB_TYPES)} questions.")
+        found.append(question)
+    return found
+
+
+def load_segments(survey, questions, query=None):
+    """
+    ``SurveyColumns`` of the responses matching ``query``: the snapshot's segments
+    when there is no query, else only ``questions`` read from MongoDB. None when
+    the answers don't fit the columnar layout.
+    """
+    segments = None if query else snapshots.survey_columns(survey)
+    if segments is not None:
+        return segments
+    try:
+        return [columnar.load_columns(survey, query=query, questions=questions)]
+    except columnar.ColumnarUnsupported:
+        return None
+
+
+def _encode(segment, question, labels):
+    """``(codes or matrix, answered)`` of the question's answers in a ``SurveyColumns`` segment."""
+    column = segment.columns[question.question_id]
+    if question.type == 'multiple_choice':
+        codes = np.asarray(column['codes'], dtype=np.int64)
+        return codes, codes >= 0
+    if question.type == 'checkbox':
+        bits = np.unpackbits(np.asarray(column['masks']).astype('<u8', copy=False).view(np.uint8).reshape(-1, 8),
+                             axis=1, bitorder='little')
+        return bits[:, :len(labels)].astype(bool), np.asarray(column['answered'])
+    answered = np.asarray(column['answered'])
+    codes = np.searchsorted(np.array(labels, dtype=np.int64), np.asarray(column['values'], dtype=np.int64))
+    return np.where(answered, codes, -1), answered
+
+
+def _rating_labels(segments, question):
+    values = [np.unique(s.columns[question.question_id]['values'][s.columns[question.question_id]['answered']])
+              for s in segments]
+    return np.unique(np.concatenate(values)).tolist() if values else []
+
+
+def _columnar_encodings(segments, questions):
+    labels = {q.question_id: _rating_labels(segments, q) if q.type == 'rating'
+              else list(segments[0].vocabs[q.question_id]) for q in questions}
+    return labels, [{q.question_id: _encode(s, q, labels[q.question_id]) for q in questions} for s in segments]
+
+
+def _fallback_encodings(survey, questions, query):
+    """The same encodings, built one response at a time (for answers the columnar layout rejects)."""
+    wanted = {q.question_id: q for q in questions}
+    labels = {q.question_id: list(dict.fromkeys(q.choices)) for q in questions}
+    ratings = {q.question_id: set() for q in questions if q.type == 'rating'}
+    values = {qid: [] for qid in wanted}
+    docs = Response.objects(__raw__=dict(query or {}, survey=survey.id)).only('answers').as_pymongo()
+    for doc in docs:
+        answers = {a.get('question_id'): a.get('value') for a in doc.get('answers') or ()}
+        for qid, question in wanted.items():
+            value = answers.get(qid)
+            if question.type == 'rating':
+                # Like the analytics, non-numeric ratings are not counted
+                value = value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+            elif question.type == 'checkbox' and value is not None and not isinstance(value, list):
+                value = [value]
+            values[qid].append(value)
+            if value is None:
+                continue
+            if question.type == 'rating':
+                ratings[qid].add(value)
+                continue
+            for item in (value if question.type == 'checkbox' else [value]):
+                if item not in labels[qid]:
+                    labels[qid].append(item)
+    encodings = {}
+    for qid, question in wanted.items():
+        if question.type == 'rating':
+            labels[qid] = sorted(ratings[qid])
+        index = {label: code for code, label in enumerate(labels[qid])}
+        answered = np.array([v is not None for v in values[qid]], dtype=bool)
+        if question.type == 'checkbox':
+            matrix = np.zeros((len(values[qid]), len(labels[qid])), dtype=bool)
+            for row, selected in enumerate(values[qid]):
+                matrix[row, [index[item] for item in selected or ()]] = True
+            encodings[qid] = (matrix, answered)
+        else:
+            encodings[qid] = (np.array([index[v] if v is not None else -1 for v in values[qid]], dtype=np.int64),
+                              answered)
+    return labels, [encodings]
+
+
+def _table(a, b, shape):
+    """Counts of the pairs of categories of two encoded questions (codes or checkbox matrices)."""
+    if a.ndim == 1 and b.ndim == 1:
+        both = (a >= 0) & (b >= 0)
+        return np.bincount(a[both] * shape[1] + b[both], minlength=shape[0] * shape[1]).reshape(shape)
+    if a.ndim == 1:
+        return _table(b, a, shape[::-1]).T
+    table = np.zeros(shape, dtype=np.int64)
+    for i in range(shape[0]):
+        selected = a[:, i]
+        if b.ndim == 1:
+            table[i] = np.bincount(b[selected & (b >= 0)], minlength=shape[1])
+        else:
+            table[i] = b[selected].sum(axis=0, dtype=np.int64)
+    return table
+
+
+def _upper_gamma(a, x):
+    """The regularized upper incomplete gamma function Q(a, x)."""
+    if x <= 0:
+        return 1.0
+    scale = math.exp(-x + a * math.log(x) - math.lgamma(a))
+    if x < a + 1:
+        # Series of the lower function P(a, x)
+        term = total = 1 / a
+        for k in range(1, 1000):
+            term *= x / (a + k)
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1 - total * scale)
+    # Continued fraction of Q(a, x), evaluated with Lentz's method
+    tiny = 1e-300
+    b = x + 1 - a
+    c, d = 1 / tiny, 1 / b
+    h = d
+    for k in range(1, 1000):
+        an = -k * (k - a)
+        b += 2
+        d = an * d + b
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = b + an / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return scale * h
+
+
+def chi_square(table):
+    """Pearson's test of independence of a contingency table, or None when it has under 2 non-empty rows or columns."""
+    observed = np.asarray(table, dtype=np.float64)
+    observed = observed[observed.sum(axis=1) > 0][:, observed.sum(axis=0) > 0]
+    rows, cols = observed.shape
+    if rows < 2 or cols < 2:
+        return None
+    total = observed.sum()
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / total
+    statistic = float(((observed - expected) ** 2 / expected).sum())
+    dof = (rows - 1) * (cols - 1)
+    return {
+        'statistic': statistic,
+        'dof': dof,
+        'p_value': _upper_gamma(dof / 2, statistic / 2),
+        'cramers_v': math.sqrt(statistic / (total * (min(rows, cols) - 1))),
+        # Under 5 and the p-value is only a rough approximation
+        'min_expected': float(expected.min()),
+    }
+
+
+def crosstab(survey, rows, cols, query=None, with_chi_square=False):
+    """
+    Contingency tables of every question in ``rows`` against every question in
+    ``cols``, over the survey's live responses matching ``query``.
+    """
+    questions = list({q.question_id: q for q in rows + cols}.values())
+    segments = load_segments(survey, questions, query)
+    if segments is not None:
+        labels, encodings = _columnar_encodings(segments, questions)
+    else:
+        labels, encodings = _fallback_encodings(survey, questions, query)
+
+    tables = []
+    for row in rows:
+        for col in cols:
+            shape = (len(labels[row.question_id]), len(labels[col.question_id]))
+            counts = np.zeros(shape, dtype=np.int64)
+            responses = 0
+            for encoded in encodings:
+                (a, a_answered), (b, b_answered) = encoded[row.question_id], encoded[col.question_id]
+                counts += _table(a, b, shape)
+                responses += int(np.count_nonzero(a_answered & b_answered))
+            table = {
+                'rows': row.question_id,
+                'cols': col.question_id,
+                'row_labels': labels[row.question_id],
+                'col_labels': labels[col.question_id],
+                'counts': counts.tolist(),
+                'row_totals': counts.sum(axis=1).tolist(),
+                'col_totals': counts.sum(axis=0).tolist(),
+                'total_responses': responses,
+            }
+            if with_chi_square:
+                single = 'checkbox' not in (row.type, col.type)
+                table['chi_square'] = chi_square(counts) if single else None
+            tables.append(table)
+    return tables
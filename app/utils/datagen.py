@@ -0,0 +1,210 @@
+"""
+Synthetic survey data at realistic scale.
+
+Builds raw documents in the exact shape mongoengine stores ``User``,
+``Survey`` and ``Response`` in, so they can be written with unordered
+``insert_many`` batches instead of one ``.save()`` per document. Everything
+is drawn from the ``random.Random`` passed in, including the ObjectIds
+(timestamp of the document's date plus random bytes), so the same seed
+always produces the same data.
+"""
+import calendar
+import string
+from datetime import datetime, timedelta
+from random import Random
+from bson import ObjectId
+
+QUESTION_TYPES = ('multiple_choice', 'rating', 'checkbox', 'text')
+# bcrypt hash of 'password123', shared by every generated user
+DEFAULT_PASSWORD_HASH = '$2b$12$Bb63oXzCZfox4oaBgGb4L.mG0mhkSOQrE7aM0ytCMOT9rHbWp4xx.'
+TEXT_ANSWERS = (
+    'Great survey!', 'Interesting questions.', 'Could be better.', 'Very thorough.', 'Nice work!',
+    'Too long.', 'Loved the design.', 'Not sure about question 3.', 'Would recommend.', 'Meh.',
+)
+# Last submission date of bulk_seed, fixed so that the same seed gives the same documents on every run
+SEED_END = datetime(2025, 1, 1)
+
+
+def object_id(rng, when):
+    """A deterministic ObjectId whose timestamp is ``when``."""
+    return ObjectId(calendar.timegm(when.utctimetuple()).to_bytes(4, 'big') + rng.randbytes(8))
+
+
+def random_word(rng, length=6):
+    return ''.join(rng.choices(string.ascii_lowercase, k=length))
+
+
+def make_users(count, rng, prefix='user', role='respondent', created_at=None):
+    created_at = created_at or datetime.utcnow()
+    return [{
+        '_id': object_id(rng, created_at),
+        'username': f'{prefix}{i}',
+        'email': f'{prefix}{i}@example.com',
+        'password': DEFAULT_PASSWORD_HASH,
+        'role': role,
+        'created_at': created_at,
+        'updated_at': created_at,
+    } for i in range(count)]
+
+
+def make_question(index, rng, qtype=None, choices=4):
+    qtype = qtype or QUESTION_TYPES[index % len(QUESTION_TYPES)]
+    return {
+        'question_id': f'q{index + 1}',
+        'type': qtype,
+        'text': f'Question {index + 1} ({qtype})',
+        'order': index + 1,
+        'choices': [f'{random_word(rng, 4)}{c}' for c in range(choices)] if qtype in ('multiple_choice', 'checkbox') else [],
+        'required': qtype in ('multiple_choice', 'rating'),
+        'min': 1,
+        'max': 5 if qtype != 'rating' else rng.choice((5, 7, 10)),
+    }
+
+
+def make_survey(owner_id, rng, questions=8, choices=4, created_at=None, title=None):
+    created_at = created_at or datetime.utcnow()
+    return {
+        '_id': object_id(rng, created_at),
+        'owner': owner_id,
+        'title': title or f'Survey {random_word(rng, 8)}',
+        'description': 'Synthetic survey',
+        'questions': [make_question(i, rng, choices=choices) for i in range(questions)],
+        'created_at': created_at,
+        'updated_at': created_at,
+    }
+
+
+def make_answer(question, rng, skew=1.0):
+    """
+    One answer for ``question``. ``skew`` > 1 makes earlier choices (and
+    higher ratings) more popular, like real answers; 1 is uniform.
+    """
+    qtype = question['type']
+    if qtype == 'multiple_choice':
+        choices = question['choices']
+        weights = [skew ** -i for i in range(len(choices))]
+        return rng.choices(choices, weights)[0]
+    if qtype == 'checkbox':
+        return [c for i, c in enumerate(question['choices']) if rng.random() < 0.6 * skew ** -i]
+    if qtype == 'rating':
+        values = range(question['min'], question['max'] + 1)
+        weights = [skew ** i for i in range(len(values))]
+        return rng.choices(values, weights)[0]
+    return rng.choice(TEXT_ANSWERS)
+
+
+def make_responses(survey, count, rng, respondent_ids=(), start=None, end=None, skip_rate=0.2, skew=1.5):
+    """
+    Yield ``count`` responses to ``survey`` submitted uniformly between
+    ``start`` and ``end`` (default: the 30 days up to now). Optional
+    questions are skipped with probability ``skip_rate``.
+    """
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    span = (end - start).total_seconds()
+    questions = survey['questions']
+    for _ in range(count):
+        submitted_at = start + timedelta(seconds=rng.random() * span)
+        answers = []
+        for question in questions:
+            if not question['required'] and rng.random() < skip_rate:
+                continue
+            answers.append({'question_id': question['question_id'], 'value': make_answer(question, rng, skew)})
+        document = {'_id': object_id(rng, submitted_at), 'survey': survey['_id']}
+        if respondent_ids:
+            document['respondent'] = rng.choice(respondent_ids)
+        document['submitted_at'] = submitted_at
+        document['answers'] = answers
+        yield document
+
+
+def insert_batches(collection, documents, batch_size=5000):
+    """Write ``documents`` with unordered ``insert_many`` batches; returns the count."""
+    inserted, batch = 0, []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+            batch = []
+    if batch:
+        inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    return inserted
+
+
+
+# Parallel bulk seeding. Responses are generated in chunks of
+# ``chunk_size``, each from its own RNG seeded with (seed, survey, chunk),
+# so the data only depends on the seed and never on the number of workers
+# or on which worker ran which chunk.
+
+_worker = {}
+
+
+def chunk_rng(seed, survey_id, chunk):
+    return Random(f'{seed}:{survey_id}:{chunk}')
+
+
+def _init_worker(uri, db_name, respondent_ids, options):
+    from pymongo import MongoClient
+    _worker['collection'] = MongoClient(uri)[db_name]['responses']
+    _worker['respondent_ids'] = respondent_ids
+    _worker['options'] = options
+
+
+def _insert_chunk(task, collection=None):
+    survey, chunk, count = task
+    options = _worker['options']
+    rng = chunk_rng(options['seed'], survey['_id'], chunk)
+    documents = make_responses(survey, count, rng, _worker['respondent_ids'], options['start'], options['end'],
+                               options['skip_rate'], options['skew'])
+    return insert_batches(collection or _worker['collection'], documents, options['batch_size'])
+
+
+def bulk_seed(db, uri, users=1000, admins=5, surveys=10, questions=8, responses=10_000, days=90,
+              skip_rate=0.2, skew=1.5, choices=4, workers=4, batch_size=5000, chunk_size=20_000, seed=0,
+              end=SEED_END, progress=None):
+    """
+    Insert users, surveys and ``responses`` responses per survey into
+    ``db``, submitted over the ``days`` before ``end``. Responses are
+    generated and written by ``workers`` processes, each with its own
+    connection to ``uri``; ``workers=0`` runs everything in this process on
+    ``db``. ``progress`` is called with the number of responses written
+    after each chunk. Returns the counts inserted.
+    """
+    if admins < 1:
+        raise ValueError("bulk_seed needs at least one admin to own the surveys")
+    rng = Random(seed)
+    start = end - timedelta(days=days)
+    admin_docs = make_users(admins, rng, prefix=f'seed{seed}admin', role='admin', created_at=start)
+    user_docs = make_users(users, rng, prefix=f'seed{seed}user', created_at=start)
+    insert_batches(db.users, admin_docs + user_docs, batch_size)
+    survey_docs = [
+        make_survey(admin_docs[i % len(admin_docs)]['_id'], rng, questions=questions, choices=choices,
+                    created_at=start + timedelta(seconds=i))
+        for i in range(surveys)
+    ]
+    insert_batches(db.surveys, survey_docs, batch_size)
+
+    tasks = [(survey, chunk, min(chunk_size, responses - chunk * chunk_size))
+             for survey in survey_docs for chunk in range((responses + chunk_size - 1) // chunk_size)]
+    respondent_ids = [u['_id'] for u in user_docs]
+    options = {'seed': seed, 'start': start, 'end': end, 'skip_rate': skip_rate, 'skew': skew,
+               'batch_size': batch_size}
+    inserted = 0
+    if workers:
+        import multiprocessing
+        # spawn: workers must not inherit the parent's MongoClient
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(workers, _init_worker, (uri, db.name, respondent_ids, options)) as pool:
+            for count in pool.imap_unordered(_insert_chunk, tasks):
+                inserted += count
+                if progress:
+                    progress(count)
+    else:
+        _worker.update(respondent_ids=respondent_ids, options=options)
+        for task in tasks:
+            count = _insert_chunk(task, db.responses)
+            inserted += count
+            if progress:
+                progress(count)
+    return {'users': len(admin_docs) + len(user_docs), 'surveys': len(survey_docs), 'responses': inserted}
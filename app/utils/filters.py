@@ -0,0 +1,61 @@
+"""
+Response filters for segmented analytics.
+
+``response_filter`` compiles the ``respondent`` and ``answer`` query
+parameters into a MongoDB condition. Analytics add it to the survey's
+``$match``, ahead of any aggregation:
+
+* ``respondent=<user id>[,<user id>...]``: responses by these users, served by
+  the partial ``respondent`` index
+* ``answer=<question id>:<value>``: responses that gave this answer, or
+  selected this choice of a checkbox question. The parameter can be repeated,
+  and all conditions must hold. Each is an ``$elemMatch`` on ``answers``,
+  served by the multikey ``(survey, answers.question_id, answers.value)``
+  index.
+
+Values are normalized like submitted answers (``app.utils.answers``), so
+``answer=rating:4`` matches the stored integer 4.
+"""
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.utils.answers import normalize_value
+
+
+def _respondents(value):
+    try:
+        ids = [ObjectId(part.strip()) for part in value.split(',') if part.strip()]
+    except (InvalidId, TypeError):
+        ids = []
+    if not ids:
+        raise ValueError(f"Invalid respondent id in: {value}")
+    return ids
+
+
+def _answer(survey, value):
+    qid, sep, raw = value.partition(':')
+    if not sep or not qid:
+        raise ValueError(f"answer filters look like <question id>:<value>, got: {value}")
+    question = next((q for q in survey.questions if q.question_id == qid), None)
+    if question is None:
+        raise ValueError(f"Unknown question in answer filter: {qid}")
+    # A checkbox answer matches when the choice is among those selected
+    qtype = 'multiple_choice' if question.type == 'checkbox' else question.type
+    try:
+        normalized = normalize_value(qtype, raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value for question {qid} in answer filter: {raw}")
+    return {'answers': {'$elemMatch': {'question_id': qid, 'value': normalized}}}
+
+
+def response_filter(survey, args):
+    """The condition for the filters in ``args`` (a request's ``MultiDict``); raises ``ValueError``."""
+    conditions = []
+    respondents = args.get('respondent')
+    if respondents:
+        ids = _respondents(respondents)
+        conditions.append({'respondent': ids[0] if len(ids) == 1 else {'$in': ids}})
+    for value in args.getlist('answer'):
+        conditions.append(_answer(survey, value))
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
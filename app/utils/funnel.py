@@ -0,0 +1,93 @@
+"""
+Question completion funnel.
+
+``funnel`` shows where respondents stop answering and which questions they
+skip. One aggregation groups the matching responses by the list of
+questions they answered (``answers.question_id`` of the non-null answers),
+so MongoDB returns one row per distinct answer pattern instead of one per
+response. Everything else is derived from those ``(pattern, responses)``
+rows:
+
+* per question, in ``order``: how many responses answered it, how many
+  reached it (answered it or a later question) and how many stopped there
+  (it was the last question they answered)
+* how many questions each response answered
+* the most common sets of unanswered questions (skip patterns); an empty
+  set means every question was answered
+
+A response that answered nothing reached no question. Answers to questions
+no longer in the survey are ignored.
+"""
+from collections import Counter
+from app.models import Response
+
+TOP_SKIP_PATTERNS = 10
+
+
+def answer_patterns(survey, query=None):
+    """``Counter`` of the sets of question ids answered by the survey's responses matching ``query``."""
+    pipeline = [
+        {'$match': dict(query or {}, survey=survey.id)},
+        {'$group': {
+            '_id': {'$map': {
+                'input': {'$filter': {'input': {'$ifNull': ['$answers', []]}, 'as': 'answer',
+                                      'cond': {'$ne': ['$$answer.value', None]}}},
+                'as': 'answer', 'in': '$$answer.question_id',
+            }},
+            'count': {'$sum': 1},
+        }},
+    ]
+    patterns = Counter()
+    # Answers are usually stored in question order, but the same set can come in any order
+    for row in Response._get_collection().aggregate(pipeline, allowDiskUse=True):
+        patterns[frozenset(row['_id'])] += row['count']
+    return patterns
+
+
+def _rate(n, total):
+    return n / total * 100 if total else 0
+
+
+def funnel(survey, query=None):
+    """The funnel payload of the survey's responses matching ``query``."""
+    questions = sorted(survey.questions, key=lambda q: q.order)
+    position = {q.question_id: k for k, q in enumerate(questions)}
+    patterns = answer_patterns(survey, query)
+
+    total = sum(patterns.values())
+    answered = Counter()
+    last = Counter()
+    answer_counts = Counter()
+    skipped = Counter()
+    for pattern, n in patterns.items():
+        known = sorted(position[qid] for qid in pattern if qid in position)
+        for k in known:
+            answered[k] += n
+        if known:
+            last[known[-1]] += n
+        answer_counts[len(known)] += n
+        skipped[tuple(sorted(set(range(len(questions))) - set(known)))] += n
+
+    result = []
+    reached = sum(last.values())
+    for k, question in enumerate(questions):
+        # Responses whose last answer is to this question or a later one
+        if k:
+            reached -= last[k - 1]
+        result.append({
+            'question_id': question.question_id,
+            'order': question.order,
+            'required': question.required,
+            'answered': answered[k],
+            'answer_rate': _rate(answered[k], total),
+            'reached': reached,
+            'stopped': last[k],
+        })
+    return {
+        'total_responses': total,
+        'questions': result,
+        'answer_counts': {str(count): answer_counts[count] for count in sorted(answer_counts)},
+        'skip_patterns': [{'skipped': [questions[k].question_id for k in pattern], 'count': n}
+                          for pattern, n in sorted(skipped.items(), key=lambda item: (-item[1], item[0]))
+                          [:TOP_SKIP_PATTERNS]],
+    }
@@ -0,0 +1,119 @@
+"""
+Index management for the MongoDB collections.
+
+The indexes are declared in each model's ``meta['indexes']``. Automatic
+creation at first query is disabled (``auto_create_index: False``), so
+``flask db ensure-indexes`` builds them explicitly, typically once per
+deploy. Its report, built from ``index_information()`` and ``$indexStats``,
+lists:
+
+* missing: declared but not built
+* unmanaged: built but no longer declared (``--drop-unmanaged`` removes them)
+* unused: no operations recorded by ``$indexStats`` since the server started
+* redundant: key is a prefix of another index, which serves the same queries
+"""
+from datetime import datetime
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+
+def managed_models():
+    from app.models import User, Survey, Response, Job, ArchiveBatch, ResponseRollup
+    return (User, Survey, Response, Job, ArchiveBatch, ResponseRollup)
+
+
+def declared_indexes(model):
+    """The model's indexes as ``{name: (keys, options)}``."""
+    index_opts = model._meta.get('index_opts') or {}
+    declared = {}
+    for spec in model._meta['index_specs']:
+        spec = dict(index_opts, **spec)
+        keys = spec.pop('fields')
+        spec.pop('cls', None)
+        spec = {k: v for k, v in spec.items() if not (k == 'sparse' and v is False)}
+        name = IndexModel(keys, **spec).document['name']
+        declared[name] = (list(keys), spec)
+    return declared
+
+
+def _index_stats(collection):
+    """``{index name: (ops, since)}`` or None where $indexStats is unavailable."""
+    try:
+        return {s['name']: (s['accesses']['ops'], s['accesses']['since'])
+                for s in collection.aggregate([{'$indexStats': {}}])}
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+def _is_prefix(keys, other):
+    return len(keys) < len(other) and list(other[:len(keys)]) == list(keys)
+
+
+def collection_report(model):
+    collection = model._get_collection()
+    declared = declared_indexes(model)
+    existing = collection.index_information()
+    stats = _index_stats(collection)
+    indexes = []
+    for name, info in existing.items():
+        keys = [tuple(k) for k in info['key']]
+        ops, since = stats.get(name, (None, None)) if stats is not None else (None, None)
+        plain = not info.get('unique') and not info.get('partialFilterExpression') and not info.get('sparse')
+        redundant_with = [other for other, o in existing.items()
+                          if other != name and plain and _is_prefix(keys, [tuple(k) for k in o['key']])]
+        indexes.append({
+            'name': name,
+            'key': keys,
+            'declared': name in declared or name == '_id_',
+            'ops': ops,
+            'since': since.isoformat() if isinstance(since, datetime) else since,
+            'redundant_with': redundant_with,
+        })
+    return {
+        'collection': collection.name,
+        'indexes': indexes,
+        'missing': [name for name in declared if name not in existing],
+        'unmanaged': [i['name'] for i in indexes if not i['declared']],
+        'unused': [i['name'] for i in indexes if i['ops'] == 0 and i['name'] != '_id_'],
+        'redundant': [i['name'] for i in indexes if i['redundant_with']],
+        'index_stats_available': stats is not None,
+    }
+
+
+def ensure_indexes(drop_unmanaged=False, dry_run=False):
+    """
+    Optionally drop undeclared indexes, then build every declared index
+    that doesn't exist yet (in the background on servers that still
+    distinguish foreground builds). Returns one action list per collection.
+    """
+    results = []
+    for model in managed_models():
+        collection = model._get_collection()
+        existing = collection.index_information()
+        declared = declared_indexes(model)
+        actions = []
+        if drop_unmanaged:
+            # First, so a replaced index (e.g. respondent_1 by its partial version) can't conflict
+            for name in list(existing):
+                if name != '_id_' and name not in declared:
+                    if not dry_run:
+                        collection.drop_index(name)
+                    del existing[name]
+                    actions.append({'action': 'drop', 'index': name})
+        for name, (keys, options) in declared.items():
+            if name in existing:
+                continue
+            if not dry_run:
+                try:
+                    collection.create_index(keys, background=True, **options)
+                except OperationFailure as exc:
+                    # e.g. the same key already indexed under another name with other options
+                    actions.append({'action': 'conflict', 'index': name, 'error': str(exc)})
+                    continue
+            actions.append({'action': 'create', 'index': name})
+        results.append({'collection': collection.name, 'actions': actions})
+    return results
+
+
+def index_report():
+    return [collection_report(model) for model in managed_models()]
@@ -0,0 +1,225 @@
+"""
+Request instrumentation exported in the Prometheus text format on /metrics.
+
+Records per-endpoint latency and response size histograms and status code
+counters, times every MongoDB command through a pymongo ``CommandListener``
+and every Redis command through a wrapped ``execute_command``, and keeps
+per-request Mongo/Redis totals on ``g.request_stats``.
+
+/metrics answers only requests carrying ``Authorization: Bearer
+<METRICS_TOKEN>``; without a ``METRICS_TOKEN`` it answers none (403).
+
+Under gunicorn set ``PROMETHEUS_MULTIPROC_DIR`` (gunicorn.conf.py does) so
+each worker writes its samples to shared files and /metrics aggregates all
+workers, whichever one serves the scrape.
+"""
+import hmac
+import os
+from time import perf_counter
+from flask import Response as FlaskResponse, current_app, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from pymongo import monitoring
+
+SIZE_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'survey_api_request_duration_seconds', 'Request latency by endpoint.', ['method', 'endpoint'])
+RESPONSE_SIZE = Histogram(
+    'survey_api_response_size_bytes', 'Response body size by endpoint.', ['method', 'endpoint'],
+    buckets=SIZE_BUCKETS)
+REQUESTS = Counter(
+    'survey_api_requests_total', 'Requests by endpoint and status code.', ['method', 'endpoint', 'status'])
+MONGO_COMMAND_LATENCY = Histogram(
+    'survey_api_mongo_command_duration_seconds', 'MongoDB command latency.', ['command', 'outcome'],
+    buckets=COMMAND_BUCKETS)
+REDIS_COMMAND_LATENCY = Histogram(
+    'survey_api_redis_command_duration_seconds', 'Redis command latency.', ['command'],
+    buckets=COMMAND_BUCKETS)
+REQUEST_MONGO_COMMANDS = Histogram(
+    'survey_api_request_mongo_commands', 'MongoDB commands issued per request.', ['endpoint'],
+    buckets=COUNT_BUCKETS)
+REQUEST_MONGO_TIME = Histogram(
+    'survey_api_request_mongo_duration_seconds', 'Time spent in MongoDB per request.', ['endpoint'])
+REQUEST_REDIS_COMMANDS = Histogram(
+    'survey_api_request_redis_commands', 'Redis commands issued per request.', ['endpoint'],
+    buckets=COUNT_BUCKETS)
+REQUEST_REDIS_TIME = Histogram(
+    'survey_api_request_redis_duration_seconds', 'Time spent in Redis per request.', ['endpoint'])
+
+
+class RequestStats:
+    """
+    Mongo and Redis totals for the current request. Setting ``commands`` to a
+    list (the request profiler does) also records every Mongo command, and
+    setting ``slow`` to a list (the slow query log does) collects the
+    commands slower than ``slow_threshold`` seconds.
+    """
+    __slots__ = ('started', 'mongo_commands', 'mongo_seconds', 'redis_commands', 'redis_seconds',
+                 'commands', 'pending', 'slow', 'slow_threshold')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.redis_commands = 0
+        self.redis_seconds = 0.0
+        self.commands = None
+        self.pending = {}
+        self.slow = None
+        self.slow_threshold = 0.0
+
+
+def current_stats():
+    """Return the current request's ``RequestStats``, or None outside a request."""
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def endpoint_label():
+    # The rule template keeps label cardinality bounded (no ids in paths)
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command, globally and for the current request."""
+
+    def started(self, event):
+        stats = current_stats()
+        if stats is not None and (stats.commands is not None or stats.slow is not None):
+            stats.pending[event.request_id] = event.command
+
+    def succeeded(self, event):
+        self._record(event, 'success')
+
+    def failed(self, event):
+        self._record(event, 'failure')
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.labels(command=event.command_name, outcome=outcome).observe(seconds)
+        stats = current_stats()
+        if stats is not None:
+            stats.mongo_commands += 1
+            stats.mongo_seconds += seconds
+            if stats.commands is None and stats.slow is None:
+                return
+            command = stats.pending.pop(event.request_id, None)
+            collection = command.get(event.command_name) if command is not None else None
+            if stats.slow is not None and seconds >= stats.slow_threshold and event.command_name != 'explain':
+                stats.slow.append({
+                    'command_name': event.command_name,
+                    'command': command,
+                    'database': event.database_name,
+                    'duration_ms': round(seconds * 1000, 3),
+                })
+            if stats.commands is not None:
+                stats.commands.append({
+                    'command': event.command_name,
+                    'collection': collection if isinstance(collection, str) else None,
+                    'duration_ms': round(seconds * 1000, 3),
+                    'outcome': outcome,
+                })
+
+
+def instrument_redis(client):
+    """Wrap a redis client's ``execute_command`` so each call is timed."""
+    if client is None or getattr(client, '_survey_api_instrumented', False):
+        return client
+    execute_command = client.execute_command
+
+    def timed_execute_command(*args, **options):
+        started = perf_counter()
+        try:
+            return execute_command(*args, **options)
+        finally:
+            seconds = perf_counter() - started
+            REDIS_COMMAND_LATENCY.labels(command=str(args[0]).upper() if args else 'UNKNOWN').observe(seconds)
+            stats = current_stats()
+            if stats is not None:
+                stats.redis_commands += 1
+                stats.redis_seconds += seconds
+
+    client.execute_command = timed_execute_command
+    client._survey_api_instrumented = True
+    return client
+
+
+def cache_redis_clients(backend):
+    """Redis clients behind a Flask-Caching backend (none for non-Redis backends)."""
+    return [c for c in (getattr(backend, '_write_client', None), getattr(backend, '_read_client', None))
+            if c is not None]
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return FlaskResponse('Set METRICS_TOKEN to enable /metrics.\n', status=403, mimetype='text/plain')
+    given = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(given.encode(), f'Bearer {token}'.encode()):
+        return FlaskResponse('Missing or invalid metrics token.\n', status=401, mimetype='text/plain',
+                             headers={'WWW-Authenticate': 'Bearer'})
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return FlaskResponse(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+class Instrumentation:
+    """
+    Flask extension wiring the request hooks, the Mongo command listener
+    and the /metrics endpoint. ``init_app`` must run before MongoEngine
+    connects, since pymongo only attaches listeners registered before a
+    client is created.
+    """
+    _listener = None
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if Instrumentation._listener is None:
+            # Registered once per process; it applies to every client created later
+            Instrumentation._listener = MongoCommandListener()
+            monitoring.register(Instrumentation._listener)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        if app.config.get('METRICS_ENABLED', True):
+            app.add_url_rule(app.config.get('METRICS_ROUTE', '/metrics'), 'metrics', metrics_view)
+
+    def instrument_redis(self, *clients):
+        for client in clients:
+            instrument_redis(client)
+
+    def before_request(self):
+        g.request_stats = RequestStats()
+
+    def after_request(self, response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        elapsed = perf_counter() - stats.started
+        method, endpoint = request.method, endpoint_label()
+        REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(elapsed)
+        REQUESTS.labels(method=method, endpoint=endpoint, status=str(response.status_code)).inc()
+        if response.content_length is not None:
+            RESPONSE_SIZE.labels(method=method, endpoint=endpoint).observe(response.content_length)
+        REQUEST_MONGO_COMMANDS.labels(endpoint=endpoint).observe(stats.mongo_commands)
+        REQUEST_MONGO_TIME.labels(endpoint=endpoint).observe(stats.mongo_seconds)
+        REQUEST_REDIS_COMMANDS.labels(endpoint=endpoint).observe(stats.redis_commands)
+        REQUEST_REDIS_TIME.labels(endpoint=endpoint).observe(stats.redis_seconds)
+
+        if current_app.config.get('SERVER_TIMING_HEADER'):
+            response.headers['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'mongo;dur={stats.mongo_seconds * 1000:.1f};desc="{stats.mongo_commands} commands", '
+                f'redis;dur={stats.redis_seconds * 1000:.1f};desc="{stats.redis_commands} commands"'
+            )
+        return response
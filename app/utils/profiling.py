@@ -0,0 +1,233 @@
+"""
+On-demand request profiling for admins.
+
+An admin opts a single request in with the ``X-Profile`` header or the
+``_profile`` query parameter (``cprofile`` or ``sample``; any other value
+means ``cprofile``). The request then runs under the chosen profiler and the
+result is stored in Redis for ``PROFILE_TTL`` seconds, together with the
+request's MongoDB commands and timings:
+
+* ``cprofile``: deterministic cProfile, downloadable as a ``.prof`` pstats file
+* ``sample``: a low-overhead stack sampler, downloadable as speedscope JSON
+
+The response carries ``X-Profile-Id`` and ``X-Profile-Url`` pointing to the
+admin endpoints serving the artifact. Non-admin requests are never profiled.
+"""
+import cProfile
+import json
+import marshal
+import sys
+import threading
+import uuid
+from datetime import datetime
+from time import perf_counter
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from redis import RedisError
+
+PROFILE_KEY_PREFIX = 'profile:'
+PROFILE_INDEX_KEY = 'profile:index'
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+def _redis():
+    from app import redis_client  # created by create_app
+    return redis_client
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every ``interval`` seconds from a
+    background thread and exports the samples in speedscope's format.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []
+        self.frame_index = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._started = perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = perf_counter() - self._started
+
+    def _frame_id(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return index
+
+    def _run(self):
+        last = perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()  # speedscope wants root first
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def speedscope(self, name):
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'exporter': 'survey-api',
+            'name': name,
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self.duration,
+                'samples': self.samples,
+                'weights': self.weights,
+            }],
+        }
+
+
+def requested_mode():
+    """Return the profiling mode asked for by this request, or None."""
+    value = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not value:
+        return None
+    return value if value in PROFILE_MODES else 'cprofile'
+
+
+def is_admin_request():
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return False  # invalid tokens are rejected by the view itself
+    return get_jwt().get('role') == 'admin'
+
+
+def store_profile(meta, artifact):
+    redis_client = _redis()
+    ttl = current_app.config.get('PROFILE_TTL', 3600)
+    key = f"{PROFILE_KEY_PREFIX}{meta['id']}"
+    redis_client.setex(f"{key}:meta", ttl, json.dumps(meta))
+    redis_client.setex(f"{key}:data", ttl, artifact)
+    now = datetime.utcnow().timestamp()
+    redis_client.zadd(PROFILE_INDEX_KEY, {meta['id']: now})
+    redis_client.zremrangebyscore(PROFILE_INDEX_KEY, 0, now - ttl)
+
+
+def load_profile_meta(profile_id):
+    raw = _redis().get(f"{PROFILE_KEY_PREFIX}{profile_id}:meta")
+    return json.loads(raw) if raw else None
+
+
+def load_profile_artifact(profile_id):
+    return _redis().get(f"{PROFILE_KEY_PREFIX}{profile_id}:data")
+
+
+def list_profiles(limit=50):
+    ids = _redis().zrevrange(PROFILE_INDEX_KEY, 0, limit - 1)
+    metas = (load_profile_meta(i.decode() if isinstance(i, bytes) else i) for i in ids)
+    return [m for m in metas if m]
+
+
+class RequestProfiler:
+    """
+    Flask extension running opted-in admin requests under a profiler.
+    Must be initialised after ``Instrumentation`` so the request's Mongo
+    commands are captured on ``g.request_stats``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        if not current_app.config.get('PROFILING_ENABLED', True):
+            return
+        mode = requested_mode()
+        if mode is None or not is_admin_request():
+            return
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats.commands = []  # keep per-command details for the report
+        if mode == 'sample':
+            profiler = SamplingProfiler(threading.get_ident(), current_app.config.get('PROFILE_SAMPLE_INTERVAL', 0.001))
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return  # another profiler is already active in this process
+        g.profiler = (mode, profiler, perf_counter())
+
+    def after_request(self, response):
+        active = g.pop('profiler', None)
+        if active is None:
+            return response
+        mode, profiler, started = active
+        if mode == 'sample':
+            profiler.stop()
+        else:
+            profiler.disable()
+        duration = perf_counter() - started
+
+        profile_id = uuid.uuid4().hex
+        name = f"{request.method} {request.path}"
+        if mode == 'sample':
+            artifact = json.dumps(profiler.speedscope(name)).encode('utf-8')
+            filename = f"profile_{profile_id}.speedscope.json"
+        else:
+            profiler.create_stats()
+            artifact = marshal.dumps(profiler.stats)  # the format pstats.Stats loads
+            filename = f"profile_{profile_id}.prof"
+
+        stats = g.get('request_stats')
+        meta = {
+            'id': profile_id,
+            'mode': mode,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'created_at': datetime.utcnow().isoformat(),
+            'user': get_jwt().get('sub'),
+            'filename': filename,
+            'mongo': {
+                'commands': stats.mongo_commands if stats else 0,
+                'duration_ms': round(stats.mongo_seconds * 1000, 3) if stats else 0,
+                'details': (stats.commands or []) if stats else [],
+            },
+            'redis': {
+                'commands': stats.redis_commands if stats else 0,
+                'duration_ms': round(stats.redis_seconds * 1000, 3) if stats else 0,
+            },
+        }
+        # Like slow queries, an unreachable Redis costs the profile, not the request
+        try:
+            store_profile(meta, artifact)
+        except RedisError as exc:
+            current_app.logger.warning("Could not store profile of %s %s: %s", request.method, meta['path'], exc)
+            return response
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Url'] = f"/admin/profiles/{profile_id}"
+        return response
@@ -0,0 +1,156 @@
+"""
+Background purge of soft-deleted surveys and users.
+
+Deleting a survey or user only sets ``deleted_at`` (which hides the
+document from the API) and schedules a ``Job``. The job then does what
+mongoengine's CASCADE/NULLIFY delete rules would have done inside the
+request, in bounded batches:
+
+* responses of a survey are deleted ``PURGE_BATCH_SIZE`` at a time, each
+  batch a ``delete_many`` over an ``_id`` range
+* archived responses and their summaries go with the survey
+* a user's surveys are purged the same way, and the ``respondent`` of their
+  responses (and of those in the archive collection) is unset with chunked
+  ``update_many``
+* ``PURGE_BATCH_PAUSE`` seconds of sleep between batches keep the load on
+  the primary (and replication lag) bounded
+
+Progress counters are incremented on the job after every batch, which also
+refreshes its ``updated_at``. Jobs are idempotent, so one interrupted by a
+worker restart can simply be run again (``flask jobs resume``). A run first
+claims the job atomically: pending and failed jobs can be claimed, running
+ones only once ``updated_at`` is ``JOB_LEASE_SECONDS`` old, so a purge still
+making progress on another thread or process is never run twice.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from mongoengine.queryset.visitor import Q
+from app.models import Job, Response, Survey, User
+from app.utils import rollups, snapshots
+from app.utils.archive import ARCHIVE_COLLECTION, drop_archive
+
+
+def batched(collection, query, batch_size, pause=0.0, update=None):
+    """
+    Delete (or ``update``) the documents matching ``query`` in ``_id``
+    order, ``batch_size`` at a time. Yields the number affected per batch.
+    """
+    last_id = None
+    while True:
+        page = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+        ids = [d['_id'] for d in collection.find(page, {'_id': 1}).sort('_id', 1).limit(batch_size)]
+        if not ids:
+            return
+        in_range = dict(query, _id={'$gte': ids[0], '$lte': ids[-1]})
+        if update is None:
+            yield collection.delete_many(in_range).deleted_count
+        else:
+            yield collection.update_many(in_range, update).modified_count
+        last_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+
+
+def _settings():
+    config = current_app.config
+    return config.get('PURGE_BATCH_SIZE', 1000), config.get('PURGE_BATCH_PAUSE', 0.05)
+
+
+def _bump(job, counter, amount):
+    job.progress[counter] = job.progress.get(counter, 0) + amount
+    job.updated_at = datetime.utcnow()
+    # $inc, so the stored counters stay right whatever this run's copy of the job holds
+    Job.objects(id=job.id).update_one(**{f'inc__progress__{counter}': amount}, set__updated_at=job.updated_at)
+
+
+def _purge_survey_responses(job, survey_id):
+    batch_size, pause = _settings()
+    for deleted in batched(Response._get_collection(), {'survey': survey_id}, batch_size, pause):
+        _bump(job, 'responses_deleted', deleted)
+    snapshots.invalidate(survey_id)
+    rollups.invalidate(survey_id)
+    archived = drop_archive(survey_id)
+    if archived:
+        _bump(job, 'archived_responses_deleted', archived)
+
+
+def purge_survey(job):
+    _purge_survey_responses(job, job.target)
+    # Raw delete: mongoengine's CASCADE rule would scan the responses again
+    Survey._get_collection().delete_one({'_id': job.target, 'deleted_at': {'$ne': None}})
+    _bump(job, 'surveys_deleted', 1)
+
+
+def purge_user(job):
+    batch_size, pause = _settings()
+    surveys = Survey._get_collection()
+    for survey in surveys.find({'owner': job.target}, {'_id': 1}):
+        _purge_survey_responses(job, survey['_id'])
+        surveys.delete_one({'_id': survey['_id']})
+        _bump(job, 'surveys_deleted', 1)
+    # NULLIFY: the user's answers to other surveys stay, anonymised
+    for updated in batched(Response._get_collection(), {'respondent': job.target}, batch_size, pause,
+                           update={'$unset': {'respondent': 1}}):
+        _bump(job, 'responses_nullified', updated)
+    # Archive files are immutable; only the archive collection can be anonymised
+    archive = Response._get_collection().database[ARCHIVE_COLLECTION]
+    for updated in batched(archive, {'respondent': job.target}, batch_size, pause,
+                           update={'$unset': {'respondent': 1}}):
+        _bump(job, 'responses_nullified', updated)
+    User._get_collection().delete_one({'_id': job.target, 'deleted_at': {'$ne': None}})
+    _bump(job, 'users_deleted', 1)
+
+
+PURGES = {'purge_survey': purge_survey, 'purge_user': purge_user}
+
+
+def claim(job_id):
+    """Atomically mark the job running if no live run holds it; returns the job, or None when it can't be claimed."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config.get('JOB_LEASE_SECONDS', 600))
+    claimable = Q(status__in=('pending', 'failed')) | Q(status='running', updated_at__lt=stale)
+    job = Job.objects(Q(id=job_id) & claimable).modify(new=True, set__status='running', set__updated_at=now,
+                                                       unset__error=True)
+    if job is not None and job.started_at is None:
+        job.modify(started_at=now)
+    return job
+
+
+def run_job(job_id):
+    """Claim and run the job; a job that is done or held by another run is returned as it is."""
+    job = claim(job_id)
+    if job is None:
+        return Job.objects(id=job_id).first()
+    try:
+        PURGES[job.kind](job)
+    except Exception as exc:
+        current_app.logger.exception("Job %s (%s %s) failed", job.id, job.kind, job.target)
+        job.modify(status='failed', error=str(exc), updated_at=datetime.utcnow())
+        return job
+    now = datetime.utcnow()
+    job.modify(status='done', finished_at=now, updated_at=now)
+    return job
+
+
+def _run_in_background(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+
+def schedule(kind, target, created_by=None):
+    """Create a job and run it on a background thread (inline with ``JOBS_RUN_INLINE``)."""
+    job = Job(kind=kind, target=target, created_by=created_by).save()
+    if current_app.config.get('JOBS_RUN_INLINE', False):
+        run_job(job.id)
+    else:
+        app = current_app._get_current_object()
+        threading.Thread(target=_run_in_background, args=(app, job.id), name=f'job-{job.id}', daemon=True).start()
+    return job
+
+
+def resume_jobs():
+    """Run pending and failed jobs and those left running by a stopped worker; returns them."""
+    jobs = list(Job.objects(status__in=('pending', 'running', 'failed')).order_by('created_at'))
+    return [run_job(job.id) for job in jobs]
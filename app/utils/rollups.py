@@ -0,0 +1,137 @@
+"""
+Daily rollups of survey responses.
+
+``flask rollups`` (run from cron, e.g. hourly) keeps one ``ResponseRollup``
+per survey and UTC day in ``response_rollups``. A rollup holds the
+``app.utils.aggregates`` state of that day's responses: the response count,
+choice counts, rating histograms and text lengths. Only complete days are
+rolled up. Each run starts at the survey's ``rollups_until`` and reads only
+the responses submitted since the previous run.
+
+``window_state`` answers a ``[start, end)`` window by summing the rollups of
+the whole days inside it. Raw responses are read only for the partial days at
+its edges and for the days not rolled up yet, i.e. today.
+
+Rollups cover live responses. Archiving, purges and ``flask db
+normalize-answers`` drop a survey's rollups with ``invalidate``. Windows then
+read raw responses until the next run rebuilds the rollups.
+
+Responses inserted later with an older ``submitted_at`` (bulk imports,
+``flask seed-bulk`` into an existing survey, restores) land in days already
+rolled up. Like snapshots, rollups catch this with a count check: a window
+compares the responses its rollups sum up with ``count_documents`` over the
+same days (an index-only count), and a run compares all the survey's rollups
+with the responses before ``rollups_until``. On a mismatch the window reads
+the raw responses and drops the rollups, and the run rebuilds them.
+"""
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReplaceOne
+from app.models import Response, ResponseRollup, Survey
+from app.utils import aggregates, columnar
+from app.utils.timeseries import window_query
+
+DAY = timedelta(days=1)
+WRITE_BATCH = 500
+
+
+def _midnight(moment):
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def _next_response_day(survey_id, start, end):
+    """UTC midnight of the first day in ``[start, end)`` with a response, or None."""
+    doc = Response._get_collection().find_one(
+        {'survey': survey_id, 'submitted_at': {'$gte': start, '$lt': end}},
+        {'submitted_at': 1}, sort=[('submitted_at', 1)])
+    return _midnight(doc['submitted_at']) if doc else None
+
+
+def _count(survey_id, start, end):
+    """Live responses submitted in ``[start, end)``; None bounds are open."""
+    return Response._get_collection().count_documents(dict(window_query(start, end), survey=survey_id))
+
+
+def rolled_up(survey_id):
+    """How many responses the survey's rollups sum up."""
+    rows = list(ResponseRollup._get_collection().aggregate([
+        {'$match': {'survey': survey_id}},
+        {'$group': {'_id': None, 'responses': {'$sum': '$summary.responses'}}},
+    ]))
+    return rows[0]['responses'] if rows else 0
+
+
+def rollup_survey(survey, now=None):
+    """Roll up the survey's complete days since ``rollups_until``; returns the number of days written."""
+    today = _midnight(now or datetime.utcnow())
+    rollups = ResponseRollup._get_collection()
+    # Responses backdated into days already rolled up: start over
+    if survey.rollups_until is not None and rolled_up(survey.id) != _count(survey.id, None, survey.rollups_until):
+        invalidate(survey.id)
+        survey.rollups_until = None
+    writes, written = [], 0
+    day = _next_response_day(survey.id, survey.rollups_until or datetime.min, today)
+    while day is not None:
+        state = columnar.survey_state(survey, window_query(day, day + DAY))
+        key = {'survey': survey.id, 'day': day}
+        writes.append(ReplaceOne(key, dict(key, summary=aggregates.dump(state), updated_at=datetime.utcnow()),
+                                 upsert=True))
+        written += 1
+        if len(writes) >= WRITE_BATCH:
+            rollups.bulk_write(writes, ordered=False)
+            writes = []
+        day = _next_response_day(survey.id, day + DAY, today)
+    if writes:
+        rollups.bulk_write(writes, ordered=False)
+    Survey._get_collection().update_one({'_id': survey.id}, {'$set': {'rollups_until': today}})
+    survey.rollups_until = today
+    return written
+
+
+def rollup_all(survey_id=None, now=None):
+    """Roll up every survey; returns ``[(survey, days written)]``."""
+    surveys = Survey.objects(id=survey_id) if survey_id else Survey.objects.order_by('id')
+    return [(survey, rollup_survey(survey, now=now)) for survey in surveys]
+
+
+def _add_raw(state, survey, start, end):
+    aggregates.merge(state, aggregates.dump(columnar.survey_state(survey, window_query(start, end))))
+
+
+def window_state(survey, start=None, end=None):
+    """The analytics state of the survey's live responses submitted in ``[start, end)`` (naive UTC)."""
+    until = survey.rollups_until
+    first_day = None  # first whole day of the window
+    if start is not None:
+        first_day = _midnight(start)
+        if first_day < start:
+            first_day += DAY
+    last_day = min(_midnight(end), until) if end and until else until
+    if until is None or (first_day is not None and first_day >= last_day):
+        return columnar.survey_state(survey, window_query(start, end))
+
+    state = aggregates.empty()
+    if end is None or end > last_day:
+        _add_raw(state, survey, last_day, end)
+    days = {'survey': survey.id, 'day': {'$lt': last_day}}
+    if first_day is not None:
+        days['day']['$gte'] = first_day
+    summed = 0
+    for rollup in ResponseRollup._get_collection().find(days, {'summary': 1}).sort('day', -1):
+        aggregates.merge(state, rollup['summary'])
+        summed += rollup['summary'].get('responses', 0)
+    if summed != _count(survey.id, first_day, last_day):
+        # Responses were backdated into (or removed from) rolled-up days; the next run rebuilds them
+        invalidate(survey.id)
+        survey.rollups_until = None
+        return columnar.survey_state(survey, window_query(start, end))
+    if start is not None and start < first_day:
+        _add_raw(state, survey, start, first_day)
+    return state
+
+
+def invalidate(survey_id):
+    """Drop the survey's rollups; the next ``rollup_survey`` rebuilds them."""
+    survey_id = ObjectId(survey_id)
+    ResponseRollup._get_collection().delete_many({'survey': survey_id})
+    Survey._get_collection().update_one({'_id': survey_id}, {'$unset': {'rollups_until': 1}})
@@ -0,0 +1,217 @@
+"""
+Slow MongoDB operation log with automatic explain plans.
+
+``MongoCommandListener`` hands every command slower than ``SLOW_QUERY_MS``
+issued while serving a request to ``g.request_stats.slow``. After the view
+returns, ``SlowQueryLog`` re-runs explainable commands (find, aggregate,
+count, distinct, update, delete, findAndModify) with ``explain`` in
+``queryPlanner`` mode. It then logs them with the endpoint that issued them
+and keeps the latest ``SLOW_QUERY_LOG_SIZE`` entries in Redis. Plans that
+scan the whole collection (``COLLSCAN``) or sort in memory (``SORT``) are
+flagged. Each query shape is explained at most once per
+``SLOW_QUERY_EXPLAIN_TTL`` seconds, so a hot slow query doesn't double its
+own cost.
+
+Entries store the query shape (values replaced by their type), never the
+answer data itself. They are served on ``/admin/slow-queries`` and by
+``flask slow-queries``.
+"""
+import hashlib
+import json
+from datetime import datetime
+from flask import current_app, g, request
+from mongoengine.connection import get_connection
+from redis import RedisError
+
+SLOW_QUERY_LOG_KEY = 'slowquery:log'
+SLOW_QUERY_PLAN_PREFIX = 'slowquery:plan:'
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+# Driver/session fields that explain rejects or that are not part of the query
+DRIVER_FIELDS = {'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'readConcern',
+                 'writeConcern', 'startTransaction', 'autocommit', 'apiVersion', 'apiStrict',
+                 'apiDeprecationErrors', 'cursor', 'batchSize', 'singleBatch'}
+# Keys holding field names or operators, whose values stay as they are in a shape
+SHAPE_KEEP = {'projection', 'sort', 'hint', 'key', 'collation'}
+CLEAR_BATCH_SIZE = 500
+
+
+def _redis():
+    from app import redis_client  # created by create_app
+    return redis_client
+
+
+def query_shape(value, key=None):
+    """Replace literal values with their type name, keeping the structure."""
+    if isinstance(value, dict):
+        return {k: (v if k in SHAPE_KEEP else query_shape(v, k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Pipelines, $and/$or and update lists keep one shape per element
+        if key in ('pipeline', '$and', '$or', '$nor', 'updates', 'deletes'):
+            return [query_shape(v) for v in value]
+        return [type(value[0]).__name__] if value else []
+    return type(value).__name__
+
+
+def shape_hash(command_name, collection, shape):
+    raw = json.dumps([command_name, collection, shape], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def explainable(command_name, command):
+    """Strip a captured command down to what ``explain`` accepts, or None."""
+    if command_name not in EXPLAINABLE_COMMANDS or command is None:
+        return None
+    return {k: v for k, v in command.items() if k not in DRIVER_FIELDS}
+
+
+def _plan_stages(node, stages, indexes):
+    if isinstance(node, dict):
+        stage = node.get('stage')
+        if isinstance(stage, str):
+            stages.append(stage)
+            if node.get('indexName'):
+                indexes.append(node['indexName'])
+        for value in node.values():
+            _plan_stages(value, stages, indexes)
+    elif isinstance(node, list):
+        for value in node:
+            _plan_stages(value, stages, indexes)
+
+
+def _winning_plans(node):
+    # find explains have one queryPlanner; aggregate explains nest one per
+    # $cursor stage (or per shard), so collect every winningPlan in the doc
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'winningPlan':
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _winning_plans(value)
+
+
+def summarize_plan(explain):
+    """Return the winning plan's stages, indexes used and problem flags."""
+    stages, indexes = [], []
+    for plan in _winning_plans(explain):
+        _plan_stages(plan, stages, indexes)
+    flags = []
+    if 'COLLSCAN' in stages:
+        flags.append('COLLSCAN')
+    if 'SORT' in stages:
+        flags.append('IN_MEMORY_SORT')
+    return {'stages': stages, 'indexes': sorted(set(indexes)), 'flags': flags}
+
+
+def run_explain(database, command):
+    return get_connection()[database].command({'explain': command, 'verbosity': 'queryPlanner'})
+
+
+def record_slow_operation(op, endpoint=None, method=None, path=None):
+    """Explain (once per shape and TTL), log and store one slow operation."""
+    redis_client = _redis()
+    collection = op['command'].get(op['command_name']) if op['command'] else None
+    collection = collection if isinstance(collection, str) else None
+    shape = query_shape(explainable(op['command_name'], op['command']) or {})
+    digest = shape_hash(op['command_name'], collection, shape)
+
+    plan_key = f"{SLOW_QUERY_PLAN_PREFIX}{digest}"
+    cached = redis_client.get(plan_key)
+    if cached:
+        plan = json.loads(cached)
+    else:
+        command = explainable(op['command_name'], op['command'])
+        if command is None:
+            plan = {'stages': [], 'indexes': [], 'flags': [], 'explain_error': 'not explainable'}
+        else:
+            try:
+                plan = summarize_plan(run_explain(op['database'], command))
+            except Exception as exc:  # explain must never break the request
+                plan = {'stages': [], 'indexes': [], 'flags': [], 'explain_error': str(exc)}
+        redis_client.setex(plan_key, current_app.config.get('SLOW_QUERY_EXPLAIN_TTL', 3600), json.dumps(plan))
+
+    entry = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'endpoint': endpoint,
+        'method': method,
+        'path': path,
+        'command': op['command_name'],
+        'database': op['database'],
+        'collection': collection,
+        'duration_ms': op['duration_ms'],
+        'shape': shape,
+        'shape_hash': digest,
+        'plan': plan,
+    }
+    current_app.logger.warning(
+        "Slow MongoDB %s on %s: %.1f ms from %s %s%s", entry['command'], collection, entry['duration_ms'],
+        method, endpoint, f" [{', '.join(plan['flags'])}]" if plan['flags'] else ''
+    )
+    redis_client.lpush(SLOW_QUERY_LOG_KEY, json.dumps(entry, default=str))
+    redis_client.ltrim(SLOW_QUERY_LOG_KEY, 0, current_app.config.get('SLOW_QUERY_LOG_SIZE', 500) - 1)
+    return entry
+
+
+def list_slow_queries(limit=50, flagged_only=False):
+    entries = (json.loads(raw) for raw in _redis().lrange(SLOW_QUERY_LOG_KEY, 0, -1))
+    if flagged_only:
+        entries = (e for e in entries if e['plan']['flags'])
+    result = []
+    for entry in entries:
+        result.append(entry)
+        if len(result) >= limit:
+            break
+    return result
+
+
+def clear_slow_queries():
+    # SCAN instead of KEYS, so clearing doesn't block Redis
+    redis_client = _redis()
+    redis_client.delete(SLOW_QUERY_LOG_KEY)
+    batch = []
+    for key in redis_client.scan_iter(match=f"{SLOW_QUERY_PLAN_PREFIX}*", count=CLEAR_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= CLEAR_BATCH_SIZE:
+            redis_client.delete(*batch)
+            batch = []
+    if batch:
+        redis_client.delete(*batch)
+
+
+class SlowQueryLog:
+    """
+    Flask extension recording slow MongoDB operations per request. Must be
+    initialised after ``Instrumentation``, which creates ``g.request_stats``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        threshold = current_app.config.get('SLOW_QUERY_MS', 100)
+        stats = g.get('request_stats')
+        if stats is not None and threshold:
+            stats.slow = []
+            stats.slow_threshold = threshold / 1000
+
+    def after_request(self, response):
+        stats = g.get('request_stats')
+        if stats is None or not stats.slow:
+            return response
+        slow, stats.slow = stats.slow, None  # the explains below are not slow queries
+        endpoint = request.url_rule.rule if request.url_rule else None
+        for op in slow:
+            # The request has already done its work; an unreachable Redis must not turn it into a 500
+            try:
+                record_slow_operation(op, endpoint, request.method, request.path)
+            except RedisError as exc:
+                current_app.logger.warning("Could not record slow MongoDB %s from %s %s: %s",
+                                           op['command_name'], request.method, endpoint, exc)
+        return response
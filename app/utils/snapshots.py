@@ -0,0 +1,296 @@
+"""
+Memory-mapped columnar snapshots of survey answers.
+
+Analytics of a survey with at least ``SNAPSHOT_MIN_RESPONSES`` responses
+read its answers from a snapshot on local disk instead of MongoDB. A
+snapshot lives in ``SNAPSHOT_DIR/<survey id>/`` and is a list of segments,
+newest first, plus a ``manifest.json`` tagged with the highest response
+``_id`` (and ``submitted_at``) it contains. Each segment is a directory of
+``.npy`` files holding the ``app.utils.columnar`` arrays, opened with
+``mmap_mode='r'`` so reading one copies nothing.
+
+On every analytics cache miss:
+
+1. responses newer than the manifest's ``last_id`` are read (through the
+   ``(survey, -submitted_at)`` index) and appended as a delta segment
+2. the survey's response count is compared with the snapshot's; fewer
+   responses than the snapshot holds means some were deleted or archived,
+   and the snapshot is rebuilt
+3. past ``SNAPSHOT_MAX_SEGMENTS`` segments, they are compacted into one
+4. if the store is over ``SNAPSHOT_DISK_BUDGET_MB``, the least recently
+   used snapshots are evicted
+
+Updates of a survey's snapshot are serialized with a ``flock``, so several
+workers on the host share it. A change to the survey's questions gives it a
+new fingerprint, and the snapshot is rebuilt. Maintenance that rewrites
+answers in place (archiving, purges, ``flask db normalize-answers``) calls
+``invalidate``; on other hosts the count check catches the deletions.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from flask import current_app
+from app.models import Response
+from app.utils import aggregates, columnar
+
+# Part of the fingerprint, so snapshots written in an older layout are rebuilt
+FORMAT = 3
+ARRAYS = {'multiple_choice': ('codes',), 'checkbox': ('masks', 'answered'),
+          'rating': ('values', 'answered'), 'text': ('lengths',)}
+# Responses are read back this far before the newest snapshotted submitted_at
+DELTA_SLACK = timedelta(minutes=5)
+
+
+def fingerprint(survey):
+    questions = [(q.question_id, q.type, list(q.choices)) for q in survey.questions]
+    return hashlib.sha1(json.dumps([FORMAT, questions]).encode('utf-8')).hexdigest()[:16]
+
+
+def _root():
+    return current_app.config.get('SNAPSHOT_DIR', 'snapshots')
+
+
+def _survey_dir(survey_id):
+    return os.path.join(_root(), str(survey_id))
+
+
+@contextmanager
+def _locked(survey_id):
+    os.makedirs(_root(), exist_ok=True)
+    with open(os.path.join(_root(), f'{survey_id}.lock'), 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def write_segment(path, columns):
+    """Save ``SurveyColumns`` as a segment directory (atomically renamed into place)."""
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'submitted_day.npy'), columns.columns['submitted_day'])
+    for k, question in enumerate(columns.questions):
+        for name in ARRAYS[question.type]:
+            np.save(os.path.join(tmp, f'q{k}.{name}.npy'), columns.columns[question.question_id][name])
+    with open(os.path.join(tmp, 'samples.json'), 'w') as fh:
+        json.dump(columns.samples, fh)
+    with open(os.path.join(tmp, 'terms.json'), 'w') as fh:
+        json.dump({qid: [q['terms'], q['terms_error']] for qid, q in columns.terms.items()}, fh)
+    os.replace(tmp, path)
+
+
+def read_segment(path, questions):
+    """Map a segment's arrays back into ``SurveyColumns`` without reading them."""
+    columns = {'submitted_day': np.load(os.path.join(path, 'submitted_day.npy'), mmap_mode='r')}
+    for k, question in enumerate(questions):
+        columns[question.question_id] = {name: np.load(os.path.join(path, f'q{k}.{name}.npy'), mmap_mode='r')
+                                         for name in ARRAYS[question.type]}
+    with open(os.path.join(path, 'samples.json')) as fh:
+        samples = json.load(fh)
+    with open(os.path.join(path, 'terms.json')) as fh:
+        terms = json.load(fh)
+    return columnar.SurveyColumns.from_arrays(questions, columns, samples, terms)
+
+
+def _read_manifest(survey):
+    try:
+        with open(os.path.join(_survey_dir(survey.id), 'manifest.json')) as fh:
+            manifest = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+    return manifest if manifest.get('fingerprint') == fingerprint(survey) else None
+
+
+def _write_manifest(survey_id, manifest):
+    path = os.path.join(_survey_dir(survey_id), 'manifest.json')
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(manifest, fh)
+    os.replace(path + '.tmp', path)
+
+
+def _add_segment(survey, manifest, columns):
+    name = f'seg-{columns.last_id}'
+    write_segment(os.path.join(_survey_dir(survey.id), name), columns)
+    manifest['segments'].insert(0, {'name': name, 'count': len(columns)})
+    manifest['count'] += len(columns)
+    manifest['last_id'] = str(max(ObjectId(manifest['last_id']), columns.last_id)) \
+        if manifest['last_id'] else str(columns.last_id)
+    if columns.newest is not None:
+        newest = columns.newest.isoformat()
+        manifest['newest'] = max(manifest['newest'] or newest, newest)
+
+
+def _build(survey):
+    shutil.rmtree(_survey_dir(survey.id), ignore_errors=True)
+    os.makedirs(_survey_dir(survey.id))
+    manifest = {'fingerprint': fingerprint(survey), 'segments': [], 'count': 0, 'last_id': None, 'newest': None}
+    _add_segment(survey, manifest, columnar.load_columns(survey, track_ids=True))
+    return manifest
+
+
+def _delta(survey, manifest):
+    """Responses added since the snapshot; the submitted_at bound lets Mongo use the survey index."""
+    query = {'_id': {'$gt': ObjectId(manifest['last_id'])}}
+    if manifest['newest']:
+        query['submitted_at'] = {'$gte': datetime.fromisoformat(manifest['newest']) - DELTA_SLACK}
+    return columnar.load_columns(survey, query=query, track_ids=True)
+
+
+def compact(survey, manifest):
+    """Merge all segments into one."""
+    segments = [read_segment(os.path.join(_survey_dir(survey.id), s['name']), survey.questions)
+                for s in manifest['segments']]
+    merged = columnar.SurveyColumns(survey.questions)
+    merged.columns = {'submitted_day': np.concatenate([s.columns['submitted_day'] for s in segments])}
+    for question in survey.questions:
+        qid = question.question_id
+        merged.columns[qid] = {name: np.concatenate([s.columns[qid][name] for s in segments])
+                               for name in ARRAYS[question.type]}
+        if question.type == 'text':
+            for segment in segments:
+                merged.samples[qid] = aggregates.merge_samples(merged.samples[qid], segment.samples.get(qid, []),
+                                                               merged.sampling[0])
+            for segment in segments:
+                merged.terms[qid]['terms'].update(segment.terms[qid]['terms'])
+                merged.terms[qid]['terms_error'] += segment.terms[qid]['terms_error']
+            aggregates.trim_terms(merged.terms[qid], aggregates.TERMS_LIMIT)
+    name = f"seg-{manifest['last_id']}-compacted"
+    write_segment(os.path.join(_survey_dir(survey.id), name), merged)
+    old = [s['name'] for s in manifest['segments']]
+    manifest['segments'] = [{'name': name, 'count': manifest['count']}]
+    _write_manifest(survey.id, manifest)
+    for segment in old:
+        shutil.rmtree(os.path.join(_survey_dir(survey.id), segment), ignore_errors=True)
+
+
+def refresh(survey):
+    """Bring the survey's snapshot up to date and return its segments, newest first."""
+    responses = Response._get_collection()
+    with _locked(survey.id):
+        manifest = _read_manifest(survey)
+        if manifest is not None:
+            for attempt in range(2):
+                delta = _delta(survey, manifest)
+                total = responses.count_documents({'survey': survey.id})
+                expected = manifest['count'] + len(delta)
+                if expected == total:
+                    break
+                # The snapshot plus delta holds more responses than the collection: some were
+                # deleted or archived, rebuild. It holds fewer: a concurrent insert (try again once)
+                # or one submitted before the snapshot's newest that the delta can't see.
+                if expected > total or attempt:
+                    manifest = None
+                    break
+            if manifest is not None and len(delta):
+                _add_segment(survey, manifest, delta)
+                _write_manifest(survey.id, manifest)
+                if len(manifest['segments']) > current_app.config.get('SNAPSHOT_MAX_SEGMENTS', 8):
+                    compact(survey, manifest)
+        if manifest is None:
+            manifest = _build(survey)
+            _write_manifest(survey.id, manifest)
+        os.utime(os.path.join(_survey_dir(survey.id), 'manifest.json'))  # last use, for LRU eviction
+        segments = [read_segment(os.path.join(_survey_dir(survey.id), s['name']), survey.questions)
+                    for s in manifest['segments']]
+    evict(keep=str(survey.id))
+    return segments
+
+
+def survey_columns(survey):
+    """The survey's refreshed snapshot segments, or None when it doesn't get a snapshot."""
+    config = current_app.config
+    if not config.get('SNAPSHOTS_ENABLED', False):
+        return None
+    count = Response._get_collection().count_documents({'survey': survey.id})
+    if count == 0 or count < config.get('SNAPSHOT_MIN_RESPONSES', 10000):
+        return None
+    try:
+        return refresh(survey)
+    except columnar.ColumnarUnsupported:
+        return None
+
+
+def survey_state(survey):
+    """The analytics state of the survey's live responses, from its snapshot when it has one."""
+    segments = survey_columns(survey)
+    if segments is None:
+        return columnar.survey_state(survey)
+    state = aggregates.empty()
+    for segment in segments:
+        aggregates.combine(state, segment.state())
+    return state
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def list_snapshots():
+    """``[{'survey', 'bytes', 'segments', 'responses', 'last_used'}]``, most recently used first."""
+    root = _root()
+    if not os.path.isdir(root):
+        return []
+    snapshots = []
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        manifest_path = os.path.join(entry.path, 'manifest.json')
+        try:
+            with open(manifest_path) as fh:
+                manifest = json.load(fh)
+            last_used = os.path.getmtime(manifest_path)
+        except (FileNotFoundError, ValueError):
+            manifest, last_used = {}, 0
+        snapshots.append({'survey': entry.name, 'bytes': _dir_size(entry.path),
+                          'segments': len(manifest.get('segments', ())), 'responses': manifest.get('count', 0),
+                          'last_used': last_used})
+    snapshots.sort(key=lambda s: s['last_used'], reverse=True)
+    return snapshots
+
+
+def evict(keep=None):
+    """Delete least recently used snapshots until the store fits ``SNAPSHOT_DISK_BUDGET_MB``."""
+    budget = current_app.config.get('SNAPSHOT_DISK_BUDGET_MB', 1024) * 1024 * 1024
+    snapshots = list_snapshots()
+    total = sum(s['bytes'] for s in snapshots)
+    evicted = []
+    for snapshot in reversed(snapshots):
+        if total <= budget:
+            break
+        if snapshot['survey'] == keep:
+            continue
+        invalidate(snapshot['survey'])
+        total -= snapshot['bytes']
+        evicted.append(snapshot['survey'])
+    return evicted
+
+
+def invalidate(survey_id):
+    """Drop the survey's snapshot; open memory maps of it stay valid until closed."""
+    if not os.path.isdir(_survey_dir(survey_id)):
+        return
+    with _locked(survey_id):
+        shutil.rmtree(_survey_dir(survey_id), ignore_errors=True)
+
+
+def clear():
+    """Drop every snapshot; returns how many there were."""
+    snapshots = list_snapshots()
+    for snapshot in snapshots:
+        invalidate(snapshot['survey'])
+    return len(snapshots)
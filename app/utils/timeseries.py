@@ -0,0 +1,172 @@
+"""
+Response time series bucketed in a time zone.
+
+``bucket_counts`` lets MongoDB group a survey's responses with
+``$dateTrunc`` (hour, day, week starting Monday, or month, in the requested
+IANA time zone). The ``submitted_at`` window goes into the ``$match`` and is
+served by the ``(survey, -submitted_at)`` index, so a "last 24 hours" series
+reads only the responses of those 24 hours. ``series`` fills empty buckets
+with zeros and adds the running total.
+
+Bucket starts are wall-clock times in the zone, so a day is 23 or 25 hours
+long across a DST change, while hourly buckets are always 60 minutes.
+
+Windows are checked before anything is read: bounds must fall between
+``EARLIEST`` and ``LATEST``, ``from`` must be before ``to``, and ``series``
+refuses to fill in more than ``max_buckets`` buckets (``ANALYTICS_MAX_BUCKETS``
+for the API), since an hourly series over decades would otherwise build
+hundreds of thousands of them.
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.models import Response
+
+INTERVALS = {'hourly': 'hour', 'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+UTC = ZoneInfo('UTC')
+# Window bounds accepted by parse_bound, far enough from datetime.min/max to step a bucket past them
+EARLIEST = datetime(1970, 1, 1)
+LATEST = datetime(9999, 1, 1)
+
+
+def parse_timezone(name):
+    """The ``ZoneInfo`` for an IANA name; raises ``ValueError`` for unknown ones."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {name}")
+
+
+def parse_bound(value, zone):
+    """An ISO 8601 date or datetime (in ``zone`` unless it has an offset) as naive UTC."""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date or time: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=zone)
+    try:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    except OverflowError:
+        raise ValueError(f"Date or time out of range: {value}")
+    if not EARLIEST <= moment <= LATEST:
+        raise ValueError(f"Date or time out of range: {value}")
+    return moment
+
+
+def parse_window(args, zone):
+    """``(start, end)`` of the ``from`` and ``to`` request arguments, each None when missing."""
+    start, end = (parse_bound(args[name], zone) if args.get(name) else None for name in ('from', 'to'))
+    if start is not None and end is not None and start >= end:
+        raise ValueError("from must be earlier than to.")
+    return start, end
+
+
+def window_query(start=None, end=None):
+    """``submitted_at`` condition for the half-open window ``[start, end)``."""
+    bounds = {}
+    if start is not None:
+        bounds['$gte'] = start
+    if end is not None:
+        bounds['$lt'] = end
+    return {'submitted_at': bounds} if bounds else {}
+
+
+def truncate(moment, interval, zone):
+    """Start of the bucket holding the naive UTC ``moment``, as an aware datetime in ``zone``."""
+    local = moment.replace(tzinfo=timezone.utc).astimezone(zone)
+    if interval == 'hourly':
+        return local.replace(minute=0, second=0, microsecond=0)
+    day = local.date()
+    if interval == 'weekly':
+        day -= timedelta(days=day.weekday())
+    elif interval == 'monthly':
+        day = day.replace(day=1)
+    return datetime(day.year, day.month, day.day, tzinfo=zone)
+
+
+def _next(bucket, interval, zone):
+    if interval == 'hourly':
+        return (bucket.astimezone(timezone.utc) + timedelta(hours=1)).astimezone(zone)
+    day = bucket.date()
+    if interval == 'daily':
+        day += timedelta(days=1)
+    elif interval == 'weekly':
+        day += timedelta(days=7)
+    else:
+        day = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return datetime(day.year, day.month, day.day, tzinfo=zone)
+
+
+def count_buckets(first, last, interval):
+    """How many buckets there are from the bucket ``first`` to the bucket ``last``, both included."""
+    if interval == 'hourly':
+        return int(last.timestamp() - first.timestamp()) // 3600 + 1
+    if interval == 'monthly':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last.date() - first.date()).days // (7 if interval == 'weekly' else 1) + 1
+
+
+def label(bucket, interval):
+    return bucket.isoformat() if interval == 'hourly' else bucket.date().isoformat()
+
+
+def bucket_counts(survey_id, interval, zone=UTC, start=None, end=None, query=None):
+    """``{bucket label: responses}`` for the survey's responses in ``[start, end)`` (matching ``query``)."""
+    pipeline = [
+        {'$match': dict(query or {}, **window_query(start, end), survey=survey_id)},
+        {'$group': {
+            '_id': {'$dateTrunc': {'date': '$submitted_at', 'unit': INTERVALS[interval],
+                                   'timezone': zone.key, 'startOfWeek': 'monday'}},
+            'count': {'$sum': 1},
+        }},
+    ]
+    counts = {}
+    for row in Response._get_collection().aggregate(pipeline):
+        if row['_id'] is not None:  # responses without submitted_at
+            bucket = row['_id'].replace(tzinfo=timezone.utc).astimezone(zone)
+            counts[label(bucket, interval)] = row['count']
+    return counts
+
+
+def series(counts, interval, zone=UTC, first=None, last=None, max_buckets=None):
+    """
+    ``[{'date', 'count', 'cumulative'}]`` from the bucket of ``first`` to the
+    one of ``last`` (naive UTC), or over the buckets in ``counts``, with
+    empty buckets filled in. Raises ``ValueError`` past ``max_buckets``.
+    """
+    def bounds():
+        for key in counts:
+            moment = datetime.fromisoformat(key)
+            moment = moment.replace(tzinfo=zone) if moment.tzinfo is None else moment
+            yield moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+    known = list(bounds())
+    first = min(known + [first] if first is not None else known, default=None)
+    last = max(known + [last] if last is not None else known, default=None)
+    if first is None or first > last:
+        return []
+    bucket, stop = truncate(first, interval, zone), truncate(last, interval, zone)
+    if max_buckets is not None and count_buckets(bucket, stop, interval) > max_buckets:
+        raise ValueError(f"The time series would have more than {max_buckets} {interval} buckets; "
+                         f"narrow the from/to window or use a longer interval.")
+    result, cumulative = [], 0
+    while bucket.timestamp() <= stop.timestamp():  # same-zone comparisons ignore DST folds
+        key = label(bucket, interval)
+        cumulative += counts.get(key, 0)
+        result.append({'date': key, 'count': counts.get(key, 0), 'cumulative': cumulative})
+        bucket = _next(bucket, interval, zone)
+    return result
+
+
+def span(start=None, end=None):
+    """``(first, last)`` moments a series over ``[start, end)`` covers; an open end is now."""
+    if end is not None:
+        return start, end - timedelta(microseconds=1)
+    return start, datetime.utcnow() if start is not None else None
+
+
+def survey_series(survey_id, interval, zone=UTC, start=None, end=None, query=None, max_buckets=None):
+    """The gap-filled time series of the survey's live responses in ``[start, end)`` (matching ``query``)."""
+    first, last = span(start, end)
+    counts = bucket_counts(survey_id, interval, zone, start, end, query)
+    return series(counts, interval, zone, first, last, max_buckets)
@@ -0,0 +1,115 @@
+"""
+Anonymized request trace capture for load replay.
+
+When ``TRACE_CAPTURE_ENABLED`` is set, every request (except the paths in
+``TRACE_CAPTURE_EXCLUDE``) is appended as one JSON line to
+``TRACE_CAPTURE_PATH``. The ``{pid}`` placeholder in the path gives each
+gunicorn worker its own file. A line holds the request's shape only:
+
+* the route template (``/surveys/<string:survey_id>/analytics``) and
+  pseudonyms for its path parameters, stable within a capture so repeated
+  hits on the same survey stay recognisable
+* query argument names, with values kept only for the
+  ``TRACE_CAPTURE_SAFE_ARGS`` (paging, formats, intervals)
+* the caller's role, request/response sizes, status and duration
+
+``benchmarks/replay.py`` replays these files against a local instance.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+DEFAULT_SAFE_ARGS = ('page', 'per_page', 'format', 'interval', 'time_series')
+DEFAULT_EXCLUDE = ('/metrics', '/apidocs', '/apispec', '/flasgger_static', '/admin')
+REDACTED = '<redacted>'
+
+
+def pseudonym(value, salt):
+    return hashlib.sha256(f'{salt}:{value}'.encode('utf-8')).hexdigest()[:12]
+
+
+def request_role():
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return 'invalid'
+    return get_jwt().get('role', 'anonymous')
+
+
+def trace_record(response, duration, salt, safe_args):
+    rule = request.url_rule
+    return {
+        'ts': round(time.time(), 6),
+        'method': request.method,
+        'route': rule.rule if rule else None,
+        'path_params': {k: pseudonym(v, salt) for k, v in (request.view_args or {}).items()},
+        'args': {k: (v if k in safe_args else REDACTED) for k, v in request.args.items()},
+        'role': request_role(),
+        'content_type': request.mimetype or None,
+        'accept': request.headers.get('Accept'),
+        'request_bytes': request.content_length or 0,
+        'status': response.status_code,
+        'response_bytes': response.content_length,
+        'duration_ms': round(duration * 1000, 3),
+    }
+
+
+def load_traces(path):
+    """Yield the records of a trace file, skipping unmatched routes."""
+    with open(path) as fh:
+        for line in fh:
+            if line.strip():
+                record = json.loads(line)
+                if record.get('route'):
+                    yield record
+
+
+class TraceRecorder:
+    """Flask extension appending anonymized request shapes to a JSONL file."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Pseudonyms are only comparable within one capture, never across
+        self.salt = os.urandom(8).hex()
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def _file(self, path_template):
+        path = path_template.format(pid=os.getpid())
+        fh = self._files.get(path)
+        if fh is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            fh = self._files[path] = open(path, 'a', buffering=1)  # line buffered
+        return fh
+
+    def before_request(self):
+        config = current_app.config
+        if not config.get('TRACE_CAPTURE_ENABLED', False):
+            return
+        if request.path.startswith(tuple(config.get('TRACE_CAPTURE_EXCLUDE', DEFAULT_EXCLUDE))):
+            return
+        if random.random() >= config.get('TRACE_SAMPLE_RATE', 1.0):
+            return
+        g.trace_started = time.perf_counter()
+
+    def after_request(self, response):
+        started = g.pop('trace_started', None)
+        if started is None:
+            return response
+        config = current_app.config
+        record = trace_record(response, time.perf_counter() - started, self.salt,
+                              config.get('TRACE_CAPTURE_SAFE_ARGS', DEFAULT_SAFE_ARGS))
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file(config.get('TRACE_CAPTURE_PATH', 'traces/requests-{pid}.jsonl')).write(line)
+        return response
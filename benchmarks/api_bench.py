@@ -0,0 +1,217 @@
+"""
+End-to-end API benchmark at realistic data volumes.
+
+    python benchmarks/api_bench.py --scales 10000 100000 --output bench.json
+    python benchmarks/api_bench.py --scales 10000 --compare bench.json
+
+For every scale a dedicated database (``survey_api_bench`` by default, it is
+dropped first) is filled with one large survey of ``--questions`` questions
+and that many responses, plus ``--surveys`` small surveys for listing. The
+data comes from ``app.utils.datagen`` with unordered bulk inserts, then the
+declared indexes are built as ``flask db ensure-indexes`` would. Each
+scenario is then driven through the Flask test client against the local
+mongod and Redis, and the script reports throughput, p50/p95/p99 latency and
+peak RSS. The results file also records the commit and parameters, so runs
+from different commits can be compared with ``--compare``.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from random import Random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import cache, create_app  # noqa: E402
+from app.config import Config  # noqa: E402
+from app.utils import datagen  # noqa: E402
+from app.utils.indexes import ensure_indexes, managed_models  # noqa: E402
+
+SCENARIOS = ('analytics', 'analytics_cached', 'export_json', 'export_csv', 'list_responses',
+             'list_responses_deep', 'list_surveys', 'submit_response')
+# Scenarios reading the whole survey are far slower; run them fewer times
+HEAVY = {'analytics', 'export_json', 'export_csv'}
+
+
+class BenchConfig(Config):
+    MONGODB_SETTINGS = dict(Config.MONGODB_SETTINGS,
+                            host=os.getenv('BENCH_MONGODB_URI', 'mongodb://localhost:27017/survey_api_bench'))
+    RATELIMIT_ENABLED = False
+    SLOW_QUERY_MS = 0
+    PROFILING_ENABLED = False
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def build_indexes(db):
+    """Build the declared indexes, which models don't create on first use, in the benchmark database."""
+    bound = {model._get_collection().database.name for model in managed_models()}
+    if bound != {db.name}:
+        raise RuntimeError(f"models are bound to {sorted(bound)}, not to the benchmark database {db.name}")
+    ensure_indexes()
+
+
+def populate(db, scale, questions, surveys, seed):
+    """
+    Drop the benchmark database, fill it and build its indexes (after the
+    inserts, which is faster); returns (survey, admin, respondent ids, seconds).
+    """
+    db.client.drop_database(db.name)
+    rng = Random(seed)
+    started = time.perf_counter()
+    admin = datagen.make_users(1, rng, prefix='benchadmin', role='admin')[0]
+    respondents = datagen.make_users(1000, rng, prefix='benchuser')
+    db.users.insert_many([admin] + respondents, ordered=False)
+    respondent_ids = [u['_id'] for u in respondents]
+
+    survey = datagen.make_survey(admin['_id'], rng, questions=questions, title='Benchmark survey')
+    small = [datagen.make_survey(admin['_id'], rng, questions=4) for _ in range(surveys)]
+    db.surveys.insert_many([survey] + small, ordered=False)
+    datagen.insert_batches(db.responses, datagen.make_responses(survey, scale, rng, respondent_ids))
+    build_indexes(db)
+    return survey, admin, respondent_ids, time.perf_counter() - started
+
+
+def build_requests(survey, scale, rng):
+    survey_id = str(survey['_id'])
+    last_page = max(1, scale // 10)
+    answers = [{'question_id': q['question_id'], 'value': datagen.make_answer(q, rng)} for q in survey['questions']]
+    return {
+        'analytics': ('GET', f'/surveys/{survey_id}/analytics', None),
+        'analytics_cached': ('GET', f'/surveys/{survey_id}/analytics', None),
+        'export_json': ('GET', f'/surveys/{survey_id}/export?format=json', None),
+        'export_csv': ('GET', f'/surveys/{survey_id}/export?format=csv', None),
+        'list_responses': ('GET', f'/surveys/{survey_id}/responses?page=1&per_page=10', None),
+        'list_responses_deep': ('GET', f'/surveys/{survey_id}/responses?page={last_page}&per_page=10', None),
+        'list_surveys': ('GET', '/surveys/?page=1&per_page=10', None),
+        'submit_response': ('POST', f'/surveys/{survey_id}/responses', {'answers': answers}),
+    }
+
+
+def run_scenario(client, headers, name, request, iterations, warmup):
+    method, url, body = request
+    latencies = []
+    started = time.perf_counter()
+    for i in range(warmup + iterations):
+        if name == 'analytics':
+            cache.clear()  # measure the computation, not the cache
+        t0 = time.perf_counter()
+        resp = client.open(url, method=method, json=body, headers=headers)
+        elapsed = time.perf_counter() - t0
+        if resp.status_code >= 400:
+            raise RuntimeError(f"{name}: {method} {url} returned {resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+        if i >= warmup:
+            latencies.append(elapsed)
+        else:
+            started = time.perf_counter()
+    total = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'throughput_rps': round(iterations / total, 2) if total else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, baseline_path):
+    old = {(r['scale'], name): s for r in baseline['runs'] for name, s in r['scenarios'].items()}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    print(f"{'scale':>9} {'scenario':<21} {'p50':>9} {'p95':>9} {'rps':>9}")
+    for run in results['runs']:
+        for name, new in run['scenarios'].items():
+            prev = old.get((run['scale'], name))
+            if not prev:
+                continue
+            delta = {k: (new[k] - prev[k]) / prev[k] * 100 if prev[k] else 0.0
+                     for k in ('p50_ms', 'p95_ms', 'throughput_rps')}
+            print(f"{run['scale']:>9} {name:<21} {delta['p50_ms']:>+8.1f}% {delta['p95_ms']:>+8.1f}% "
+                  f"{delta['throughput_rps']:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[10_000, 100_000],
+                        help='Responses in the benchmark survey, one run per value (e.g. 10000 100000 1000000).')
+    parser.add_argument('--questions', type=int, default=8, help='Questions in the benchmark survey.')
+    parser.add_argument('--surveys', type=int, default=500, help='Additional small surveys for listing.')
+    parser.add_argument('--requests', type=int, default=30, help='Timed requests per scenario.')
+    parser.add_argument('--heavy-requests', type=int, default=5, help='Timed requests for analytics and exports.')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', metavar='RESULTS', help='Print the change against an earlier results file.')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:  # read first, --output may overwrite the same file
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+
+    app = create_app(BenchConfig)
+    client = app.test_client()
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'runs': [],
+    }
+
+    with app.app_context():
+        from flask_jwt_extended import create_access_token
+        from mongoengine.connection import get_db
+        db = get_db()
+        for scale in args.scales:
+            survey, admin, _, seed_s = populate(db, scale, args.questions, args.surveys, args.seed)
+            print(f"\n{scale} responses: seeded in {seed_s:.1f} s ({scale / seed_s:,.0f} responses/s)")
+            token = create_access_token(identity=str(admin['_id']), additional_claims={'role': 'admin'})
+            headers = {'Authorization': f'Bearer {token}'}
+            requests = build_requests(survey, scale, Random(args.seed))
+            cache.clear()
+            run = {'scale': scale, 'questions': args.questions, 'seed_seconds': round(seed_s, 2), 'scenarios': {}}
+            print(f"{'scenario':<21} {'rps':>8} {'p50 [ms]':>10} {'p95 [ms]':>10} {'p99 [ms]':>10} {'RSS [MB]':>9}")
+            for name in args.scenarios:
+                iterations = args.heavy_requests if name in HEAVY else args.requests
+                stats = run_scenario(client, headers, name, requests[name], iterations, args.warmup)
+                run['scenarios'][name] = stats
+                print(f"{name:<21} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} "
+                      f"{stats['p99_ms']:>10.1f} {stats['peak_rss_mb']:>9.1f}")
+            results['runs'].append(run)
+        db.client.drop_database(db.name)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if baseline:
+        compare(results, baseline, args.compare)
+
+
+if __name__ == '__main__':
+    main()
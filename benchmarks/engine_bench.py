@@ -0,0 +1,121 @@
+"""
+In-process benchmark of the analytics engines, without MongoDB.
+
+    python benchmarks/engine_bench.py --responses 100000 1000000 --questions 8
+
+Generates responses with ``app.utils.datagen`` in memory and times the
+per-answer path (``app.utils.aggregates``) against the columnar one
+(``app.utils.columnar``) on the same documents, checking that both produce
+the same analytics.
+
+The "+ decode" columns add BSON decoding, which dominates on large surveys:
+each path decodes ``CHUNK_SIZE``-response batches encoded the way MongoDB
+sends them to it, the per-answer path's ``{_id, submitted_at, answers}``
+documents and the columnar path's ``flat_pipeline`` ones, the latter
+with the garbage collector paused like ``load_columns`` does. Reading the
+batches from MongoDB is not included; ``api_bench.py`` measures the whole
+request.
+"""
+import argparse
+import os
+import sys
+import time
+from random import Random
+import bson
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.models import Question  # noqa: E402
+from app.utils import aggregates, datagen  # noqa: E402
+from app.utils.columnar import CHUNK_SIZE, SurveyColumns, paused_gc  # noqa: E402
+
+
+def per_answer(questions, docs):
+    types = {q.question_id: q.type for q in questions}
+    state = aggregates.empty()
+    for doc in docs:
+        aggregates.add_response(state, types, doc)
+    return aggregates.finalize(state, questions, 'daily')
+
+
+def columnar(questions, docs):
+    columns = SurveyColumns(questions)
+    for start in range(0, len(docs), CHUNK_SIZE):
+        columns.add_chunk(docs[start:start + CHUNK_SIZE])
+    return aggregates.finalize(columns.finish().state(), questions, 'daily')
+
+
+def per_answer_bson(questions, batches):
+    types = {q.question_id: q.type for q in questions}
+    state = aggregates.empty()
+    for batch in batches:
+        for doc in bson.decode_all(batch):
+            aggregates.add_response(state, types, doc)
+    return aggregates.finalize(state, questions, 'daily')
+
+
+def columnar_bson(questions, batches):
+    columns = SurveyColumns(questions)
+    with paused_gc():  # as load_columns does
+        for batch in batches:
+            columns.add_flat_chunk(bson.decode_all(batch))
+    return aggregates.finalize(columns.finish().state(), questions, 'daily')
+
+
+def encode(docs, shape):
+    """``CHUNK_SIZE``-document BSON batches of the docs in ``shape``."""
+    return [b''.join(bson.encode(shape(doc)) for doc in docs[start:start + CHUNK_SIZE])
+            for start in range(0, len(docs), CHUNK_SIZE)]
+
+
+def documents(doc):
+    return {'_id': doc['_id'], 'submitted_at': doc['submitted_at'], 'answers': doc['answers']}
+
+
+def flat(doc):
+    return {'_id': doc['_id'], 'submitted_at': doc['submitted_at'],
+            'qids': [a['question_id'] for a in doc['answers']], 'values': [a['value'] for a in doc['answers']]}
+
+
+def best_of(repeat, fn, *args):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', type=int, nargs='+', default=[100000])
+    parser.add_argument('--questions', type=int, default=8)
+    parser.add_argument('--choices', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'responses':>10} {'per-answer [s]':>15} {'columnar [s]':>13} {'speed-up':>9} "
+          f"{'per-answer + decode [s]':>24} {'columnar + decode [s]':>22} {'speed-up':>9}")
+    for count in args.responses:
+        rng = Random(args.seed)
+        survey = datagen.make_survey(None, rng, questions=args.questions, choices=args.choices)
+        questions = [Question(**q) for q in survey['questions']]
+        docs = list(datagen.make_responses(survey, count, rng))
+        slow, expected = best_of(args.repeat, per_answer, questions, docs)
+        fast, result = best_of(args.repeat, columnar, questions, docs)
+        if result != expected:
+            raise SystemExit(f"Columnar analytics differ from the per-answer ones at {count} responses")
+        document_batches, flat_batches = encode(docs, documents), encode(docs, flat)
+        del docs
+        slow_decoded, _ = best_of(args.repeat, per_answer_bson, questions, document_batches)
+        fast_decoded, result = best_of(args.repeat, columnar_bson, questions, flat_batches)
+        if result != expected:
+            raise SystemExit(f"Columnar analytics of the decoded batches differ at {count} responses")
+        print(f"{count:>10} {slow:>15.3f} {fast:>13.3f} {slow / fast:>8.1f}x "
+              f"{slow_decoded:>24.3f} {fast_decoded:>22.3f} {slow_decoded / fast_decoded:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure worker startup time and memory of the gunicorn profile with and
+without ``preload_app``.
+
+    python benchmarks/preload_memory.py --workers 4
+
+For each mode gunicorn is started from gunicorn.conf.py, the script waits
+until every worker has loaded the app, then reads RSS, PSS and USS of the
+master and workers from /proc/<pid>/smaps_rollup (Linux only). PSS splits
+shared pages between the processes sharing them, so its total is the real
+memory cost of the server. No MongoDB or Redis is needed: connections are
+opened lazily.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Wraps the real profile and drops a marker file once a worker has loaded the app
+BENCH_CONFIG = """
+exec(open({config!r}).read())
+
+def post_worker_init(worker):
+    open(__import__('os').path.join({ready_dir!r}, str(worker.pid)), 'w').close()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as fh:
+        return [int(p) for p in fh.read().split()]
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def run(preload, workers, timeout):
+    with tempfile.TemporaryDirectory() as ready_dir:
+        config_path = os.path.join(ready_dir, 'bench.conf.py')
+        with open(config_path, 'w') as fh:
+            fh.write(BENCH_CONFIG.format(config=os.path.join(ROOT, 'gunicorn.conf.py'), ready_dir=ready_dir))
+        env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0', WEB_CONCURRENCY=str(workers),
+                   GUNICORN_BIND=f'127.0.0.1:{free_port()}', GUNICORN_ACCESS_LOG='', GUNICORN_LOG_LEVEL='warning')
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', config_path, 'wsgi:app'], cwd=ROOT, env=env)
+        try:
+            while len(os.listdir(ready_dir)) - 1 < workers:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"gunicorn exited with status {proc.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError("Timed out waiting for workers")
+                time.sleep(0.01)
+            ready_s = time.perf_counter() - started
+            time.sleep(1)  # let workers settle before sampling memory
+            master = memory_kb(proc.pid)
+            worker_mem = [memory_kb(pid) for pid in child_pids(proc.pid)]
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+
+    total = {key: master[key] + sum(w[key] for w in worker_mem) for key in master}
+    return {
+        'preload': preload,
+        'workers': workers,
+        'ready_seconds': round(ready_s, 3),
+        'master_kb': master,
+        'worker_avg_kb': {key: sum(w[key] for w in worker_mem) // len(worker_mem) for key in master},
+        'total_kb': total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode; the median ready time is reported.')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    results = []
+    for preload in (False, True):
+        runs = sorted((run(preload, args.workers, args.timeout) for _ in range(args.repeat)),
+                      key=lambda r: r['ready_seconds'])
+        results.append(runs[len(runs) // 2])
+
+    print(f"{'mode':<12} {'ready [s]':>10} {'worker USS [MB]':>16} {'total PSS [MB]':>15} {'total RSS [MB]':>15}")
+    for r in results:
+        print(f"{'preload' if r['preload'] else 'no preload':<12} {r['ready_seconds']:>10.2f} "
+              f"{r['worker_avg_kb']['uss'] / 1024:>16.1f} {r['total_kb']['pss'] / 1024:>15.1f} "
+              f"{r['total_kb']['rss'] / 1024:>15.1f}")
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Replay captured request traces against a local instance.
+
+    TRACE_CAPTURE_ENABLED=1 gunicorn -c gunicorn.conf.py wsgi:app   # capture
+    python benchmarks/replay.py traces/*.jsonl --base-url http://127.0.0.1:8000 --speedup 4 --concurrency 16
+
+Traces come from ``app.utils.tracing`` and only hold request shapes, so the
+replay rebuilds concrete requests against the target's own data. Path
+parameter pseudonyms map to local surveys, responses, questions and users
+through a stable hash, so a hot survey in the capture stays hot in the
+replay. Callers get a freshly minted token for their recorded role. Response
+submissions get synthetic answers matching the local survey. Other writes
+(PUT/PATCH/DELETE, survey and user creation) are skipped unless
+``--include-writes`` is given.
+
+Requests are sent open-loop at their recorded offsets divided by
+``--speedup`` (0 sends them as fast as ``--concurrency`` allows). The report
+lists count, errors and p50/p95/p99 latency per route.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+from urllib.parse import urlencode, urlsplit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+# api_bench is a sibling script, importable however this one is started
+sys.path[:0] = [ROOT, BENCHMARKS]
+
+from app import create_app  # noqa: E402
+from app.utils import datagen  # noqa: E402
+from app.utils.tracing import REDACTED, load_traces  # noqa: E402
+from api_bench import percentile  # noqa: E402
+
+SUBMIT_ROUTE = '/surveys/<string:survey_id>/responses'
+
+
+class LocalData:
+    """Ids and tokens of the target's database used to fill in the traces."""
+
+    def __init__(self, app):
+        from flask_jwt_extended import create_access_token
+        from app.models import Response, Survey, User
+        with app.app_context():
+            self.surveys = list(Survey.objects.only('id', 'questions').order_by('id').as_pymongo())
+            if not self.surveys:
+                raise SystemExit("The target database has no surveys; seed it first (flask seed-bulk).")
+            self.users = [u['_id'] for u in User.objects.only('id').order_by('id').as_pymongo()]
+            self.tokens = {'anonymous': None, 'invalid': 'invalid.token.value'}
+            for role in ('admin', 'respondent'):
+                user = User.objects(role=role).order_by('id').first()
+                if user:
+                    self.tokens[role] = create_access_token(identity=str(user.id), additional_claims={'role': role})
+            self.responses = {}
+            for survey in self.surveys:
+                first = Response.objects(survey=survey['_id']).only('id').first()
+                self.responses[survey['_id']] = first.id if first else None
+
+    @staticmethod
+    def pick(pool, key):
+        return pool[int(key, 16) % len(pool)]
+
+    def resolve(self, record):
+        """Return (path, survey) for a trace record, or None if it can't be mapped."""
+        params = record['path_params']
+        survey = self.pick(self.surveys, params['survey_id']) if 'survey_id' in params else None
+        values = {}
+        for name, key in params.items():
+            if name == 'survey_id':
+                values[name] = str(survey['_id'])
+            elif name == 'response_id':
+                response_id = self.responses.get(survey['_id']) if survey else None
+                if response_id is None:
+                    return None
+                values[name] = str(response_id)
+            elif name == 'question_id':
+                if not survey or not survey['questions']:
+                    return None
+                values[name] = self.pick(survey['questions'], key)['question_id']
+            elif name == 'user_id':
+                values[name] = str(self.pick(self.users, key))
+            else:
+                return None
+        path = record['route']
+        for name, value in values.items():
+            path = path.replace(f'<string:{name}>', value).replace(f'<{name}>', value)
+        args = {k: v for k, v in record['args'].items() if v != REDACTED}
+        return (f'{path}?{urlencode(args)}' if args else path), survey
+
+
+def build_requests(records, data, include_writes, seed):
+    rng = Random(seed)
+    requests, skipped = [], defaultdict(int)
+    for record in records:
+        key = f"{record['method']} {record['route']}"
+        body = None
+        if record['method'] in ('PUT', 'PATCH', 'DELETE') or (
+                record['method'] == 'POST' and record['route'] != SUBMIT_ROUTE):
+            if not include_writes:
+                skipped[key] += 1
+                continue
+            body = {}
+        resolved = data.resolve(record)
+        if resolved is None:
+            skipped[key] += 1
+            continue
+        path, survey = resolved
+        if record['method'] == 'POST' and record['route'] == SUBMIT_ROUTE:
+            body = {'answers': [{'question_id': q['question_id'], 'value': datagen.make_answer(q, rng)}
+                                for q in survey['questions']]}
+        headers = {'Accept': record.get('accept') or 'application/json', 'Accept-Encoding': 'gzip'}
+        token = data.tokens.get(record['role'])
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        requests.append((record['ts'], key, record['method'], path, body, headers))
+    requests.sort(key=lambda r: r[0])
+    return requests, skipped
+
+
+class Client(threading.local):
+    """One keep-alive connection per replay thread."""
+
+    def __init__(self, base_url):
+        self.url = urlsplit(base_url)
+        self.conn = None
+
+    def send(self, method, path, body, headers):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+            self.conn = cls(self.url.hostname, self.url.port, timeout=60)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers = dict(headers, **{'Content-Type': 'application/json'})
+        try:
+            self.conn.request(method, path, payload, headers)
+            resp = self.conn.getresponse()
+            resp.read()
+            return resp.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+
+
+def replay(requests, base_url, concurrency, speedup):
+    client = Client(base_url)
+    results = defaultdict(list)  # route -> [(latency, status)]
+    lags = []
+    lock = threading.Lock()
+
+    def run(key, method, path, body, headers, scheduled):
+        started = time.perf_counter()
+        try:
+            status = client.send(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status = None
+        with lock:
+            results[key].append((time.perf_counter() - started, status))
+            lags.append(max(0.0, started - scheduled))
+
+    first_ts = requests[0][0] if requests else 0
+    replay_started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for ts, key, method, path, body, headers in requests:
+            scheduled = replay_started + ((ts - first_ts) / speedup if speedup else 0)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, key, method, path, body, headers, scheduled)
+    return results, lags, time.perf_counter() - replay_started
+
+
+def summarize(results, lags, elapsed):
+    routes = {}
+    for key, samples in sorted(results.items()):
+        latencies = sorted(s[0] for s in samples)
+        statuses = [s[1] for s in samples]
+        routes[key] = {
+            'count': len(samples),
+            'errors': sum(1 for s in statuses if s is None or s >= 500),
+            'client_errors': sum(1 for s in statuses if s is not None and 400 <= s < 500),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+        }
+    total = sum(r['count'] for r in routes.values())
+    lags.sort()
+    return {
+        'requests': total,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+        # How late requests were sent compared to the schedule; high values
+        # mean --concurrency is the bottleneck, not the server
+        'dispatch_lag_p95_ms': round(percentile(lags, 95) * 1000, 2) if lags else None,
+        'routes': routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('traces', nargs='+', help='Trace files (globs allowed).')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--speedup', type=float, default=1.0, help='Replay this many times faster; 0 means no pacing.')
+    parser.add_argument('--limit', type=int, default=None, help='Replay at most this many requests.')
+    parser.add_argument('--include-writes', action='store_true',
+                        help='Also replay updates, deletes and creations other than response submissions.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the report as JSON to this file.')
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.traces for p in glob.glob(pattern)})
+    records = [r for path in paths for r in load_traces(path)]
+    records.sort(key=lambda r: r['ts'])
+    if args.limit:
+        records = records[:args.limit]
+    data = LocalData(create_app())
+    requests, skipped = build_requests(records, data, args.include_writes, args.seed)
+    print(f"Replaying {len(requests)} of {len(records)} captured requests from {len(paths)} files "
+          f"against {args.base_url} (speed-up {args.speedup or 'unpaced'}, concurrency {args.concurrency})")
+
+    report = summarize(*replay(requests, args.base_url, args.concurrency, args.speedup))
+    report['skipped'] = dict(skipped)
+    print(f"\n{'route':<58} {'count':>6} {'err':>5} {'4xx':>5} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9}")
+    for key, r in report['routes'].items():
+        print(f"{key:<58} {r['count']:>6} {r['errors']:>5} {r['client_errors']:>5} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+    print(f"\n{report['requests']} requests in {report['elapsed_s']} s ({report['throughput_rps']} req/s), "
+          f"dispatch lag p95 {report['dispatch_lag_p95_ms']} ms")
+    if skipped:
+        print("Skipped: " + ', '.join(f'{k} ({n})' for k, n in sorted(skipped.items())))
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Production gunicorn profile for the Survey API.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is preloaded in the master so workers share its imported modules
+copy-on-write, then every worker opens its own MongoDB and Redis connections
+in ``post_fork``. All settings can be tuned from the environment; see the
+"Production server" section of the README for the measured savings.
+"""
+import gc
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers periodically to bound memory growth (0 disables)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None  # empty disables it
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+# Pool sizes are read by app.config.Config: MONGO_MAX_POOL_SIZE,
+# MONGO_MIN_POOL_SIZE and REDIS_MAX_CONNECTIONS (per worker process).
+
+# Workers write Prometheus samples here so /metrics aggregates all of them.
+# Must be set before prometheus_client is imported, i.e. before preloading.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'survey_api_metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to the new totals
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Move everything allocated while preloading into the permanent
+        # generation so the cyclic GC in workers doesn't write to (and copy)
+        # the shared pages.
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return  # the worker loads the app itself, after the fork
+    from app import reconnect
+    from wsgi import app
+    reconnect(app)
+    server.log.info("Worker %s reconnected MongoDB and Redis", worker.pid)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
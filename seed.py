@@ -27,8 +27,8 @@ def seed_test_data():
     """
     # Clear existing data in correct order to respect dependencies
     Response.objects.delete() # Responses refer to Surveys and Users
-    Survey.objects.delete()   # Surveys refer to Users (owner)
-    User.objects.delete()     # Users can now be safely deleted
+    Survey.all_objects.delete()   # Surveys refer to Users (owner), including soft-deleted ones
+    User.all_objects.delete()     # Users can now be safely deleted
 
     # Create test users
     admin = User(
@@ -146,4 +146,6 @@ if __name__ == '__main__':
         Survey.objects.delete()
         User.objects.delete()
         seed_test_data()
+        from app.utils.indexes import ensure_indexes
+        ensure_indexes()
         print("Test data seeded successfully.") 
\ No newline at end of file